@@ -6,7 +6,8 @@ app = Flask(__name__)
 DB_PATH = "bot_database.db"
 
 def get_paid_users():
-    conn = sqlite3.connect(DB_PATH)
+    # Только чтение: в режиме WAL не мешает боту писать
+    conn = sqlite3.connect(f"file:{DB_PATH}?mode=ro", uri=True, timeout=5)
     cursor = conn.cursor()
     
     cursor.execute("""
@@ -17,8 +18,8 @@ def get_paid_users():
             u.role,
             u.is_privileged,
             u.phone_1,
-            s.start_date,
-            s.end_date,
+            strftime('%Y-%m-%d %H:%M', s.start_date, 'unixepoch', 'localtime'),
+            strftime('%Y-%m-%d %H:%M', s.end_date, 'unixepoch', 'localtime'),
             s.is_active,
             s.role as subscription_role,
             CASE 
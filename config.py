@@ -20,6 +20,79 @@ class Config:
     CUSTOMER_SUBSCRIPTION_PRICE = 1
     CUSTOMER_SUBSCRIPTION_DAYS = 30
     
+    # База данных
+    DB_PATH = os.getenv('DB_PATH', 'bot_database.db')
+    
+    # Профиль PRAGMA, применяется к каждому соединению пула
+    DB_PRAGMAS = {
+        'journal_mode': os.getenv('DB_JOURNAL_MODE', 'WAL'),
+        'synchronous': os.getenv('DB_SYNCHRONOUS', 'NORMAL'),
+        'busy_timeout': int(os.getenv('DB_BUSY_TIMEOUT_MS', 5000)),
+        'cache_size': int(os.getenv('DB_CACHE_SIZE', -16000)),  # отрицательное значение - в КБ
+        'mmap_size': int(os.getenv('DB_MMAP_SIZE', 134217728)),
+        'temp_store': 'MEMORY',
+        # Выключено: рейтинги ссылаются на фиктивный application_id,
+        # а смена роли удаляет строку users при живых заявках и подписках
+        'foreign_keys': os.getenv('DB_FOREIGN_KEYS', 'OFF'),
+    }
+    
+    # Групповой коммит: окно сбора записей в одну транзакцию и размер пачки
+    DB_COMMIT_WINDOW_MS = int(os.getenv('DB_COMMIT_WINDOW_MS', 2))
+    DB_MAX_WRITE_BATCH = int(os.getenv('DB_MAX_WRITE_BATCH', 200))
+    
+    # Количество соединений только для чтения (снимки WAL)
+    DB_READ_POOL_SIZE = int(os.getenv('DB_READ_POOL_SIZE', 4))
+    
+    # Сколько секунд помнить, что активной подписки нет (записи сбрасывают кэш сразу)
+    DB_ENTITLEMENT_NEGATIVE_TTL = int(os.getenv('DB_ENTITLEMENT_NEGATIVE_TTL', 300))
+    
+    # LRU-кэш профилей пользователей: число записей и бюджет памяти в байтах
+    DB_USER_CACHE_SIZE = int(os.getenv('DB_USER_CACHE_SIZE', 10000))
+    DB_USER_CACHE_BYTES = int(os.getenv('DB_USER_CACHE_BYTES', 16 * 1024 * 1024))
+    
+    # Вызовы Database дольше порога пишутся в лог; перцентили - по последним замерам
+    DB_SLOW_QUERY_MS = int(os.getenv('DB_SLOW_QUERY_MS', 100))
+    DB_METRICS_SAMPLES = int(os.getenv('DB_METRICS_SAMPLES', 1000))
+    
+    # Архив заявок: отдельный файл БД (пустое значение выключает архивацию).
+    # Закрытые заявки переносятся через DB_ARCHIVE_AFTER_DAYS, любые - через DB_ARCHIVE_STALE_DAYS
+    DB_ARCHIVE_PATH = os.getenv('DB_ARCHIVE_PATH', 'bot_archive.db')
+    DB_ARCHIVE_AFTER_DAYS = int(os.getenv('DB_ARCHIVE_AFTER_DAYS', 90))
+    DB_ARCHIVE_STALE_DAYS = int(os.getenv('DB_ARCHIVE_STALE_DAYS', 180))
+    DB_ARCHIVE_BATCH_SIZE = int(os.getenv('DB_ARCHIVE_BATCH_SIZE', 500))
+    DB_ARCHIVE_INTERVAL = int(os.getenv('DB_ARCHIVE_INTERVAL', 3600))
+    
+    # Справочник районов и станций метро (пустое значение - без district_id)
+    DISTRICTS_PATH = os.getenv('DISTRICTS_PATH', os.path.join(os.path.dirname(__file__), 'database', 'districts.json'))
+    
+    # Личные уведомления о подходящих заявках: адресатов на заявку
+    MATCH_NOTIFY_LIMIT = int(os.getenv('MATCH_NOTIFY_LIMIT', 50))
+    
+    # Отправка исходящих сообщений из outbox: сообщений в секунду, размер пачки,
+    # число попыток и границы экспоненциальной задержки (секунды)
+    OUTBOX_SEND_RATE = float(os.getenv('OUTBOX_SEND_RATE', 20))
+    OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', 50))
+    OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', 8))
+    OUTBOX_BASE_DELAY = float(os.getenv('OUTBOX_BASE_DELAY', 5))
+    OUTBOX_MAX_DELAY = float(os.getenv('OUTBOX_MAX_DELAY', 3600))
+    
+    # Ограничение запросов к Telegram (RateGovernor): общий лимит бота в секунду,
+    # личный чат - в секунду и подряд, группа/канал - в минуту и подряд
+    TG_GLOBAL_RATE = float(os.getenv('TG_GLOBAL_RATE', 30))
+    TG_CHAT_RATE = float(os.getenv('TG_CHAT_RATE', 1))
+    TG_CHAT_BURST = float(os.getenv('TG_CHAT_BURST', 3))
+    TG_GROUP_RATE_PER_MIN = float(os.getenv('TG_GROUP_RATE_PER_MIN', 20))
+    TG_GROUP_BURST = float(os.getenv('TG_GROUP_BURST', 5))
+    # Токены общего лимита, которые фоновые отправки оставляют ответам пользователям
+    TG_INTERACTIVE_RESERVE = float(os.getenv('TG_INTERACTIVE_RESERVE', 5))
+    # RetryAfter не дольше этого числа секунд выжидается и запрос повторяется
+    TG_MAX_RETRY_WAIT = float(os.getenv('TG_MAX_RETRY_WAIT', 10))
+    
+    # Рассылки администратора: сообщений в секунду и получателей в пачке
+    # (после каждой пачки ход рассылки сохраняется в БД)
+    BROADCAST_RATE = float(os.getenv('BROADCAST_RATE', 20))
+    BROADCAST_BATCH_SIZE = int(os.getenv('BROADCAST_BATCH_SIZE', 100))
+    
     # Лимиты
     MAX_APPLICATIONS_PER_MODEL = 1
     MAX_RESPONSES_MULTIPLIER = 2
@@ -0,0 +1,156 @@
+import sys
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Callable, List, Mapping, Tuple
+
+class EntitlementCache:
+    """Кэш активных подписок по (user_id, role).
+
+    Найденная подписка живет в кэше ровно до своего end_date (секунды Unix), отсутствие
+    подписки - negative_ttl секунд. Все записи в subscriptions идут через
+    Database и сбрасывают кэш, поэтому TTL отрицательных записей - лишь
+    страховка от изменений в обход бота.
+
+    Чтение из БД и запись результата в кэш не атомарны: между ними
+    писатель может закоммитить изменение и сбросить кэш. Поэтому put()
+    принимает версию, снятую до запроса, и игнорирует устаревший результат.
+    """
+
+    def __init__(self, negative_ttl: float = 300.0):
+        self.negative_ttl = negative_ttl
+        self._entries: Dict[Tuple[int, str], Tuple[Optional[Mapping[str, Any]], Optional[int], float]] = {}
+        self._version = 0
+
+    @property
+    def version(self) -> int:
+        """Версия кэша: растет при каждом сбросе"""
+        return self._version
+
+    def get(self, user_id: int, role: str) -> Tuple[bool, Optional[Mapping[str, Any]], Optional[int]]:
+        """(есть ли запись в кэше, подписка или None, дата окончания или None)"""
+        key = (user_id, role)
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None, None
+
+        subscription, end_date, expires_at = entry
+        if subscription is None:
+            if time.monotonic() < expires_at:
+                return True, None, None
+        elif time.time() < end_date:
+            return True, subscription, end_date
+
+        del self._entries[key]
+        return False, None, None
+
+    def put(self, user_id: int, role: str, subscription: Optional[Mapping[str, Any]], version: int):
+        """Сохранить результат запроса, сделанного при версии version"""
+        if version != self._version:
+            return
+
+        if subscription is None:
+            self._entries[(user_id, role)] = (None, None, time.monotonic() + self.negative_ttl)
+        else:
+            self._entries[(user_id, role)] = (subscription, subscription['end_date'], 0.0)
+
+    def invalidate(self, user_id: Optional[int] = None, role: Optional[str] = None):
+        """Сбросить записи пользователя (всех ролей, если role не указана) или весь кэш"""
+        self._version += 1
+        if user_id is None:
+            self._entries.clear()
+        elif role is not None:
+            self._entries.pop((user_id, role), None)
+        else:
+            for key in [key for key in self._entries if key[0] == user_id]:
+                del self._entries[key]
+
+class LRUCache:
+    """LRU-кэш строк БД с ограничением по числу записей и по памяти.
+
+    Хранит неизменяемые записи (database.models.Record) без копирования.
+    Размер записи оценивается через sys.getsizeof записи и ее значений -
+    этого достаточно, чтобы кэш не рос бесконтрольно на длинных анкетах.
+    Как и EntitlementCache, put() принимает версию, снятую до запроса.
+    Подписчики (subscribe) узнают о каждом сбросе - так производные
+    структуры в памяти следят за изменениями строк без опроса БД.
+    """
+
+    def __init__(self, max_entries: int = 10000, max_bytes: int = 16 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Any, Tuple[Mapping[str, Any], int]]" = OrderedDict()
+        self._bytes = 0
+        self._version = 0
+        self.hits = 0
+        self.misses = 0
+        self._listeners: List[Callable[[Tuple[Any, ...]], None]] = []
+
+    @property
+    def version(self) -> int:
+        """Версия кэша: растет при каждом сбросе"""
+        return self._version
+
+    @staticmethod
+    def _sizeof(row: Mapping[str, Any]) -> int:
+        values = row.values()
+        return sys.getsizeof(row) + sys.getsizeof(values) + sum(sys.getsizeof(value) for value in values)
+
+    def get(self, key: Any) -> Optional[Mapping[str, Any]]:
+        """Строка или None, если ее нет в кэше"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key: Any, row: Mapping[str, Any], version: int):
+        """Сохранить строку, прочитанную при версии version"""
+        if version != self._version or self.max_entries <= 0:
+            return
+
+        size = self._sizeof(row)
+        if size > self.max_bytes:
+            return
+
+        self._discard(key)
+        self._entries[key] = (row, size)
+        self._bytes += size
+
+        # Вытесняем самые давно использованные записи
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self._bytes -= evicted
+
+    def _discard(self, key: Any):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+
+    def invalidate(self, *keys: Any):
+        """Сбросить записи по ключам (без ключей - весь кэш)"""
+        self._version += 1
+        if not keys:
+            self._entries.clear()
+            self._bytes = 0
+        for key in keys:
+            self._discard(key)
+        for listener in self._listeners:
+            listener(keys)
+
+    def subscribe(self, listener: Callable[[Tuple[Any, ...]], None]):
+        """Вызывать listener(ключи) при каждом сбросе (пустой кортеж - сброшено все)"""
+        self._listeners.append(listener)
+
+    def stats(self) -> Dict[str, Any]:
+        """Счетчики кэша"""
+        total = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'bytes': self._bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 3) if total else 0.0,
+        }
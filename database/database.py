@@ -1,203 +1,528 @@
+import asyncio
+import re
+import time
 import aiosqlite
-from typing import Optional, List, Dict, Any
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Optional, List, Dict, Any, AsyncIterator, Awaitable, Callable, Iterable, Iterator, Tuple
 from datetime import datetime
 
+from database.cache import EntitlementCache, LRUCache
+from database.districts import DistrictDirectory
+from database.metrics import QueryMetrics, instrument, record_wait, current_wait
+from database.migrations import ARCHIVE_GROUPS, ARCHIVE_TABLES, migrate, prepare_archive, rating_score
+from database.models import (
+    ResponseOutcome, Record, User, Application, ModelApplication, Response, CustomerResponse, Subscription,
+    OutboxMessage, OutboxEntry, Broadcast
+)
+from database.statements import StatementRegistry
+
+# Карта идентичности текущего апдейта: (таблица, ключ) -> строка или None.
+# Устанавливается IdentityMapMiddleware на время обработки одного апдейта
+_identity_map: ContextVar[Optional[Dict[tuple, Any]]] = ContextVar('identity_map', default=None)
+
+# Сообщения, которые зависят от id только что созданной строки (заявки, отклика)
+MessageFactory = Callable[[int], Iterable[OutboxMessage]]
+
+# Таблицы, в которые отправитель outbox записывает message_id
+OUTBOX_REF_TABLES = ('applications', 'model_applications')
+
+# Дописать категорию в users.categories, если ее там еще нет
+_ADD_USER_CATEGORY = """
+    UPDATE users SET categories = COALESCE(categories || ',', '') || :category
+    WHERE user_id = :user_id AND :category IS NOT NULL
+      AND ',' || COALESCE(categories, '') || ',' NOT LIKE '%,' || :category || ',%'
+"""
+
+@instrument
 class Database:
-    def __init__(self, db_path: str = "bot_database.db"):
+    def __init__(self, db_path: str = "bot_database.db", pool_size: int = 4,
+                 pragmas: Optional[Dict[str, Any]] = None,
+                 commit_window: float = 0.002, max_batch: int = 200,
+                 entitlement_ttl: float = 300.0,
+                 user_cache_size: int = 10000, user_cache_bytes: int = 16 * 1024 * 1024,
+                 slow_query_threshold: float = 0.1, metrics_samples: int = 1000,
+                 archive_path: Optional[str] = None, districts_path: Optional[str] = None):
         self.db_path = db_path
-    
+        self.pool_size = pool_size
+        self.pragmas = dict(pragmas or {})
+
+        # Пул соединений: одно соединение на запись и pool_size на чтение
+        self._writer: Optional[aiosqlite.Connection] = None
+        self._open_lock = asyncio.Lock()
+        self._readers: Optional[asyncio.Queue] = None
+        self._connections: List[aiosqlite.Connection] = []
+
+        # Групповой коммит: все записи идут через одну задачу-писателя,
+        # которая собирает задания за commit_window секунд в одну транзакцию
+        self.commit_window = commit_window
+        self.max_batch = max_batch
+        self._write_queue: Optional[asyncio.Queue] = None
+        self._writer_task: Optional[asyncio.Task] = None
+
+        # Кэш текста динамических INSERT/UPDATE и белый список колонок
+        self.statements = StatementRegistry()
+
+        # Кэш активных подписок: проверки в меню обходятся без запросов к БД
+        self.entitlements = EntitlementCache(negative_ttl=entitlement_ttl)
+
+        # Сигнал для задачи истечения подписок: появилась новая подписка,
+        # ближайший срок окончания мог сдвинуться
+        self.subscriptions_changed = asyncio.Event()
+
+        # Сигнал для отправителя outbox: закоммичены новые сообщения
+        self.outbox_changed = asyncio.Event()
+
+        # LRU строк users: профили читаются на каждый отклик, а меняются редко
+        self.user_cache = LRUCache(max_entries=user_cache_size, max_bytes=user_cache_bytes)
+
+        # Время каждого публичного метода (см. @instrument) и журнал медленных вызовов
+        self.metrics = QueryMetrics(slow_threshold=slow_query_threshold, samples=metrics_samples)
+
+        # Файл архива закрытых заявок (схема archive); None - архив выключен
+        self.archive_path = archive_path
+        self._history_sources: Dict[str, str] = {}
+
+        # Справочник районов: свободный текст district -> district_id.
+        # Без файла справочника district_id не заполняется
+        self.districts_path = districts_path
+        self.districts: Optional[DistrictDirectory] = None
+
+    # ============== ПУЛ СОЕДИНЕНИЙ ==============
+
+    async def _connect(self, read_only: bool = False) -> aiosqlite.Connection:
+        """Открыть новое соединение с БД"""
+        # Транзакциями управляем явно (писатель и снимки чтения), поэтому autocommit.
+        # Стабильный текст запросов из StatementRegistry переиспользует
+        # подготовленные выражения из кэша cached_statements
+        if read_only:
+            conn = await aiosqlite.connect(
+                f"file:{self.db_path}?mode=ro", uri=True,
+                isolation_level=None, cached_statements=256
+            )
+        else:
+            conn = await aiosqlite.connect(self.db_path, isolation_level=None, cached_statements=256)
+        conn.row_factory = aiosqlite.Row
+        self._connections.append(conn)
+
+        # journal_mode применяем первым, независимо от порядка в настройках:
+        # он меняет режим всего файла БД, и это делает только писатель
+        pragmas = dict(self.pragmas)
+        journal_mode = pragmas.pop('journal_mode', None)
+        if journal_mode is not None and not read_only:
+            async with conn.execute(f"PRAGMA journal_mode = {journal_mode}"):
+                pass
+        for name, value in pragmas.items():
+            await conn.execute(f"PRAGMA {name} = {value}")
+
+        if self.archive_path:
+            # Файл архива создает писатель, он открывается первым
+            if read_only:
+                await conn.execute("ATTACH DATABASE ? AS archive", (f"file:{self.archive_path}?mode=ro",))
+            else:
+                await conn.execute("ATTACH DATABASE ? AS archive", (self.archive_path,))
+                for name in ('journal_mode', 'synchronous'):
+                    if name in self.pragmas:
+                        # Курсор закрываем сразу: незавершенный PRAGMA держит архив
+                        # открытым на запись, и читатели не могут его подключить
+                        async with conn.execute(f"PRAGMA archive.{name} = {self.pragmas[name]}"):
+                            pass
+
+        if read_only:
+            await conn.execute("PRAGMA query_only = 1")
+        return conn
+
+    async def get_pragma_report(self) -> Dict[str, Any]:
+        """Фактические значения PRAGMA на соединении записи"""
+        report = {}
+        async with self.write() as db:
+            for name in self.pragmas:
+                async with db.execute(f"PRAGMA {name}") as cursor:
+                    row = await cursor.fetchone()
+                    report[name] = row[0] if row else None
+        return report
+
+    async def open(self):
+        """Открыть пул соединений"""
+        async with self._open_lock:
+            if self._writer is not None:
+                return
+
+            # Писатель открывается первым: создает файл БД и включает WAL,
+            # после чего читатели видят согласованные снимки без блокировок
+            self._writer = await self._connect()
+            readers = asyncio.Queue()
+            for _ in range(self.pool_size):
+                readers.put_nowait(await self._connect(read_only=True))
+            self._readers = readers
+
+    async def close(self):
+        """Дописать очередь записи и закрыть все соединения пула"""
+        if self._writer_task is not None:
+            self._write_queue.put_nowait(None)
+            await self._writer_task
+            self._writer_task = None
+            self._write_queue = None
+
+        for conn in self._connections:
+            await conn.close()
+
+        self._connections.clear()
+        self._writer = None
+        self._readers = None
+
+    @asynccontextmanager
+    async def read(self, snapshot: bool = False) -> AsyncIterator[aiosqlite.Connection]:
+        """Соединение только для чтения из пула.
+
+        snapshot=True открывает транзакцию чтения: все запросы внутри блока
+        видят один и тот же снимок WAL, даже если писатель успел закоммитить.
+        Без journal_mode=WAL открытый снимок блокирует COMMIT писателя.
+        """
+        if self._readers is None:
+            await self.open()
+
+        started = time.perf_counter()
+        conn = await self._readers.get()
+        record_wait(time.perf_counter() - started)
+        try:
+            if snapshot:
+                await conn.execute("BEGIN")
+                try:
+                    yield conn
+                finally:
+                    await conn.execute("COMMIT")
+            else:
+                yield conn
+        finally:
+            self._readers.put_nowait(conn)
+
+    # ============== КАРТА ИДЕНТИЧНОСТИ ==============
+
+    @contextmanager
+    def identity_map(self) -> Iterator[Dict[tuple, Any]]:
+        """Карта идентичности на время одного апдейта.
+
+        Внутри блока get_user / get_application / get_model_application /
+        get_response читают каждую строку из БД не больше одного раза.
+        Любая запись из этого же апдейта очищает карту.
+        """
+        token = _identity_map.set({})
+        try:
+            yield _identity_map.get()
+        finally:
+            _identity_map.reset(token)
+
+    async def _get_row(self, table: str, key: str, value: Any, record: type = Record,
+                       cache: Optional[LRUCache] = None) -> Optional[Record]:
+        """Строка по ключу с учетом карты идентичности, кэша таблицы и архива.
+
+        Записи неизменяемы, поэтому карта и кэш отдают их без копирования.
+        """
+        identity = _identity_map.get()
+        if identity is not None and (table, value) in identity:
+            return identity[(table, value)]
+
+        row = cache.get(value) if cache is not None else None
+        if row is None:
+            version = cache.version if cache is not None else None
+            # Архивные строки ищем, только если в основной таблице строки нет
+            sources = [table]
+            if self.archive_path and table in ARCHIVE_TABLES:
+                sources.append(f"archive.{table}")
+
+            async with self.read() as db:
+                for source in sources:
+                    async with db.execute(f"SELECT * FROM {source} WHERE {key} = ?", (value,)) as cursor:
+                        cursor.row_factory = record.row_factory
+                        row = await cursor.fetchone()
+                    if row is not None:
+                        break
+            if cache is not None and row is not None:
+                cache.put(value, row, version)
+
+        if identity is not None:
+            identity[(table, value)] = row
+        return row
+
+    # ============== ЗАПИСЬ (ГРУППОВОЙ КОММИТ) ==============
+
+    async def _submit(self, job: Callable[[aiosqlite.Connection], Awaitable[Any]]) -> Any:
+        """Поставить задание в очередь писателя и дождаться коммита.
+
+        Задание - корутина, получающая соединение записи. Она выполняется
+        внутри общей транзакции пачки под своим SAVEPOINT: ошибка задания
+        откатывает только его, результат возвращается после COMMIT.
+        """
+        if self._writer is None:
+            await self.open()
+
+        if self._writer_task is None:
+            self._write_queue = asyncio.Queue()
+            self._writer_task = asyncio.create_task(self._writer_loop())
+
+        # Время в очереди писателя - ожидание соединения для метрик вызова
+        wait = current_wait()
+        queued = time.perf_counter()
+
+        async def timed_job(db: aiosqlite.Connection) -> Any:
+            record_wait(time.perf_counter() - queued, wait)
+            return await job(db)
+
+        future = asyncio.get_running_loop().create_future()
+        self._write_queue.put_nowait([timed_job, future, None])
+        try:
+            return await future
+        finally:
+            # Запись (в том числе через триггеры) могла изменить любые строки
+            identity = _identity_map.get()
+            if identity:
+                identity.clear()
+
+    async def _execute_write(self, sql: str, params: Iterable[Any] = ()) -> int:
+        """Выполнить один запрос записи, вернуть lastrowid"""
+        async def job(db: aiosqlite.Connection) -> int:
+            cursor = await db.execute(sql, params)
+            return cursor.lastrowid
+
+        return await self._submit(job)
+
+    @asynccontextmanager
+    async def write(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Соединение записи для нескольких запросов одним заданием.
+
+        Блок выполняется задачей-писателем под своим SAVEPOINT и
+        коммитится вместе с пачкой; исключение в блоке откатывает только его.
+        """
+        loop = asyncio.get_running_loop()
+        entered = loop.create_future()
+        finished = loop.create_future()
+
+        async def job(db: aiosqlite.Connection):
+            entered.set_result(db)
+            # Писатель ждет, пока вызывающий код выйдет из блока
+            await finished
+
+        submitted = asyncio.ensure_future(self._submit(job))
+        try:
+            await asyncio.wait([entered, submitted], return_when=asyncio.FIRST_COMPLETED)
+            if not entered.done():
+                # Задание не началось - отдаем ошибку писателя
+                await submitted
+            yield entered.result()
+        except BaseException as e:
+            # Откатываем SAVEPOINT задания и не держим писателя
+            if not finished.done():
+                finished.set_exception(e if isinstance(e, Exception) else RuntimeError("Запись прервана"))
+            try:
+                await submitted
+            except BaseException:
+                pass
+            raise
+        else:
+            finished.set_result(None)
+            await submitted
+
+    async def _writer_loop(self):
+        """Единственный писатель: пачки заданий, один COMMIT на пачку"""
+        db = self._writer
+        queue = self._write_queue
+        running = True
+
+        while running:
+            item = await queue.get()
+            if item is None:
+                break
+
+            batch = []
+            try:
+                await db.execute("BEGIN IMMEDIATE")
+                waited = False
+
+                while True:
+                    batch.append(item)
+                    await self._run_write_job(db, item)
+                    if len(batch) >= self.max_batch:
+                        break
+
+                    if queue.empty() and not waited and self.commit_window > 0:
+                        # Окно группового коммита: даем параллельным
+                        # обработчикам добавить свои записи в эту же транзакцию
+                        waited = True
+                        await asyncio.sleep(self.commit_window)
+                    if queue.empty():
+                        break
+
+                    item = queue.get_nowait()
+                    if item is None:
+                        running = False
+                        break
+
+                await db.execute("COMMIT")
+            except Exception as e:
+                if db.in_transaction:
+                    await db.execute("ROLLBACK")
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                if not batch and not item[1].done():
+                    item[1].set_exception(e)
+                continue
+
+            # Результаты отдаем только после COMMIT
+            for _, future, outcome in batch:
+                if future.done():
+                    continue
+                if isinstance(outcome, Exception):
+                    future.set_exception(outcome)
+                else:
+                    future.set_result(outcome)
+
+    async def _run_write_job(self, db: aiosqlite.Connection, item: list):
+        """Выполнить одно задание пачки под своим SAVEPOINT"""
+        job = item[0]
+
+        await db.execute("SAVEPOINT write_job")
+        try:
+            item[2] = await job(db)
+        except Exception as e:
+            await db.execute("ROLLBACK TO write_job")
+            await db.execute("RELEASE write_job")
+            item[2] = e
+        else:
+            await db.execute("RELEASE write_job")
+
     async def init_db(self):
         """Инициализация базы данных"""
-        async with aiosqlite.connect(self.db_path) as db:
-            # Таблица пользователей
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                    user_id INTEGER PRIMARY KEY,
-                    username TEXT,
-                    role TEXT NOT NULL,
-                    full_name TEXT,
-                    city TEXT,
-                    district TEXT,
-                    phone_1 TEXT,
-                    phone_2 TEXT,
-                    activity_type TEXT,
-                    address TEXT,
-                    photo_id TEXT,
-                    age INTEGER,
-                    height INTEGER,
-                    skin_type TEXT,
-                    contraindications TEXT,
-                    available_days TEXT,
-                    experience TEXT,
-                    photo_video_agree BOOLEAN,
-                    portfolio_ids TEXT,
-                    is_privileged BOOLEAN DEFAULT 0,
-                    rating REAL DEFAULT 0.0,
-                    registration_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    is_blocked BOOLEAN DEFAULT 0,
-                    gdpr_consent BOOLEAN DEFAULT 0
-                )
-            """)
-            
-            # Таблица заявок заказчиков
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS applications (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    customer_id INTEGER NOT NULL,
-                    category TEXT NOT NULL,
-                    subcategory TEXT NOT NULL,
-                    city TEXT NOT NULL,
-                    district TEXT NOT NULL,
-                    date TEXT NOT NULL,
-                    time TEXT NOT NULL,
-                    duration TEXT NOT NULL,
-                    requirements TEXT,
-                    models_needed INTEGER NOT NULL,
-                    experience_required BOOLEAN,
-                    viewers_count INTEGER,
-                    photo_video TEXT,
-                    materials_payment TEXT,
-                    participation_type TEXT NOT NULL,
-                    payment_amount TEXT,
-                    dress_code TEXT,
-                    comment TEXT,
-                    message_id INTEGER,
-                    is_closed BOOLEAN DEFAULT 0,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (customer_id) REFERENCES users(user_id)
-                )
-            """)
-            
-            # Таблица заявок моделей
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS model_applications (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    model_id INTEGER NOT NULL,
-                    date TEXT NOT NULL,
-                    district TEXT NOT NULL,
-                    category TEXT NOT NULL,
-                    zones TEXT NOT NULL,
-                    time_range TEXT NOT NULL,
-                    photo_video TEXT,
-                    participation_type TEXT NOT NULL,
-                    note TEXT,
-                    message_id INTEGER,
-                    is_closed BOOLEAN DEFAULT 0,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (model_id) REFERENCES users(user_id)
-                )
-            """)
-            
-            # Таблица откликов моделей на заявки заказчиков
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS responses (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    application_id INTEGER NOT NULL,
-                    model_id INTEGER NOT NULL,
-                    status TEXT DEFAULT 'pending',
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (application_id) REFERENCES applications(id),
-                    FOREIGN KEY (model_id) REFERENCES users(user_id)
-                )
-            """)
-            
-            # Таблица откликов заказчиков на заявки моделей
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS customer_responses (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    model_application_id INTEGER NOT NULL,
-                    customer_id INTEGER NOT NULL,
-                    status TEXT DEFAULT 'pending',
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (model_application_id) REFERENCES model_applications(id),
-                    FOREIGN KEY (customer_id) REFERENCES users(user_id)
-                )
-            """)
-            
-            # Таблица рейтингов
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS ratings (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    application_id INTEGER NOT NULL,
-                    rater_id INTEGER NOT NULL,
-                    rated_id INTEGER NOT NULL,
-                    came BOOLEAN,
-                    prepared BOOLEAN,
-                    requirements_met BOOLEAN,
-                    work_again BOOLEAN,
-                    location_convenient BOOLEAN,
-                    conditions_met BOOLEAN,
-                    attitude_correct BOOLEAN,
-                    cooperate_again BOOLEAN,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (application_id) REFERENCES applications(id),
-                    FOREIGN KEY (rater_id) REFERENCES users(user_id),
-                    FOREIGN KEY (rated_id) REFERENCES users(user_id)
-                )
-            """)
+        await self.open()
 
-            # Таблица подписок
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS subscriptions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    start_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    end_date TIMESTAMP NOT NULL,
-                    is_active BOOLEAN DEFAULT 1,
-                    payment_id TEXT,
-                    FOREIGN KEY (user_id) REFERENCES users(user_id)
-                )
-            """)
-            await db.commit()
+        # Миграции управляют транзакциями сами, поэтому идут до запуска писателя
+        await migrate(self._writer)
+        if self.archive_path:
+            await prepare_archive(self._writer)
+        await self.statements.load(self._writer)
+
+        if self.districts_path:
+            self.districts = DistrictDirectory.load(self.districts_path)
+            await self._load_districts()
+
+        # Источники для чтения истории: основная таблица вместе с архивом.
+        # Явный список столбцов - порядок столбцов в архиве может отличаться
+        for table in ARCHIVE_TABLES:
+            columns = ', '.join(sorted(self.statements.columns(table)))
+            self._history_sources[table] = (
+                f"(SELECT {columns} FROM main.{table} UNION ALL SELECT {columns} FROM archive.{table})"
+                if self.archive_path else table
+            )
+
+    async def _load_districts(self):
+        """Записать справочник районов в таблицу districts, если файл изменился"""
+        async with self._writer.execute(
+            "SELECT checksum FROM data_versions WHERE name = 'districts'"
+        ) as cursor:
+            row = await cursor.fetchone()
+        if row is not None and row[0] == self.districts.checksum:
+            return
+
+        await self._writer.execute("BEGIN")
+        try:
+            # UPSERT меняет строку на месте, не удаляя ее, как REPLACE
+            await self._writer.executemany("""
+                INSERT INTO districts (id, city, name) VALUES (?, ?, ?)
+                ON CONFLICT (id) DO UPDATE SET city = excluded.city, name = excluded.name
+            """, self.districts.rows())
+            await self._writer.execute("""
+                INSERT INTO data_versions (name, checksum, loaded_at) VALUES ('districts', ?, ?)
+                ON CONFLICT (name) DO UPDATE SET checksum = excluded.checksum, loaded_at = excluded.loaded_at
+            """, (self.districts.checksum, int(time.time())))
+            await self._writer.commit()
+        except Exception:
+            await self._writer.rollback()
+            raise
+
+    def _history(self, table: str) -> str:
+        """Источник строк таблицы для экранов истории: с архивом, если он включен"""
+        return self._history_sources.get(table, table)
+
+    def _with_district_id(self, values: Dict[str, Any], city: Optional[str] = None) -> Dict[str, Any]:
+        """Добавить district_id к изменениям, если среди них есть district"""
+        if self.districts is None or 'district' not in values or 'district_id' in values:
+            return values
+        return dict(values, district_id=self.districts.resolve(values['district'], values.get('city', city)))
     
     # ============== USERS ==============
     
-    async def migrate_subscriptions_add_role(self):
-        """Добавить поле role в таблицу subscriptions"""
-        async with aiosqlite.connect(self.db_path) as db:
-            # Проверяем есть ли уже колонка role
-            async with db.execute("PRAGMA table_info(subscriptions)") as cursor:
-                columns = await cursor.fetchall()
-                column_names = [col[1] for col in columns]
-                
-                if 'role' not in column_names:
-                    # Добавляем колонку role
-                    await db.execute("ALTER TABLE subscriptions ADD COLUMN role TEXT DEFAULT 'model'")
-                    await db.commit()
-                    print("✅ Добавлена колонка role в таблицу subscriptions")
-
     async def add_user(self, user_id: int, username: str, role: str):
         """Добавить пользователя"""
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute(
-                "INSERT OR IGNORE INTO users (user_id, username, role) VALUES (?, ?, ?)",
-                (user_id, username, role)
-            )
-            await db.commit()
+        # Оценки переживают смену роли (удаление строки users),
+        # поэтому агрегаты рейтинга восстанавливаются из ratings
+        await self._execute_write(f"""
+            INSERT OR IGNORE INTO users (user_id, username, role, rating_sum, rating_count, rating)
+            SELECT ?, ?, ?, COALESCE(SUM(score), 0), COUNT(score), COALESCE(ROUND(AVG(score), 1), 0.0)
+            FROM (SELECT {rating_score()} AS score FROM ratings WHERE rated_id = ?)
+        """, (user_id, username, role, user_id))
+        self.user_cache.invalidate(user_id)
     
-    async def get_user(self, user_id: int) -> Optional[Dict[str, Any]]:
+    async def get_user(self, user_id: int) -> Optional[User]:
         """Получить пользователя"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            async with db.execute("SELECT * FROM users WHERE user_id = ?", (user_id,)) as cursor:
-                row = await cursor.fetchone()
-                return dict(row) if row else None
+        return await self._get_row("users", "user_id", user_id, User, cache=self.user_cache)
+    
+    async def get_users_by_ids(self, user_ids: Iterable[int]) -> Dict[int, User]:
+        """Получить пользователей одним запросом: {user_id: пользователь}"""
+        users = {}
+        ids = []
+        for user_id in dict.fromkeys(user_ids):
+            cached = self.user_cache.get(user_id)
+            if cached is not None:
+                users[user_id] = cached
+            else:
+                ids.append(user_id)
+        if not ids:
+            return users
+
+        version = self.user_cache.version
+        async with self.read() as db:
+            # Держимся ниже лимита параметров SQLite на один запрос
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                placeholders = ', '.join(['?'] * len(chunk))
+                async with db.execute(
+                    f"SELECT * FROM users WHERE user_id IN ({placeholders})", chunk
+                ) as cursor:
+                    cursor.row_factory = User.row_factory
+                    for row in await cursor.fetchall():
+                        users[row['user_id']] = row
+                        self.user_cache.put(row['user_id'], users[row['user_id']], version)
+        return users
     
     async def update_user(self, user_id: int, **kwargs):
         """Обновить данные пользователя"""
-        fields = ", ".join([f"{key} = ?" for key in kwargs.keys()])
-        values = list(kwargs.values()) + [user_id]
+        sql, values = self.statements.update("users", "user_id", user_id, self._with_district_id(kwargs))
         
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute(
-                f"UPDATE users SET {fields} WHERE user_id = ?",
-                values
-            )
-            await db.commit()
+        await self._execute_write(sql, values)
+        self.user_cache.invalidate(user_id)
+    
+    async def _add_user_category(self, db: aiosqlite.Connection, user_id: int, category: Optional[str]) -> bool:
+        """Дописать категорию пользователю в задании писателя, True - если добавлена"""
+        cursor = await db.execute(_ADD_USER_CATEGORY, {'user_id': user_id, 'category': category})
+        return cursor.rowcount > 0
+    
+    async def get_match_profiles(self) -> List[User]:
+        """Профили для индекса подбора: незаблокированные модели и заказчики с известным районом"""
+        async with self.read() as db:
+            async with db.execute("""
+                SELECT user_id, role, district_id, categories, activity_type, available_days, rating,
+                       is_privileged, is_blocked, bot_blocked
+                FROM users
+                WHERE role IN ('model', 'customer') AND district_id > 0 AND is_blocked = 0 AND bot_blocked = 0
+            """) as cursor:
+                cursor.row_factory = User.row_factory
+                rows = await cursor.fetchall()
+                return rows
     
     async def get_user_role(self, user_id: int) -> Optional[str]:
         """Получить роль пользователя"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.read() as db:
             async with db.execute("SELECT role FROM users WHERE user_id = ?", (user_id,)) as cursor:
                 row = await cursor.fetchone()
                 return row[0] if row else None
@@ -216,137 +541,283 @@ class Database:
     
     # ============== APPLICATIONS ==============
     
-    async def create_application(self, customer_id: int, **kwargs) -> int:
-        """Создать заявку заказчика"""
-        fields = ", ".join(["customer_id"] + list(kwargs.keys()))
-        placeholders = ", ".join(["?"] * (len(kwargs) + 1))
-        values = [customer_id] + list(kwargs.values())
+    async def create_application(self, customer_id: int, messages: Optional[MessageFactory] = None, **kwargs) -> int:
+        """Создать заявку заказчика.
+
+        messages(id заявки) - сообщения, которые попадут в outbox
+        в той же транзакции (публикация в канале).
+        """
+        sql, values = self.statements.insert("applications", self._with_district_id(dict(kwargs, customer_id=customer_id)))
         
-        async with aiosqlite.connect(self.db_path) as db:
-            cursor = await db.execute(
-                f"INSERT INTO applications ({fields}) VALUES ({placeholders})",
-                values
-            )
-            await db.commit()
-            return cursor.lastrowid
+        async with self.write() as db:
+            cursor = await db.execute(sql, values)
+            changed = await self._add_user_category(db, customer_id, kwargs.get('category'))
+            app_id = cursor.lastrowid
+            if messages:
+                await self._enqueue(db, messages(app_id))
+        
+        if changed:
+            self.user_cache.invalidate(customer_id)
+        if messages:
+            self.outbox_changed.set()
+        return app_id
     
-    async def get_application(self, app_id: int) -> Optional[Dict[str, Any]]:
+    async def get_application(self, app_id: int) -> Optional[Application]:
         """Получить заявку"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            async with db.execute("SELECT * FROM applications WHERE id = ?", (app_id,)) as cursor:
-                row = await cursor.fetchone()
-                return dict(row) if row else None
+        return await self._get_row("applications", "id", app_id, Application)
     
     async def update_application(self, app_id: int, **kwargs):
         """Обновить заявку"""
-        fields = ", ".join([f"{key} = ?" for key in kwargs.keys()])
-        values = list(kwargs.values()) + [app_id]
+        sql, values = self.statements.update("applications", "id", app_id, self._with_district_id(kwargs))
         
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute(
-                f"UPDATE applications SET {fields} WHERE id = ?",
-                values
-            )
-            await db.commit()
+        await self._execute_write(sql, values)
     
-    async def get_customer_applications(self, customer_id: int) -> List[Dict[str, Any]]:
+    async def get_customer_applications(self, customer_id: int) -> List[Application]:
         """Получить все заявки заказчика"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self.read() as db:
             async with db.execute(
-                "SELECT * FROM applications WHERE customer_id = ? ORDER BY created_at DESC",
+                f"SELECT * FROM {self._history('applications')} WHERE customer_id = ? ORDER BY created_at DESC",
                 (customer_id,)
             ) as cursor:
+                cursor.row_factory = Application.row_factory
                 rows = await cursor.fetchall()
-                return [dict(row) for row in rows]
+                return rows
     
     async def close_application(self, app_id: int):
         """Закрыть набор на заявку"""
         await self.update_application(app_id, is_closed=True)
     
-    async def get_all_active_applications(self) -> List[Dict[str, Any]]:
+    async def get_all_active_applications(self) -> List[Application]:
         """Получить все активные заявки"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self.read() as db:
             async with db.execute(
                 "SELECT * FROM applications WHERE is_closed = 0 ORDER BY created_at DESC"
             ) as cursor:
+                cursor.row_factory = Application.row_factory
                 rows = await cursor.fetchall()
-                return [dict(row) for row in rows]
+                return rows
             
-    async def get_active_applications_by_category(self, category: str) -> List[Dict[str, Any]]:
+    async def get_active_applications_by_category(self, category: str) -> List[Application]:
         """Получить активные заявки по категории"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self.read() as db:
             async with db.execute(
                 "SELECT * FROM applications WHERE is_closed = 0 AND category = ? ORDER BY created_at DESC",
                 (category,)
             ) as cursor:
+                cursor.row_factory = Application.row_factory
                 rows = await cursor.fetchall()
-                return [dict(row) for row in rows]
+                return rows
+    
+    async def count_active_applications_by_category(self, category: str) -> int:
+        """Подсчитать активные заявки категории"""
+        async with self.read() as db:
+            async with db.execute(
+                "SELECT COUNT(*) FROM applications WHERE is_closed = 0 AND category = ?",
+                (category,)
+            ) as cursor:
+                row = await cursor.fetchone()
+                return row[0] if row else 0
+    
+    async def get_adjacent_active_application(self, category: str, app_id: Optional[int] = None,
+                                              direction: str = "next") -> Optional[Application]:
+        """Соседняя активная заявка категории относительно курсора app_id.
+
+        Заявки упорядочены от новых к старым по (created_at, id):
+        "next" - следующая (более старая), "prev" - предыдущая (более новая).
+        Без курсора возвращает первую ("next") или последнюю ("prev") заявку.
+        Курсором служит сама заявка, поэтому закрытие или добавление заявок
+        не сдвигает навигацию.
+        """
+        if direction == "next":
+            condition, order = "(a.created_at, a.id) < (c.created_at, c.id)", "DESC"
+        elif direction == "prev":
+            condition, order = "(a.created_at, a.id) > (c.created_at, c.id)", "ASC"
+        else:
+            raise ValueError(f"Неизвестное направление: {direction}")
+
+        if app_id is None:
+            sql = f"""
+                SELECT a.* FROM applications a
+                WHERE a.is_closed = 0 AND a.category = ?
+                ORDER BY a.created_at {order}, a.id {order}
+                LIMIT 1
+            """
+            params = (category,)
+        else:
+            sql = f"""
+                SELECT a.* FROM applications a,
+                    (SELECT created_at, id FROM applications WHERE id = ?) c
+                WHERE a.is_closed = 0 AND a.category = ? AND {condition}
+                ORDER BY a.created_at {order}, a.id {order}
+                LIMIT 1
+            """
+            params = (app_id, category)
+
+        async with self.read() as db:
+            async with db.execute(sql, params) as cursor:
+                cursor.row_factory = Application.row_factory
+                row = await cursor.fetchone()
+                return row
+    
+    @staticmethod
+    def _fts_query(query: str) -> Optional[str]:
+        """Запрос FTS5 из текста пользователя: все слова, каждое как префикс"""
+        # Слова берутся в кавычки, поэтому операторы FTS5 в тексте не работают
+        words = re.findall(r"\w+", query.lower())[:10]
+        if not words:
+            return None
+        return ' '.join(f'"{word}"*' for word in words)
+
+    async def search_applications(self, query: str, limit: int = 10,
+                                  cursor: Optional[int] = None) -> Tuple[List[Application], Optional[int]]:
+        """Полнотекстовый поиск по активным заявкам: (заявки, курсор следующей страницы).
+
+        Ищутся заявки, в тексте которых есть все слова запроса (по началу
+        слова). Порядок - от новых к старым, как в просмотре по категориям;
+        курсор - id последней заявки предыдущей страницы.
+        """
+        match = self._fts_query(query)
+        if match is None:
+            return [], None
+
+        condition, params = "", [match]
+        if cursor is not None:
+            condition = "AND (a.created_at, a.id) < (SELECT created_at, id FROM applications WHERE id = ?)"
+            params.append(cursor)
+
+        async with self.read() as db:
+            async with db.execute(f"""
+                SELECT a.* FROM applications_fts
+                JOIN applications a ON a.id = applications_fts.rowid
+                WHERE applications_fts MATCH ? AND a.is_closed = 0 {condition}
+                ORDER BY a.created_at DESC, a.id DESC
+                LIMIT ?
+            """, params + [limit + 1]) as db_cursor:
+                db_cursor.row_factory = Application.row_factory
+                rows = await db_cursor.fetchall()
+
+        # Лишняя строка только показывает, что есть следующая страница
+        if len(rows) > limit:
+            return rows[:limit], rows[limit - 1]['id']
+        return rows, None
+    
     # ============== MODEL APPLICATIONS ==============
     
-    async def create_model_application(self, model_id: int, **kwargs) -> int:
-        """Создать заявку модели"""
-        fields = ", ".join(["model_id"] + list(kwargs.keys()))
-        placeholders = ", ".join(["?"] * (len(kwargs) + 1))
-        values = [model_id] + list(kwargs.values())
+    async def create_model_application(self, model_id: int, messages: Optional[MessageFactory] = None, **kwargs) -> int:
+        """Создать заявку модели (messages - как в create_application)"""
+        sql, values = self.statements.insert("model_applications", self._with_district_id(dict(kwargs, model_id=model_id)))
         
-        async with aiosqlite.connect(self.db_path) as db:
-            cursor = await db.execute(
-                f"INSERT INTO model_applications ({fields}) VALUES ({placeholders})",
-                values
-            )
-            await db.commit()
-            return cursor.lastrowid
+        async with self.write() as db:
+            cursor = await db.execute(sql, values)
+            changed = await self._add_user_category(db, model_id, kwargs.get('category'))
+            app_id = cursor.lastrowid
+            if messages:
+                await self._enqueue(db, messages(app_id))
+        
+        if changed:
+            self.user_cache.invalidate(model_id)
+        if messages:
+            self.outbox_changed.set()
+        return app_id
     
-    async def get_model_application(self, app_id: int) -> Optional[Dict[str, Any]]:
+    async def get_model_application(self, app_id: int) -> Optional[ModelApplication]:
         """Получить заявку модели"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            async with db.execute("SELECT * FROM model_applications WHERE id = ?", (app_id,)) as cursor:
-                row = await cursor.fetchone()
-                return dict(row) if row else None
+        return await self._get_row("model_applications", "id", app_id, ModelApplication)
     
     async def update_model_application(self, app_id: int, **kwargs):
         """Обновить заявку модели"""
-        fields = ", ".join([f"{key} = ?" for key in kwargs.keys()])
-        values = list(kwargs.values()) + [app_id]
+        sql, values = self.statements.update("model_applications", "id", app_id, self._with_district_id(kwargs))
         
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute(
-                f"UPDATE model_applications SET {fields} WHERE id = ?",
-                values
-            )
-            await db.commit()
+        await self._execute_write(sql, values)
     
-    async def get_model_applications_by_model(self, model_id: int) -> List[Dict[str, Any]]:
+    async def get_model_applications_by_model(self, model_id: int) -> List[ModelApplication]:
         """Получить заявки модели"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self.read() as db:
             async with db.execute(
-                "SELECT * FROM model_applications WHERE model_id = ? ORDER BY created_at DESC",
+                f"SELECT * FROM {self._history('model_applications')} WHERE model_id = ? ORDER BY created_at DESC",
                 (model_id,)
             ) as cursor:
+                cursor.row_factory = ModelApplication.row_factory
                 rows = await cursor.fetchall()
-                return [dict(row) for row in rows]
+                return rows
+    
+    async def get_latest_model_application(self, model_id: int) -> Optional[ModelApplication]:
+        """Последняя заявка модели"""
+        async with self.read() as db:
+            async with db.execute(
+                "SELECT * FROM model_applications WHERE model_id = ? ORDER BY created_at DESC, id DESC LIMIT 1",
+                (model_id,)
+            ) as cursor:
+                cursor.row_factory = ModelApplication.row_factory
+                row = await cursor.fetchone()
+                return row
     
     # ============== RESPONSES ==============
     
     async def add_response(self, application_id: int, model_id: int) -> int:
         """Добавить отклик модели на заявку заказчика"""
-        async with aiosqlite.connect(self.db_path) as db:
-            cursor = await db.execute(
-                "INSERT INTO responses (application_id, model_id) VALUES (?, ?)",
-                (application_id, model_id)
-            )
-            await db.commit()
-            return cursor.lastrowid
+        return await self._execute_write(
+            "INSERT INTO responses (application_id, model_id) VALUES (?, ?)",
+            (application_id, model_id)
+        )
+    
+    async def add_response_guarded(self, application_id: int, model_id: int, limit_multiplier: int,
+                                   messages: Optional[MessageFactory] = None) -> Tuple[ResponseOutcome, Optional[int]]:
+        """Создать отклик, если заявка открыта, отклика еще нет и лимит не исчерпан.
+
+        Лимит - models_needed * limit_multiplier. Проверки и вставка - один
+        INSERT ... SELECT в одном задании писателя, поэтому одновременные
+        клики не обходят ни лимит, ни уникальный индекс. messages(id отклика)
+        попадают в outbox вместе с откликом, только если он создан.
+        Возвращает (результат, id отклика или None).
+        """
+        category_added = False
+        
+        async def job(db: aiosqlite.Connection) -> Tuple[ResponseOutcome, Optional[int]]:
+            nonlocal category_added
+            cursor = await db.execute("""
+                INSERT INTO responses (application_id, model_id)
+                SELECT a.id, ? FROM applications a
+                WHERE a.id = ? AND a.is_closed = 0
+                  AND (SELECT COUNT(*) FROM responses WHERE application_id = a.id) < a.models_needed * ?
+                ON CONFLICT (application_id, model_id) DO NOTHING
+            """, (model_id, application_id, limit_multiplier))
+            if cursor.rowcount == 1:
+                response_id = cursor.lastrowid
+                # Отклик на категорию - интерес модели к ней (для подбора)
+                async with db.execute("SELECT category FROM applications WHERE id = ?", (application_id,)) as check:
+                    row = await check.fetchone()
+                category_added = await self._add_user_category(db, model_id, row[0])
+                if messages:
+                    await self._enqueue(db, messages(response_id))
+                return ResponseOutcome.CREATED, response_id
+            
+            # Не вставили - выясняем причину в той же транзакции
+            async with db.execute("""
+                SELECT a.is_closed,
+                       EXISTS(SELECT 1 FROM responses WHERE application_id = a.id AND model_id = ?)
+                FROM applications a WHERE a.id = ?
+            """, (model_id, application_id)) as check:
+                row = await check.fetchone()
+            
+            if row is None:
+                return ResponseOutcome.NOT_FOUND, None
+            if row[0]:
+                return ResponseOutcome.CLOSED, None
+            if row[1]:
+                return ResponseOutcome.DUPLICATE, None
+            return ResponseOutcome.FULL, None
+        
+        result = await self._submit(job)
+        if category_added:
+            self.user_cache.invalidate(model_id)
+        if messages and result[0] == ResponseOutcome.CREATED:
+            self.outbox_changed.set()
+        return result
     
     async def check_response_exists(self, application_id: int, model_id: int) -> bool:
         """Проверить, есть ли уже отклик"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.read() as db:
             async with db.execute(
                 "SELECT id FROM responses WHERE application_id = ? AND model_id = ?",
                 (application_id, model_id)
@@ -354,48 +825,84 @@ class Database:
                 row = await cursor.fetchone()
                 return row is not None
     
-    async def get_response(self, response_id: int) -> Optional[Dict[str, Any]]:
+    async def get_response(self, response_id: int) -> Optional[Response]:
         """Получить отклик"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            async with db.execute("SELECT * FROM responses WHERE id = ?", (response_id,)) as cursor:
-                row = await cursor.fetchone()
-                return dict(row) if row else None
+        return await self._get_row("responses", "id", response_id, Response)
     
-    async def update_response_status(self, response_id: int, status: str):
-        """Обновить статус отклика"""
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute(
-                "UPDATE responses SET status = ? WHERE id = ?",
-                (status, response_id)
-            )
-            await db.commit()
+    async def update_response_status(self, response_id: int, status: str,
+                                     messages: Iterable[OutboxMessage] = ()):
+        """Обновить статус отклика и поставить уведомления в outbox той же транзакцией"""
+        async with self.write() as db:
+            await db.execute("UPDATE responses SET status = ? WHERE id = ?", (status, response_id))
+            queued = await self._enqueue(db, messages)
+        
+        if queued:
+            self.outbox_changed.set()
     
-    async def get_application_responses(self, application_id: int) -> List[Dict[str, Any]]:
+    async def get_application_responses(self, application_id: int) -> List[Response]:
         """Получить все отклики на заявку"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self.read() as db:
             async with db.execute(
-                "SELECT * FROM responses WHERE application_id = ?",
+                f"SELECT * FROM {self._history('responses')} WHERE application_id = ?",
                 (application_id,)
             ) as cursor:
+                cursor.row_factory = Response.row_factory
                 rows = await cursor.fetchall()
-                return [dict(row) for row in rows]
+                return rows
     
-    async def get_model_responses(self, model_id: int) -> List[Dict[str, Any]]:
+    async def get_model_responses(self, model_id: int) -> List[Response]:
         """Получить все отклики модели"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self.read() as db:
             async with db.execute(
-                "SELECT * FROM responses WHERE model_id = ? ORDER BY created_at DESC",
+                f"SELECT * FROM {self._history('responses')} WHERE model_id = ? ORDER BY created_at DESC",
                 (model_id,)
             ) as cursor:
+                cursor.row_factory = Response.row_factory
+                rows = await cursor.fetchall()
+                return rows
+    
+    async def get_application_responses_with_models(self, application_id: int) -> List[Response]:
+        """Отклики на заявку вместе с профилем модели (один запрос)"""
+        async with self.read() as db:
+            async with db.execute(f"""
+                SELECT r.*, u.full_name AS model_full_name, u.username AS model_username,
+                       u.rating AS model_rating
+                FROM {self._history('responses')} r
+                LEFT JOIN users u ON u.user_id = r.model_id
+                WHERE r.application_id = ?
+                ORDER BY r.created_at, r.id
+            """, (application_id,)) as cursor:
+                cursor.row_factory = Response.row_factory
                 rows = await cursor.fetchall()
-                return [dict(row) for row in rows]
+                return rows
+    
+    async def get_model_responses_with_applications(self, model_id: int) -> List[Response]:
+        """Отклики модели вместе с краткими данными заявки (один запрос)"""
+        # Отклики переносятся в архив вместе со своей заявкой, поэтому JOIN
+        # делается внутри каждой схемы: JOIN с объединением основной таблицы
+        # и архива материализует все заявки
+        select = """
+            SELECT r.*, a.category AS app_category, a.subcategory AS app_subcategory,
+                   a.date AS app_date, a.time AS app_time, a.district AS app_district,
+                   a.is_closed AS app_is_closed
+            FROM {schema}.responses r
+            LEFT JOIN {schema}.applications a ON a.id = r.application_id
+            WHERE r.model_id = ?
+        """
+        schemas = ['main', 'archive'] if self.archive_path else ['main']
+        sql = " UNION ALL ".join(select.format(schema=schema) for schema in schemas)
+        
+        async with self.read() as db:
+            async with db.execute(
+                f"{sql} ORDER BY created_at DESC, id DESC", (model_id,) * len(schemas)
+            ) as cursor:
+                cursor.row_factory = Response.row_factory
+                rows = await cursor.fetchall()
+                return rows
     
     async def count_responses(self, application_id: int) -> int:
         """Подсчитать количество откликов"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.read() as db:
             async with db.execute(
                 "SELECT COUNT(*) FROM responses WHERE application_id = ?",
                 (application_id,)
@@ -407,17 +914,49 @@ class Database:
     
     async def add_customer_response(self, model_application_id: int, customer_id: int) -> int:
         """Добавить отклик заказчика на заявку модели"""
-        async with aiosqlite.connect(self.db_path) as db:
-            cursor = await db.execute(
-                "INSERT INTO customer_responses (model_application_id, customer_id) VALUES (?, ?)",
-                (model_application_id, customer_id)
-            )
-            await db.commit()
-            return cursor.lastrowid
+        return await self._execute_write(
+            "INSERT INTO customer_responses (model_application_id, customer_id) VALUES (?, ?)",
+            (model_application_id, customer_id)
+        )
+    
+    async def add_customer_response_guarded(self, model_application_id: int, customer_id: int,
+                                            messages: Optional[MessageFactory] = None) -> Tuple[ResponseOutcome, Optional[int]]:
+        """Создать отклик заказчика, если заявка модели открыта и отклика еще нет.
+
+        messages(id отклика) попадают в outbox вместе с откликом.
+        Возвращает (результат, id отклика или None).
+        """
+        async def job(db: aiosqlite.Connection) -> Tuple[ResponseOutcome, Optional[int]]:
+            cursor = await db.execute("""
+                INSERT INTO customer_responses (model_application_id, customer_id)
+                SELECT ma.id, ? FROM model_applications ma
+                WHERE ma.id = ? AND ma.is_closed = 0
+                ON CONFLICT (model_application_id, customer_id) DO NOTHING
+            """, (customer_id, model_application_id))
+            if cursor.rowcount == 1:
+                if messages:
+                    await self._enqueue(db, messages(cursor.lastrowid))
+                return ResponseOutcome.CREATED, cursor.lastrowid
+            
+            async with db.execute(
+                "SELECT is_closed FROM model_applications WHERE id = ?", (model_application_id,)
+            ) as check:
+                row = await check.fetchone()
+            
+            if row is None:
+                return ResponseOutcome.NOT_FOUND, None
+            if row[0]:
+                return ResponseOutcome.CLOSED, None
+            return ResponseOutcome.DUPLICATE, None
+        
+        result = await self._submit(job)
+        if messages and result[0] == ResponseOutcome.CREATED:
+            self.outbox_changed.set()
+        return result
     
     async def check_customer_response_exists(self, model_application_id: int, customer_id: int) -> bool:
         """Проверить, есть ли уже отклик заказчика"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.read() as db:
             async with db.execute(
                 "SELECT id FROM customer_responses WHERE model_application_id = ? AND customer_id = ?",
                 (model_application_id, customer_id)
@@ -425,84 +964,121 @@ class Database:
                 row = await cursor.fetchone()
                 return row is not None
     
-    async def get_model_application_responses(self, model_application_id: int) -> List[Dict[str, Any]]:
+    async def get_model_application_responses(self, model_application_id: int) -> List[CustomerResponse]:
         """Получить все отклики на заявку модели"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self.read() as db:
             async with db.execute(
-                "SELECT * FROM customer_responses WHERE model_application_id = ?",
+                f"SELECT * FROM {self._history('customer_responses')} WHERE model_application_id = ?",
                 (model_application_id,)
             ) as cursor:
+                cursor.row_factory = CustomerResponse.row_factory
+                rows = await cursor.fetchall()
+                return rows
+    
+    async def get_model_application_responses_with_customers(self, model_application_id: int) -> List[CustomerResponse]:
+        """Отклики на заявку модели вместе с профилем заказчика (один запрос)"""
+        async with self.read() as db:
+            async with db.execute(f"""
+                SELECT cr.*, u.full_name AS customer_full_name, u.username AS customer_username,
+                       u.phone_1 AS customer_phone_1, u.rating AS customer_rating
+                FROM {self._history('customer_responses')} cr
+                LEFT JOIN users u ON u.user_id = cr.customer_id
+                WHERE cr.model_application_id = ?
+                ORDER BY cr.created_at, cr.id
+            """, (model_application_id,)) as cursor:
+                cursor.row_factory = CustomerResponse.row_factory
                 rows = await cursor.fetchall()
-                return [dict(row) for row in rows]
+                return rows
     
     # ============== RATINGS ==============
     
     async def add_rating(self, **kwargs):
         """Добавить рейтинг"""
-        fields = ", ".join(kwargs.keys())
-        placeholders = ", ".join(["?"] * len(kwargs))
-        values = list(kwargs.values())
+        sql, values = self.statements.insert("ratings", kwargs)
         
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute(
-                f"INSERT INTO ratings ({fields}) VALUES ({placeholders})",
-                values
-            )
-            await db.commit()
+        await self._execute_write(sql, values)
+        # Триггер рейтинга обновил строку users оцененного
+        self.user_cache.invalidate(kwargs.get('rated_id'))
     
     async def calculate_rating(self, user_id: int) -> float:
         """Рассчитать средний рейтинг пользователя (используем calculate_simple_rating)"""
         return await self.calculate_simple_rating(user_id)
     
+    async def get_rating_summary(self, user_id: int) -> Tuple[float, int]:
+        """Средний рейтинг и количество оценок: (рейтинг, количество)"""
+        # Агрегаты поддерживаются триггерами на ratings, чтение - одна строка users
+        async with self.read() as db:
+            async with db.execute(
+                "SELECT rating_sum, rating_count FROM users WHERE user_id = ?", (user_id,)
+            ) as cursor:
+                row = await cursor.fetchone()
+        
+        if not row or not row['rating_count']:
+            return 0.0, 0
+        return round(row['rating_sum'] / row['rating_count'], 1), row['rating_count']
+    
     # ============== SUBSCRIPTIONS ==============
     
     async def add_subscription(self, user_id: int, days: int, payment_id: str = None, role: str = "model") -> int:
         """Добавить подписку для конкретной роли"""
-        from datetime import datetime, timedelta
+        end_date = int(time.time()) + int(days * 86400)
         
-        end_date = datetime.now() + timedelta(days=days)
-        
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.write() as db:
             cursor = await db.execute(
                 "INSERT INTO subscriptions (user_id, end_date, payment_id, role) VALUES (?, ?, ?, ?)",
-                (user_id, end_date.isoformat(), payment_id, role)
+                (user_id, end_date, payment_id, role)
             )
-            await db.commit()
             
             # Обновляем статус привилегированной модели только если это подписка модели
             if role == "model":
-                await self.update_user(user_id, is_privileged=True)
+                await db.execute("UPDATE users SET is_privileged = 1 WHERE user_id = ?", (user_id,))
             
-            return cursor.lastrowid
+            subscription_id = cursor.lastrowid
+        
+        self.entitlements.invalidate(user_id, role)
+        self.user_cache.invalidate(user_id)
+        self.subscriptions_changed.set()
+        return subscription_id
     
     async def get_active_subscription(self, user_id: int, role: str = None):
         """Получить активную подписку пользователя для конкретной роли"""
-        from datetime import datetime
+        if role:
+            subscription, _ = await self._get_entitlement(user_id, role)
+            return subscription
         
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            
-            if role:
-                # Ищем подписку для конкретной роли
-                query = """
-                    SELECT * FROM subscriptions 
-                    WHERE user_id = ? AND role = ? AND is_active = 1 AND end_date > ? 
-                    ORDER BY end_date DESC LIMIT 1
-                """
-                params = (user_id, role, datetime.now().isoformat())
-            else:
-                # Ищем любую активную подписку (для обратной совместимости)
-                query = """
-                    SELECT * FROM subscriptions 
-                    WHERE user_id = ? AND is_active = 1 AND end_date > ? 
-                    ORDER BY end_date DESC LIMIT 1
-                """
-                params = (user_id, datetime.now().isoformat())
-            
-            async with db.execute(query, params) as cursor:
+        # Ищем любую активную подписку (для обратной совместимости)
+        async with self.read() as db:
+            async with db.execute("""
+                SELECT * FROM subscriptions 
+                WHERE user_id = ? AND is_active = 1 AND end_date > ? 
+                ORDER BY end_date DESC LIMIT 1
+            """, (user_id, int(time.time()))) as cursor:
+                cursor.row_factory = Subscription.row_factory
+                row = await cursor.fetchone()
+                return row
+    
+    async def _get_entitlement(self, user_id: int, role: str) -> Tuple[Optional[Subscription], Optional[int]]:
+        """Активная подписка роли и ее end_date в секундах Unix (через кэш)"""
+        hit, subscription, end_date = self.entitlements.get(user_id, role)
+        if hit:
+            return subscription, end_date
+        
+        # Версию снимаем до запроса: если подписку изменят во время чтения,
+        # устаревший результат не попадет в кэш
+        version = self.entitlements.version
+        async with self.read() as db:
+            async with db.execute("""
+                SELECT * FROM subscriptions 
+                WHERE user_id = ? AND role = ? AND is_active = 1 AND end_date > ? 
+                ORDER BY end_date DESC LIMIT 1
+            """, (user_id, role, int(time.time()))) as cursor:
+                cursor.row_factory = Subscription.row_factory
                 row = await cursor.fetchone()
-                return dict(row) if row else None
+        
+        self.entitlements.put(user_id, role, row, version)
+        if row is None:
+            return None, None
+        return row, row['end_date']
     
     async def check_subscription_expired(self, user_id: int) -> bool:
         """Проверить истекла ли подписка МОДЕЛИ"""
@@ -517,18 +1093,73 @@ class Database:
     
     async def deactivate_subscription(self, subscription_id: int):
         """Деактивировать подписку"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.write() as db:
+            async with db.execute(
+                "SELECT user_id, role FROM subscriptions WHERE id = ?", (subscription_id,)
+            ) as cursor:
+                row = await cursor.fetchone()
+            
             await db.execute(
                 "UPDATE subscriptions SET is_active = 0 WHERE id = ?",
                 (subscription_id,)
             )
-            await db.commit()
-    
+        
+        if row:
+            self.entitlements.invalidate(row['user_id'], row['role'])
+
+    async def deactivate_expired_subscriptions(self) -> List[tuple]:
+        """Деактивировать истекшие подписки, вернуть список (user_id, role)"""
+        now = int(time.time())
+
+        # Все изменения - одна транзакция и три запроса независимо от числа подписок
+        async with self.write() as db:
+            # Без DISTINCT: он уводит план на полный проход idx_subscriptions_active,
+            # а истекших строк мало - повторы убираем здесь
+            async with db.execute("""
+                SELECT user_id, role FROM subscriptions
+                WHERE is_active = 1 AND end_date < ?
+            """, (now,)) as cursor:
+                expired = list(dict.fromkeys(tuple(row) for row in await cursor.fetchall()))
+
+            if expired:
+                # Привилегии снимаем только у моделей без другой действующей подписки модели
+                await db.execute("""
+                    UPDATE users SET is_privileged = 0
+                    WHERE is_privileged = 1
+                      AND user_id IN (
+                          SELECT user_id FROM subscriptions
+                          WHERE is_active = 1 AND role = 'model' AND end_date < ?
+                      )
+                      AND NOT EXISTS (
+                          SELECT 1 FROM subscriptions s
+                          WHERE s.user_id = users.user_id AND s.role = 'model'
+                            AND s.is_active = 1 AND s.end_date >= ?
+                      )
+                """, (now, now))
+
+                await db.execute(
+                    "UPDATE subscriptions SET is_active = 0 WHERE is_active = 1 AND end_date < ?",
+                    (now,)
+                )
+
+        for user_id, role in expired:
+            self.entitlements.invalidate(user_id, role)
+            self.user_cache.invalidate(user_id)
+        return expired
+
+    async def get_next_subscription_expiry(self) -> Optional[int]:
+        """Ближайший end_date (секунды Unix) среди активных подписок"""
+        async with self.read() as db:
+            async with db.execute(
+                "SELECT MIN(end_date) FROM subscriptions WHERE is_active = 1"
+            ) as cursor:
+                row = await cursor.fetchone()
+        
+        return row[0] if row and row[0] is not None else None
+
     async def get_subscription_info(self, user_id: int) -> dict:
         """Получить информацию о подписке МОДЕЛИ"""
-        from datetime import datetime
-        
-        subscription = await self.get_active_subscription(user_id, role="model")
+        subscription, end_date = await self._get_entitlement(user_id, "model")
         
         if not subscription:
             return {
@@ -537,20 +1168,17 @@ class Database:
                 'end_date': None
             }
         
-        end_date = datetime.fromisoformat(subscription['end_date'])
-        days_left = (end_date - datetime.now()).days
+        days_left = (end_date - int(time.time())) // 86400
         
         return {
             'has_subscription': True,
             'days_left': max(0, days_left),
-            'end_date': end_date.strftime('%d.%m.%Y')
+            'end_date': datetime.fromtimestamp(end_date).strftime('%d.%m.%Y')
         }
     
     async def get_customer_subscription_info(self, user_id: int) -> dict:
         """Получить информацию о подписке ЗАКАЗЧИКА"""
-        from datetime import datetime
-        
-        subscription = await self.get_active_subscription(user_id, role="customer")
+        subscription, end_date = await self._get_entitlement(user_id, "customer")
         
         if not subscription:
             return {
@@ -559,61 +1187,54 @@ class Database:
                 'end_date': None
             }
         
-        end_date = datetime.fromisoformat(subscription['end_date'])
-        days_left = (end_date - datetime.now()).days
+        days_left = (end_date - int(time.time())) // 86400
         
         return {
             'has_subscription': True,
             'days_left': max(0, days_left),
-            'end_date': end_date.strftime('%d.%m.%Y')
+            'end_date': datetime.fromtimestamp(end_date).strftime('%d.%m.%Y')
         }
     
     async def check_customer_subscription(self, user_id: int) -> bool:
         """Проверить есть ли у заказчика активная подписка"""
-        subscription = await self.get_active_subscription(user_id, role="customer")
+        subscription, end_date = await self._get_entitlement(user_id, "customer")
         
         if not subscription:
             return False
         
-        from datetime import datetime
-        end_date = datetime.fromisoformat(subscription['end_date'])
-        
-        if datetime.now() > end_date:
+        if time.time() > end_date:
             return False
         
         return True
     
     async def delete_user(self, user_id: int):
         """Удалить пользователя из БД (для смены роли)"""
-        async with aiosqlite.connect(self.db_path) as db:
-            # Удаляем только пользователя, остальное удалится автоматически через CASCADE
-            await db.execute("DELETE FROM users WHERE user_id = ?", (user_id,))
-            await db.commit()
+        # Удаляем только пользователя, остальное удалится автоматически через CASCADE
+        await self._execute_write("DELETE FROM users WHERE user_id = ?", (user_id,))
+        self.user_cache.invalidate(user_id)
     
     async def delete_user_keep_subscription(self, user_id: int):
         """Удалить данные пользователя, но сохранить подписку"""
-        async with aiosqlite.connect(self.db_path) as db:
-            # Удаляем только пользователя, подписки остаются в таблице subscriptions
-            await db.execute("DELETE FROM users WHERE user_id = ?", (user_id,))
-            await db.commit()
+        # Удаляем только пользователя, подписки остаются в таблице subscriptions
+        await self._execute_write("DELETE FROM users WHERE user_id = ?", (user_id,))
+        self.user_cache.invalidate(user_id)
     
     async def add_simple_rating(self, rater_id: int, rated_id: int, rating: int):
         """Добавить простую оценку от 1 до 10"""
-        async with aiosqlite.connect(self.db_path) as db:
-            # Создаем фиктивный application_id = 0 для простых оценок
-            await db.execute("""
-                INSERT INTO ratings (application_id, rater_id, rated_id, 
-                    came, prepared, requirements_met, work_again,
-                    location_convenient, conditions_met, attitude_correct, cooperate_again)
-                VALUES (0, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (rater_id, rated_id, 
-                  rating >= 8, rating >= 8, rating >= 8, rating >= 8,
-                  rating >= 8, rating >= 8, rating >= 8, rating >= 8))
-            await db.commit()
+        # Создаем фиктивный application_id = 0 для простых оценок
+        await self._execute_write("""
+            INSERT INTO ratings (application_id, rater_id, rated_id, 
+                came, prepared, requirements_met, work_again,
+                location_convenient, conditions_met, attitude_correct, cooperate_again)
+            VALUES (0, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (rater_id, rated_id, 
+              rating >= 8, rating >= 8, rating >= 8, rating >= 8,
+              rating >= 8, rating >= 8, rating >= 8, rating >= 8))
+        self.user_cache.invalidate(rated_id)
     
     async def check_simple_rating_exists(self, rater_id: int, rated_id: int) -> bool:
         """Проверить, оставлял ли уже оценку"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.read() as db:
             async with db.execute("""
                 SELECT id FROM ratings WHERE rater_id = ? AND rated_id = ?
             """, (rater_id, rated_id)) as cursor:
@@ -621,46 +1242,31 @@ class Database:
                 return result is not None
     
     async def calculate_simple_rating(self, user_id: int) -> float:
-        """Вычислить средний рейтинг из простых оценок"""
-        async with aiosqlite.connect(self.db_path) as db:
-            async with db.execute("""
-                SELECT AVG(
-                    (CAST(came AS REAL) + CAST(prepared AS REAL) + 
-                     CAST(requirements_met AS REAL) + CAST(work_again AS REAL) +
-                     CAST(location_convenient AS REAL) + CAST(conditions_met AS REAL) +
-                     CAST(attitude_correct AS REAL) + CAST(cooperate_again AS REAL)) / 8.0 * 10
-                ) as avg_rating
-                FROM ratings WHERE rated_id = ?
-            """, (user_id,)) as cursor:
-                result = await cursor.fetchone()
-                return round(result[0], 1) if result and result[0] else 0.0
+        """Средний рейтинг из простых оценок"""
+        rating, _ = await self.get_rating_summary(user_id)
+        return rating
     
     async def get_simple_ratings_count(self, user_id: int) -> int:
         """Получить количество оценок"""
-        async with aiosqlite.connect(self.db_path) as db:
-            async with db.execute("""
-                SELECT COUNT(*) FROM ratings WHERE rated_id = ?
-            """, (user_id,)) as cursor:
-                result = await cursor.fetchone()
-                return result[0] if result else 0
+        _, count = await self.get_rating_summary(user_id)
+        return count
     
     async def add_response_rating(self, response_id: int, rater_id: int, rated_id: int, rating: int):
         """Добавить оценку привязанную к конкретному отклику"""
-        async with aiosqlite.connect(self.db_path) as db:
-            # application_id = response_id для привязки к отклику
-            await db.execute("""
-                INSERT INTO ratings (application_id, rater_id, rated_id, 
-                    came, prepared, requirements_met, work_again,
-                    location_convenient, conditions_met, attitude_correct, cooperate_again)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (response_id, rater_id, rated_id, 
-                  rating >= 8, rating >= 8, rating >= 8, rating >= 8,
-                  rating >= 8, rating >= 8, rating >= 8, rating >= 8))
-            await db.commit()
+        # application_id = response_id для привязки к отклику
+        await self._execute_write("""
+            INSERT INTO ratings (application_id, rater_id, rated_id, 
+                came, prepared, requirements_met, work_again,
+                location_convenient, conditions_met, attitude_correct, cooperate_again)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (response_id, rater_id, rated_id, 
+              rating >= 8, rating >= 8, rating >= 8, rating >= 8,
+              rating >= 8, rating >= 8, rating >= 8, rating >= 8))
+        self.user_cache.invalidate(rated_id)
     
     async def check_trial_used(self, user_id: int, role: str) -> bool:
    
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.read() as db:
             async with db.execute("""
                 SELECT id FROM subscriptions 
                 WHERE user_id = ? AND role = ? AND payment_id = 'trial'
@@ -670,30 +1276,387 @@ class Database:
 
     async def activate_trial_subscription(self, user_id: int, role: str, days: int = 30) -> int:
         """Активировать пробную подписку"""
-        from datetime import datetime, timedelta
-    
-        end_date = datetime.now() + timedelta(days=days)
+        end_date = int(time.time()) + int(days * 86400)
     
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.write() as db:
             cursor = await db.execute(
                 "INSERT INTO subscriptions (user_id, end_date, payment_id, role) VALUES (?, ?, ?, ?)",
-                (user_id, end_date.isoformat(), 'trial', role)
+                (user_id, end_date, 'trial', role)
             )
-            await db.commit()
         
-        # Обновляем статус привилегированной модели только если это подписка модели
+            # Обновляем статус привилегированной модели только если это подписка модели
             if role == "model":
-                await self.update_user(user_id, is_privileged=True)
+                await db.execute("UPDATE users SET is_privileged = 1 WHERE user_id = ?", (user_id,))
         
-            return cursor.lastrowid
+            subscription_id = cursor.lastrowid
+        
+        self.entitlements.invalidate(user_id, role)
+        self.user_cache.invalidate(user_id)
+        self.subscriptions_changed.set()
+        return subscription_id
 
     async def check_response_rating_exists(self, response_id: int, rater_id: int) -> bool:
         """Проверить, оставлял ли уже оценку за этот отклик"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.read() as db:
             async with db.execute("""
                 SELECT id FROM ratings WHERE application_id = ? AND rater_id = ?
             """, (response_id, rater_id)) as cursor:
                 result = await cursor.fetchone()
                 return result is not None
             
-    
\ No newline at end of file
+    
+    
+    # ============== АРХИВ ==============
+    
+    async def archive_applications(self, closed_before: int, stale_before: Optional[int],
+                                   batch_size: int = 500) -> Dict[str, int]:
+        """Перенести старые заявки с откликами в архив, вернуть число строк по таблицам.
+
+        Переносятся закрытые заявки, созданные раньше closed_before, и любые
+        заявки, созданные раньше stale_before: дата события - свободный текст,
+        поэтому прошедшие заявки определяются по возрасту. Каждая пачка из
+        batch_size заявок - два коротких задания писателя: копия и удаление.
+        """
+        moved = {table: 0 for table in ARCHIVE_TABLES}
+        if not self.archive_path:
+            return moved
+
+        for table, child, foreign_key in ARCHIVE_GROUPS:
+            while True:
+                # До пачки, которая ничего не перенесла: неполная пачка заявок
+                # еще не значит, что отклики перенесены (и наоборот)
+                count = await self._archive_batch(
+                    table, child, foreign_key, closed_before, stale_before, batch_size, moved
+                )
+                if count == 0:
+                    break
+                # Между пачками пропускаем вперед записи обработчиков
+                await asyncio.sleep(0)
+        return moved
+
+    async def _archive_batch(self, table: str, child: str, foreign_key: str,
+                             closed_before: int, stale_before: Optional[int],
+                             batch_size: int, moved: Dict[str, int]) -> int:
+        """Перенести одну пачку заявок table и их откликов из child.
+
+        Транзакция над двумя файлами в режиме WAL не атомарна, поэтому
+        перенос идет двумя заданиями: первое копирует пачку в архив и
+        коммитится, второе удаляет из основной БД только строки, точная
+        копия которых уже есть в архиве. После сбоя между ними строки
+        остаются в обеих БД, и следующий перенос повторит пачку.
+        Возвращает число строк, удаленных из обеих таблиц.
+        """
+        async with self.write() as db:
+            async with db.execute(f"""
+                SELECT id FROM main.{table}
+                WHERE created_at < ? AND (is_closed = 1 OR created_at < ?)
+                ORDER BY created_at
+                LIMIT ?
+            """, (closed_before, stale_before, batch_size)) as cursor:
+                ids = [row[0] for row in await cursor.fetchall()]
+            if not ids:
+                return 0
+
+            marks = ', '.join(['?'] * len(ids))
+            for name, key in ((table, 'id'), (child, foreign_key)):
+                columns = ', '.join(sorted(self.statements.columns(name)))
+                # REPLACE обновляет копию, оставшуюся от прерванного переноса
+                await db.execute(f"""
+                    INSERT OR REPLACE INTO archive.{name} ({columns})
+                    SELECT {columns} FROM main.{name} WHERE {key} IN ({marks})
+                """, ids)
+
+        count = 0
+        async with self.write() as db:
+            for name, key in ((child, foreign_key), (table, 'id')):
+                copied = ' AND '.join(
+                    f"a.{column} IS {name}.{column}"
+                    for column in sorted(self.statements.columns(name)) if column != 'id'
+                )
+                # Заявку удаляем, только если в основной БД не осталось ее откликов
+                orphan = (
+                    f" AND NOT EXISTS (SELECT 1 FROM main.{child} WHERE {foreign_key} = {name}.id)"
+                    if name == table else ""
+                )
+                cursor = await db.execute(f"""
+                    DELETE FROM main.{name}
+                    WHERE {key} IN ({marks})
+                      AND EXISTS (SELECT 1 FROM archive.{name} AS a WHERE a.id = {name}.id AND {copied}){orphan}
+                """, ids)
+                moved[name] += cursor.rowcount
+                count += cursor.rowcount
+        return count
+    
+    # ============== РАЙОНЫ ==============
+    
+    async def get_active_applications_by_district(self, district_id: int) -> List[Application]:
+        """Активные заявки района"""
+        async with self.read() as db:
+            async with db.execute(
+                "SELECT * FROM applications WHERE is_closed = 0 AND district_id = ? ORDER BY created_at DESC",
+                (district_id,)
+            ) as cursor:
+                cursor.row_factory = Application.row_factory
+                rows = await cursor.fetchall()
+                return rows
+    
+    async def get_models_by_district(self, district_id: int) -> List[User]:
+        """Незаблокированные модели района"""
+        async with self.read() as db:
+            async with db.execute(
+                "SELECT * FROM users WHERE role = 'model' AND district_id = ? AND is_blocked = 0",
+                (district_id,)
+            ) as cursor:
+                cursor.row_factory = User.row_factory
+                rows = await cursor.fetchall()
+                return rows
+    
+    async def backfill_district_ids(self, batch_size: int = 500) -> Dict[str, int]:
+        """Заполнить district_id у строк, сохраненных до справочника.
+
+        Обрабатывает строки с district_id IS NULL пачками по первичному ключу,
+        каждая пачка - отдельное задание писателя. Нераспознанные районы
+        получают 0; чтобы распознать их после пополнения справочника,
+        достаточно сбросить district_id = 0 в NULL и запустить снова.
+        """
+        updated = {'users': 0, 'applications': 0, 'model_applications': 0}
+        if self.districts is None:
+            return updated
+
+        # Таблица -> (первичный ключ, столбец города)
+        for table, (key, city) in {
+            'users': ('user_id', 'city'),
+            'applications': ('id', 'city'),
+            'model_applications': ('id', 'NULL'),
+        }.items():
+            last_key = -1
+            while True:
+                async with self.write() as db:
+                    async with db.execute(f"""
+                        SELECT {key}, district, {city} FROM {table}
+                        WHERE {key} > ? AND district_id IS NULL AND district IS NOT NULL
+                        ORDER BY {key}
+                        LIMIT ?
+                    """, (last_key, batch_size)) as cursor:
+                        rows = await cursor.fetchall()
+
+                    await db.executemany(
+                        f"UPDATE {table} SET district_id = ? WHERE {key} = ? AND district_id IS NULL",
+                        [(self.districts.resolve(row[1], row[2]), row[0]) for row in rows]
+                    )
+
+                if table == 'users' and rows:
+                    self.user_cache.invalidate(*(row[0] for row in rows))
+                updated[table] += len(rows)
+                if len(rows) < batch_size:
+                    break
+                last_key = rows[-1][0]
+                await asyncio.sleep(0)
+        return updated
+    
+    # ============== OUTBOX ==============
+    
+    async def _enqueue(self, db: aiosqlite.Connection, messages: Iterable[OutboxMessage]) -> int:
+        """Записать сообщения в outbox в текущем задании писателя, вернуть их число"""
+        now = int(time.time())
+        rows = []
+        for message in messages:
+            if message.ref_table is not None and message.ref_table not in OUTBOX_REF_TABLES:
+                raise ValueError(f"Недопустимая таблица для message_id: {message.ref_table}")
+            rows.append((*message, now))
+        if rows:
+            await db.executemany("""
+                INSERT INTO outbox (chat_id, text, reply_markup, ref_table, ref_id, message_id, next_attempt_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+        return len(rows)
+    
+    async def enqueue_messages(self, messages: Iterable[OutboxMessage]) -> int:
+        """Поставить сообщения в outbox без изменения других данных"""
+        async with self.write() as db:
+            queued = await self._enqueue(db, messages)
+        
+        if queued:
+            self.outbox_changed.set()
+        return queued
+    
+    async def update_outbox_post(self, message: OutboxMessage) -> bool:
+        """Обновить публикацию строки message.ref_table / ref_id.
+
+        Неотправленная публикация (или ждущее редактирование) переписывается
+        на месте, уже отправленная - редактируется новым сообщением outbox.
+        Одно задание писателя с complete_outbox исключает гонку с отправкой.
+        False - публикации нет (не ставилась или не доставлена).
+        """
+        if message.ref_table not in OUTBOX_REF_TABLES:
+            raise ValueError(f"Недопустимая таблица для message_id: {message.ref_table}")
+        
+        async with self.write() as db:
+            cursor = await db.execute("""
+                UPDATE outbox SET text = ?, reply_markup = ?
+                WHERE ref_table = ? AND ref_id = ? AND chat_id = ? AND next_attempt_at IS NOT NULL
+            """, (message.text, message.reply_markup, message.ref_table, message.ref_id, message.chat_id))
+            if cursor.rowcount == 0:
+                async with db.execute(
+                    f"SELECT message_id FROM {message.ref_table} WHERE id = ?", (message.ref_id,)
+                ) as cursor:
+                    row = await cursor.fetchone()
+                if row is None or row[0] is None:
+                    return False
+                await self._enqueue(db, [message._replace(message_id=row[0])])
+        
+        self.outbox_changed.set()
+        return True
+    
+    async def get_due_outbox(self, now: int, limit: int = 50) -> List[OutboxEntry]:
+        """Сообщения, срок отправки которых наступил, в порядке очереди"""
+        async with self.read() as db:
+            async with db.execute("""
+                SELECT * FROM outbox
+                WHERE next_attempt_at IS NOT NULL AND next_attempt_at <= ?
+                ORDER BY next_attempt_at, id
+                LIMIT ?
+            """, (now, limit)) as cursor:
+                cursor.row_factory = OutboxEntry.row_factory
+                rows = await cursor.fetchall()
+                return rows
+    
+    async def get_next_outbox_attempt(self) -> Optional[int]:
+        """Ближайшее время отправки (None - очередь пуста)"""
+        async with self.read() as db:
+            async with db.execute(
+                "SELECT MIN(next_attempt_at) FROM outbox WHERE next_attempt_at IS NOT NULL"
+            ) as cursor:
+                row = await cursor.fetchone()
+                return row[0] if row else None
+    
+    async def complete_outbox(self, entry: OutboxEntry, message_id: Optional[int] = None):
+        """Удалить отправленное сообщение и сохранить message_id у связанной строки.
+
+        Если во время отправки публикацию переписал update_outbox_post,
+        ушел устаревший текст: сообщение остается в outbox как
+        редактирование отправленного.
+        """
+        async with self.write() as db:
+            async with db.execute(
+                "SELECT ref_table, ref_id, text, reply_markup FROM outbox WHERE id = ?", (entry['id'],)
+            ) as cursor:
+                row = await cursor.fetchone()
+            if row is None:
+                return
+            
+            ref_table, ref_id, text, reply_markup = row
+            if ref_table in OUTBOX_REF_TABLES and message_id is not None:
+                await db.execute(f"UPDATE {ref_table} SET message_id = ? WHERE id = ?", (message_id, ref_id))
+            
+            if (text, reply_markup) == (entry['text'], entry['reply_markup']) or message_id is None:
+                await db.execute("DELETE FROM outbox WHERE id = ?", (entry['id'],))
+                return
+            await db.execute("""
+                UPDATE outbox SET message_id = ?, attempts = 0, next_attempt_at = ?, last_error = NULL
+                WHERE id = ?
+            """, (message_id, int(time.time()), entry['id']))
+        
+        self.outbox_changed.set()
+    
+    async def retry_outbox(self, entry_id: int, next_attempt_at: int, error: str, count_attempt: bool = True):
+        """Отложить сообщение до next_attempt_at"""
+        await self._execute_write(
+            "UPDATE outbox SET attempts = attempts + ?, next_attempt_at = ?, last_error = ? WHERE id = ?",
+            (int(count_attempt), next_attempt_at, error, entry_id)
+        )
+    
+    async def fail_outbox(self, entry_id: int, error: str):
+        """Прекратить попытки: сообщение остается в outbox для разбора"""
+        await self._execute_write(
+            "UPDATE outbox SET attempts = attempts + 1, next_attempt_at = NULL, last_error = ? WHERE id = ?",
+            (error, entry_id)
+        )
+    
+    async def get_outbox_stats(self) -> Dict[str, int]:
+        """Число сообщений в очереди и недоставленных"""
+        async with self.read() as db:
+            async with db.execute(
+                "SELECT COUNT(next_attempt_at), COUNT(*) - COUNT(next_attempt_at) FROM outbox"
+            ) as cursor:
+                row = await cursor.fetchone()
+                return {'pending': row[0], 'failed': row[1]}
+    
+    # ============== РАССЫЛКИ ==============
+    
+    async def create_broadcast(self, text: str, role: Optional[str], created_by: int) -> int:
+        """Создать рассылку (role None - всем пользователям)"""
+        return await self._execute_write(
+            "INSERT INTO broadcasts (text, role, created_by) VALUES (?, ?, ?)",
+            (text, role, created_by)
+        )
+    
+    async def get_broadcast(self, broadcast_id: int) -> Optional[Broadcast]:
+        """Получить рассылку"""
+        return await self._get_row("broadcasts", "id", broadcast_id, Broadcast)
+    
+    async def get_running_broadcasts(self) -> List[Broadcast]:
+        """Незавершенные рассылки (для продолжения после перезапуска)"""
+        async with self.read() as db:
+            async with db.execute("SELECT * FROM broadcasts WHERE status = 'running' ORDER BY id") as cursor:
+                cursor.row_factory = Broadcast.row_factory
+                rows = await cursor.fetchall()
+                return rows
+    
+    async def get_recent_broadcasts(self, limit: int = 5) -> List[Broadcast]:
+        """Последние рассылки, новые первыми"""
+        async with self.read() as db:
+            async with db.execute("SELECT * FROM broadcasts ORDER BY id DESC LIMIT ?", (limit,)) as cursor:
+                cursor.row_factory = Broadcast.row_factory
+                rows = await cursor.fetchall()
+                return rows
+    
+    async def get_broadcast_recipients(self, role: Optional[str], after_user_id: int, limit: int) -> List[int]:
+        """Следующая пачка получателей после курсора after_user_id.
+
+        Постраничный обход по первичному ключу user_id от курсора: в
+        памяти только одна пачка, пользователи, зарегистрированные во
+        время рассылки, тоже ее получат.
+        """
+        # +role: индекс (role, district_id) не упорядочен по user_id и
+        # заставил бы сортировать всех пользователей роли на каждой пачке
+        role_filter = "+role = ? AND " if role else ""
+        params = ([role] if role else []) + [after_user_id, limit]
+        async with self.read() as db:
+            async with db.execute(f"""
+                SELECT user_id FROM users
+                WHERE {role_filter}user_id > ? AND bot_blocked = 0 AND is_blocked = 0
+                ORDER BY user_id
+                LIMIT ?
+            """, params) as cursor:
+                return [row[0] for row in await cursor.fetchall()]
+    
+    async def checkpoint_broadcast(self, broadcast_id: int, last_user_id: int, sent: int, failed: int,
+                                   blocked_user_ids: List[int]):
+        """Сохранить курсор и прирост счетчиков пачки, отметить заблокировавших бота"""
+        async with self.write() as db:
+            await db.execute("""
+                UPDATE broadcasts
+                SET last_user_id = ?, sent = sent + ?, failed = failed + ?, blocked = blocked + ?
+                WHERE id = ?
+            """, (last_user_id, sent, failed, len(blocked_user_ids), broadcast_id))
+            if blocked_user_ids:
+                await db.executemany(
+                    "UPDATE users SET bot_blocked = 1 WHERE user_id = ?",
+                    [(user_id,) for user_id in blocked_user_ids]
+                )
+        
+        if blocked_user_ids:
+            self.user_cache.invalidate(*blocked_user_ids)
+    
+    async def finish_broadcast(self, broadcast_id: int, status: str = 'done') -> bool:
+        """Завершить рассылку ('done') или отменить ('cancelled').
+
+        False - рассылки нет или она уже завершена.
+        """
+        async with self.write() as db:
+            cursor = await db.execute(
+                "UPDATE broadcasts SET status = ?, finished_at = ? WHERE id = ? AND status = 'running'",
+                (status, int(time.time()), broadcast_id)
+            )
+            return cursor.rowcount > 0
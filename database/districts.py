@@ -0,0 +1,103 @@
+import difflib
+import hashlib
+import json
+import re
+from typing import Dict, List, Optional, Tuple
+
+# Районы без совпадения в справочнике получают district_id = 0,
+# NULL означает "еще не обработан" (см. Database.backfill_district_ids)
+UNKNOWN_DISTRICT = 0
+
+# Слова, которые пользователи добавляют к названию района или станции
+_NOISE_WORDS = {
+    'район', 'р-н', 'рн', 'р', 'мкр', 'мкрн', 'микрорайон', 'метро', 'м', 'ст',
+    'станция', 'г', 'город', 'пос', 'поселок', 'в', 'на', 'около', 'возле', 'рядом', 'у',
+}
+
+def normalize_text(text: str) -> str:
+    """Текст района в виде для сравнения: нижний регистр, е вместо ё, без шума"""
+    text = text.lower().replace('ё', 'е')
+    words = re.findall(r"[\w-]+", text)
+    return ' '.join(word for word in words if word not in _NOISE_WORDS)
+
+class DistrictDirectory:
+    """Справочник районов и станций метро из файла данных.
+
+    Каждый район - запись {"id", "city", "name", "aliases", "metro"}. Станции
+    метро и альтернативные названия сводятся к id района, поэтому сравнение
+    местоположений - равенство целых чисел. id в файле постоянны: они
+    хранятся в users / applications / model_applications.
+    """
+
+    def __init__(self, districts: Optional[List[dict]] = None):
+        self.districts: Dict[int, dict] = {}
+        # SHA-256 файла данных (для load) - по ней БД узнает об изменениях
+        self.checksum: Optional[str] = None
+        # Нормализованное название -> [(id района, город)]
+        self._aliases: Dict[str, List[Tuple[int, str]]] = {}
+        for district in districts or []:
+            self._add(district)
+        # Для поиска названия внутри текста: сначала самые длинные
+        self._by_length = sorted(self._aliases, key=len, reverse=True)
+
+    @classmethod
+    def load(cls, path: str) -> "DistrictDirectory":
+        with open(path, 'rb') as f:
+            data = f.read()
+        directory = cls(json.loads(data.decode('utf-8')))
+        directory.checksum = hashlib.sha256(data).hexdigest()
+        return directory
+
+    def _add(self, district: dict):
+        district_id = int(district['id'])
+        if district_id == UNKNOWN_DISTRICT or district_id in self.districts:
+            raise ValueError(f"Недопустимый или повторный id района: {district_id}")
+
+        self.districts[district_id] = district
+        city = normalize_text(district['city'])
+        for name in [district['name'], *district.get('aliases', []), *district.get('metro', [])]:
+            key = normalize_text(name)
+            if key:
+                self._aliases.setdefault(key, []).append((district_id, city))
+
+    def rows(self) -> List[Tuple[int, str, str]]:
+        """Строки для таблицы districts: (id, город, название)"""
+        return [(district_id, d['city'], d['name']) for district_id, d in sorted(self.districts.items())]
+
+    def _pick(self, candidates: List[Tuple[int, str]], city: str) -> int:
+        """Одно имя может быть в разных городах - предпочитаем город пользователя"""
+        for district_id, district_city in candidates:
+            if district_city == city:
+                return district_id
+        return candidates[0][0]
+
+    def resolve(self, text: Optional[str], city: Optional[str] = None) -> Optional[int]:
+        """id района для свободного текста, UNKNOWN_DISTRICT - если не распознан.
+
+        Сначала точное совпадение, затем самое длинное известное название
+        внутри текста ("Марьино, у выхода 3"), затем близкое по написанию.
+        """
+        if text is None:
+            return None
+
+        key = normalize_text(text)
+        city = normalize_text(city or '')
+        if not key:
+            return UNKNOWN_DISTRICT
+
+        if key in self._aliases:
+            return self._pick(self._aliases[key], city)
+
+        padded = f" {key} "
+        for alias in self._by_length:
+            if f" {alias} " in padded:
+                return self._pick(self._aliases[alias], city)
+
+        close = difflib.get_close_matches(key, self._aliases, n=1, cutoff=0.85)
+        if close:
+            return self._pick(self._aliases[close[0]], city)
+        return UNKNOWN_DISTRICT
+
+    def name(self, district_id: Optional[int]) -> Optional[str]:
+        district = self.districts.get(district_id)
+        return district['name'] if district else None
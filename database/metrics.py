@@ -0,0 +1,174 @@
+import functools
+import inspect
+import logging
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+from database.models import Record
+
+logger = logging.getLogger(__name__)
+
+# Время ожидания соединения, накопленное текущим вызовом метода Database
+_call_wait: ContextVar[Optional[List[float]]] = ContextVar('call_wait', default=None)
+
+def record_wait(seconds: float, wait: Optional[List[float]] = None):
+    """Добавить ожидание соединения к текущему (или переданному) вызову"""
+    if wait is None:
+        wait = _call_wait.get()
+    if wait is not None:
+        wait[0] += seconds
+
+def current_wait() -> Optional[List[float]]:
+    """Счетчик ожидания текущего вызова (для передачи в задачу-писатель)"""
+    return _call_wait.get()
+
+def _count_rows(result: Any) -> int:
+    """Сколько строк вернул метод: список/словарь - их длина, запись - одна.
+
+    Кортеж (строки, курсор) считается по строкам, кортеж (исход, id)
+    защищенной вставки - одна строка, если id есть.
+    """
+    if result is None:
+        return 0
+    if isinstance(result, Record):
+        return 1
+    if isinstance(result, (list, dict)):
+        return len(result)
+    if isinstance(result, tuple):
+        for item in result:
+            if isinstance(item, (Record, list, dict)):
+                return _count_rows(item)
+        return 1 if result and result[-1] is not None else 0
+    return 0
+
+class MethodStats:
+    """Счетчики одного метода Database"""
+
+    __slots__ = ('calls', 'errors', 'total', 'max', 'rows', 'wait', 'samples')
+
+    def __init__(self, samples: int):
+        self.calls = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+        self.wait = 0.0
+        # Последние замеры для перцентилей: память не растет с числом вызовов
+        self.samples: Deque[float] = deque(maxlen=samples)
+
+    def percentile(self, q: float) -> float:
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+class QueryMetrics:
+    """Время выполнения методов Database и журнал медленных вызовов.
+
+    Время метода включает ожидание соединения из пула и очереди писателя
+    (wait). Вызовы дольше slow_threshold секунд пишутся в лог.
+    """
+
+    def __init__(self, slow_threshold: float = 0.1, samples: int = 1000):
+        self.slow_threshold = slow_threshold
+        self.samples = samples
+        self.started = time.time()
+        self._methods: Dict[str, MethodStats] = {}
+
+    def observe(self, method: str, elapsed: float, wait: float, rows: int, error: bool = False):
+        stats = self._methods.get(method)
+        if stats is None:
+            stats = self._methods[method] = MethodStats(self.samples)
+
+        stats.calls += 1
+        stats.total += elapsed
+        stats.max = max(stats.max, elapsed)
+        stats.rows += rows
+        stats.wait += wait
+        stats.samples.append(elapsed)
+        if error:
+            stats.errors += 1
+
+        if elapsed >= self.slow_threshold:
+            logger.warning(
+                f"Медленный вызов Database.{method}: {elapsed * 1000:.1f} мс "
+                f"(ожидание соединения {wait * 1000:.1f} мс, строк {rows})"
+            )
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """Счетчики всех методов, самые затратные первыми (для выгрузки в метрики)"""
+        result = []
+        for method, stats in self._methods.items():
+            result.append({
+                'method': method,
+                'calls': stats.calls,
+                'errors': stats.errors,
+                'total_ms': stats.total * 1000,
+                'avg_ms': stats.total / stats.calls * 1000,
+                'p50_ms': stats.percentile(0.50) * 1000,
+                'p95_ms': stats.percentile(0.95) * 1000,
+                'p99_ms': stats.percentile(0.99) * 1000,
+                'max_ms': stats.max * 1000,
+                'rows': stats.rows,
+                'wait_ms': stats.wait * 1000,
+            })
+        result.sort(key=lambda item: item['total_ms'], reverse=True)
+        return result
+
+    def format_table(self, limit: int = 20) -> str:
+        """Таблица самых затратных методов моноширинным текстом"""
+        rows = self.snapshot()[:limit]
+        if not rows:
+            return "Вызовов еще не было"
+
+        width = max(len(row['method']) for row in rows)
+        lines = [f"{'метод':<{width}} {'вызовы':>7} {'всего':>8} {'p50':>7} {'p95':>7} {'p99':>7} {'строк':>7} {'ожид.':>7}"]
+        for row in rows:
+            lines.append(
+                f"{row['method']:<{width}} {row['calls']:>7} {row['total_ms']:>8.0f} "
+                f"{row['p50_ms']:>7.1f} {row['p95_ms']:>7.1f} {row['p99_ms']:>7.1f} "
+                f"{row['rows']:>7} {row['wait_ms']:>7.0f}"
+            )
+        return "\n".join(lines)
+
+    def reset(self):
+        self._methods.clear()
+        self.started = time.time()
+
+def instrument(cls: type) -> type:
+    """Декоратор класса: замерять каждый публичный async-метод.
+
+    Методы должны читать счетчики через self.metrics. Вложенные вызовы
+    учитываются у обоих методов (как включающее время в профилировщике).
+    """
+    for name, method in list(vars(cls).items()):
+        if name.startswith('_') or not inspect.iscoroutinefunction(method):
+            continue
+        setattr(cls, name, _timed(name, method))
+    return cls
+
+def _timed(name: str, method: Callable) -> Callable:
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        parent = _call_wait.get()
+        token = _call_wait.set([0.0])
+        started = time.perf_counter()
+        result = None
+        error = False
+        try:
+            result = await method(self, *args, **kwargs)
+            return result
+        except BaseException:
+            error = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            wait = _call_wait.get()[0]
+            _call_wait.reset(token)
+            if parent is not None:
+                parent[0] += wait
+            self.metrics.observe(name, elapsed, wait, _count_rows(result), error)
+
+    return wrapper
@@ -0,0 +1,650 @@
+import logging
+import re
+import aiosqlite
+from typing import List
+
+logger = logging.getLogger(__name__)
+
+# ============== МИГРАЦИИ ==============
+#
+# Каждая миграция - (версия, описание, шаги). Шаг - SQL-строка или
+# корутина, принимающая соединение. Версии только растут, уже
+# выпущенные миграции не редактируются - изменения схемы добавляются
+# новой миграцией в конец списка.
+
+async def _add_subscription_role(db: aiosqlite.Connection):
+    """Добавить поле role в таблицу subscriptions (если его еще нет)"""
+    async with db.execute("PRAGMA table_info(subscriptions)") as cursor:
+        column_names = [col[1] for col in await cursor.fetchall()]
+
+    if 'role' not in column_names:
+        await db.execute("ALTER TABLE subscriptions ADD COLUMN role TEXT DEFAULT 'model'")
+
+BASE_SCHEMA = [
+    # Таблица пользователей
+    """
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            role TEXT NOT NULL,
+            full_name TEXT,
+            city TEXT,
+            district TEXT,
+            phone_1 TEXT,
+            phone_2 TEXT,
+            activity_type TEXT,
+            address TEXT,
+            photo_id TEXT,
+            age INTEGER,
+            height INTEGER,
+            skin_type TEXT,
+            contraindications TEXT,
+            available_days TEXT,
+            experience TEXT,
+            photo_video_agree BOOLEAN,
+            portfolio_ids TEXT,
+            is_privileged BOOLEAN DEFAULT 0,
+            rating REAL DEFAULT 0.0,
+            registration_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            is_blocked BOOLEAN DEFAULT 0,
+            gdpr_consent BOOLEAN DEFAULT 0
+        )
+    """,
+    # Таблица заявок заказчиков
+    """
+        CREATE TABLE IF NOT EXISTS applications (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            customer_id INTEGER NOT NULL,
+            category TEXT NOT NULL,
+            subcategory TEXT NOT NULL,
+            city TEXT NOT NULL,
+            district TEXT NOT NULL,
+            date TEXT NOT NULL,
+            time TEXT NOT NULL,
+            duration TEXT NOT NULL,
+            requirements TEXT,
+            models_needed INTEGER NOT NULL,
+            experience_required BOOLEAN,
+            viewers_count INTEGER,
+            photo_video TEXT,
+            materials_payment TEXT,
+            participation_type TEXT NOT NULL,
+            payment_amount TEXT,
+            dress_code TEXT,
+            comment TEXT,
+            message_id INTEGER,
+            is_closed BOOLEAN DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (customer_id) REFERENCES users(user_id)
+        )
+    """,
+    # Таблица заявок моделей
+    """
+        CREATE TABLE IF NOT EXISTS model_applications (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            model_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            district TEXT NOT NULL,
+            category TEXT NOT NULL,
+            zones TEXT NOT NULL,
+            time_range TEXT NOT NULL,
+            photo_video TEXT,
+            participation_type TEXT NOT NULL,
+            note TEXT,
+            message_id INTEGER,
+            is_closed BOOLEAN DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (model_id) REFERENCES users(user_id)
+        )
+    """,
+    # Таблица откликов моделей на заявки заказчиков
+    """
+        CREATE TABLE IF NOT EXISTS responses (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            application_id INTEGER NOT NULL,
+            model_id INTEGER NOT NULL,
+            status TEXT DEFAULT 'pending',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (application_id) REFERENCES applications(id),
+            FOREIGN KEY (model_id) REFERENCES users(user_id)
+        )
+    """,
+    # Таблица откликов заказчиков на заявки моделей
+    """
+        CREATE TABLE IF NOT EXISTS customer_responses (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            model_application_id INTEGER NOT NULL,
+            customer_id INTEGER NOT NULL,
+            status TEXT DEFAULT 'pending',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (model_application_id) REFERENCES model_applications(id),
+            FOREIGN KEY (customer_id) REFERENCES users(user_id)
+        )
+    """,
+    # Таблица рейтингов
+    """
+        CREATE TABLE IF NOT EXISTS ratings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            application_id INTEGER NOT NULL,
+            rater_id INTEGER NOT NULL,
+            rated_id INTEGER NOT NULL,
+            came BOOLEAN,
+            prepared BOOLEAN,
+            requirements_met BOOLEAN,
+            work_again BOOLEAN,
+            location_convenient BOOLEAN,
+            conditions_met BOOLEAN,
+            attitude_correct BOOLEAN,
+            cooperate_again BOOLEAN,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (application_id) REFERENCES applications(id),
+            FOREIGN KEY (rater_id) REFERENCES users(user_id),
+            FOREIGN KEY (rated_id) REFERENCES users(user_id)
+        )
+    """,
+    # Таблица подписок
+    """
+        CREATE TABLE IF NOT EXISTS subscriptions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            start_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            end_date TIMESTAMP NOT NULL,
+            is_active BOOLEAN DEFAULT 1,
+            payment_id TEXT,
+            FOREIGN KEY (user_id) REFERENCES users(user_id)
+        )
+    """,
+]
+
+# Индексы под все WHERE / ORDER BY из database.py
+BASE_INDEXES = [
+    # users: статистика по ролям
+    "CREATE INDEX IF NOT EXISTS idx_users_role ON users (role)",
+
+    # applications: заявки заказчика, лента активных заявок и по категориям
+    "CREATE INDEX IF NOT EXISTS idx_applications_customer ON applications (customer_id, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_applications_active ON applications (created_at) WHERE is_closed = 0",
+    "CREATE INDEX IF NOT EXISTS idx_applications_active_category ON applications (category, created_at) WHERE is_closed = 0",
+
+    # model_applications: заявки модели
+    "CREATE INDEX IF NOT EXISTS idx_model_applications_model ON model_applications (model_id, created_at)",
+
+    # responses: проверка дубля, подсчет откликов, отклики модели
+    "CREATE INDEX IF NOT EXISTS idx_responses_application_model ON responses (application_id, model_id)",
+    "CREATE INDEX IF NOT EXISTS idx_responses_model ON responses (model_id, created_at)",
+
+    # customer_responses: проверка дубля и отклики на заявку модели
+    "CREATE INDEX IF NOT EXISTS idx_customer_responses_application_customer ON customer_responses (model_application_id, customer_id)",
+
+    # ratings: средний рейтинг, повторная оценка, оценка за отклик
+    "CREATE INDEX IF NOT EXISTS idx_ratings_rated ON ratings (rated_id)",
+    "CREATE INDEX IF NOT EXISTS idx_ratings_rater_rated ON ratings (rater_id, rated_id)",
+    "CREATE INDEX IF NOT EXISTS idx_ratings_application_rater ON ratings (application_id, rater_id)",
+
+    # subscriptions: активная подписка, пробный период, поиск истекших
+    "CREATE INDEX IF NOT EXISTS idx_subscriptions_active ON subscriptions (user_id, role, end_date) WHERE is_active = 1",
+    "CREATE INDEX IF NOT EXISTS idx_subscriptions_expiry ON subscriptions (end_date) WHERE is_active = 1",
+    "CREATE INDEX IF NOT EXISTS idx_subscriptions_user_role ON subscriptions (user_id, role, payment_id)",
+]
+
+def rating_score(prefix: str = "") -> str:
+    """SQL-выражение оценки 0..10 из восьми булевых полей рейтинга"""
+    fields = ('came', 'prepared', 'requirements_met', 'work_again',
+              'location_convenient', 'conditions_met', 'attitude_correct', 'cooperate_again')
+    total = " + ".join(f"CAST({prefix}{field} AS REAL)" for field in fields)
+    return f"(({total}) / 8.0 * 10)"
+
+# Агрегаты рейтинга в users: сумма и количество оценок поддерживаются
+# триггерами в той же транзакции, что и вставка оценки, а users.rating
+# хранит готовое среднее для чтения без пересчета
+RATING_AGGREGATES = [
+    "ALTER TABLE users ADD COLUMN rating_sum REAL NOT NULL DEFAULT 0",
+    "ALTER TABLE users ADD COLUMN rating_count INTEGER NOT NULL DEFAULT 0",
+    f"""
+        UPDATE users SET
+            rating_sum = COALESCE((SELECT SUM({rating_score()}) FROM ratings WHERE rated_id = users.user_id), 0),
+            rating_count = (SELECT COUNT({rating_score()}) FROM ratings WHERE rated_id = users.user_id),
+            rating = COALESCE((SELECT ROUND(AVG({rating_score()}), 1) FROM ratings WHERE rated_id = users.user_id), 0.0)
+    """,
+    f"""
+        CREATE TRIGGER IF NOT EXISTS trg_ratings_aggregate_insert
+        AFTER INSERT ON ratings
+        WHEN {rating_score('NEW.')} IS NOT NULL
+        BEGIN
+            UPDATE users SET
+                rating_sum = rating_sum + {rating_score('NEW.')},
+                rating_count = rating_count + 1,
+                rating = ROUND((rating_sum + {rating_score('NEW.')}) / (rating_count + 1), 1)
+            WHERE user_id = NEW.rated_id;
+        END
+    """,
+    f"""
+        CREATE TRIGGER IF NOT EXISTS trg_ratings_aggregate_delete
+        AFTER DELETE ON ratings
+        WHEN {rating_score('OLD.')} IS NOT NULL
+        BEGIN
+            UPDATE users SET
+                rating_sum = rating_sum - {rating_score('OLD.')},
+                rating_count = rating_count - 1,
+                rating = CASE WHEN rating_count > 1
+                    THEN ROUND((rating_sum - {rating_score('OLD.')}) / (rating_count - 1), 1)
+                    ELSE 0.0 END
+            WHERE user_id = OLD.rated_id;
+        END
+    """,
+]
+
+# Один отклик на заявку от одного участника: дубли (если успели появиться
+# из-за гонки проверок) удаляются, остается самый ранний отклик
+UNIQUE_RESPONSES = [
+    """
+        DELETE FROM responses WHERE id NOT IN (
+            SELECT MIN(id) FROM responses GROUP BY application_id, model_id
+        )
+    """,
+    """
+        DELETE FROM customer_responses WHERE id NOT IN (
+            SELECT MIN(id) FROM customer_responses GROUP BY model_application_id, customer_id
+        )
+    """,
+    "DROP INDEX IF EXISTS idx_responses_application_model",
+    "DROP INDEX IF EXISTS idx_customer_responses_application_customer",
+    "CREATE UNIQUE INDEX IF NOT EXISTS uq_responses_application_model ON responses (application_id, model_id)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS uq_customer_responses_application_customer ON customer_responses (model_application_id, customer_id)",
+]
+
+# Время хранится в секундах Unix (UTC). Для каждого столбца указано,
+# в какой зоне было старое текстовое значение: CURRENT_TIMESTAMP - UTC,
+# end_date подписок писался из datetime.now() - локальное время
+EPOCH_COLUMNS = {
+    'users': {'registration_date': 'utc'},
+    'applications': {'created_at': 'utc'},
+    'model_applications': {'created_at': 'utc'},
+    'responses': {'created_at': 'utc'},
+    'customer_responses': {'created_at': 'utc'},
+    'ratings': {'created_at': 'utc'},
+    'subscriptions': {'start_date': 'utc', 'end_date': 'local'},
+}
+
+EPOCH_NOW = "(CAST(strftime('%s', 'now') AS INTEGER))"
+
+async def _rebuild_with_epoch(db: aiosqlite.Connection, table: str, columns: dict):
+    """Пересоздать таблицу с INTEGER-столбцами времени.
+
+    SQLite не умеет менять тип и DEFAULT столбца, поэтому таблица
+    пересоздается: новая таблица по текущему DDL, копирование с
+    конвертацией, замена старой и восстановление индексов.
+    """
+    async with db.execute(
+        "SELECT type, sql FROM sqlite_master WHERE tbl_name = ? AND sql IS NOT NULL", (table,)
+    ) as cursor:
+        objects = await cursor.fetchall()
+
+    create_sql = next(sql for kind, sql in objects if kind == 'table')
+    indexes = [sql for kind, sql in objects if kind == 'index']
+
+    new_table = f"{table}_epoch"
+    create_sql = re.sub(r'^CREATE TABLE\s+(IF NOT EXISTS\s+)?\S+', f'CREATE TABLE {new_table}', create_sql)
+    for column in columns:
+        create_sql, replaced = re.subn(
+            rf'\b{column}\s+TIMESTAMP(\s+NOT NULL)?(\s+DEFAULT\s+CURRENT_TIMESTAMP)?',
+            lambda m: f"{column} INTEGER{m.group(1) or ''}" + (f" DEFAULT {EPOCH_NOW}" if m.group(2) else ''),
+            create_sql
+        )
+        if not replaced:
+            raise RuntimeError(f"Не найден столбец {table}.{column}")
+
+    async with db.execute(f"PRAGMA table_info({table})") as cursor:
+        names = [col[1] for col in await cursor.fetchall()]
+
+    select = []
+    for name in names:
+        if columns.get(name) == 'utc':
+            select.append(f"CAST(strftime('%s', {name}) AS INTEGER)")
+        elif columns.get(name) == 'local':
+            select.append(f"CAST(strftime('%s', {name}, 'utc') AS INTEGER)")
+        else:
+            select.append(name)
+
+    await db.execute(create_sql)
+    await db.execute(
+        f"INSERT INTO {new_table} ({', '.join(names)}) SELECT {', '.join(select)} FROM {table}"
+    )
+    await db.execute(f"DROP TABLE {table}")
+    await db.execute(f"ALTER TABLE {new_table} RENAME TO {table}")
+    for sql in indexes:
+        await db.execute(sql)
+
+async def _convert_timestamps_to_epoch(db: aiosqlite.Connection):
+    """Перевести все столбцы времени в секунды Unix"""
+    # Триггеры ссылаются на другие таблицы (ratings -> users): пока таблица
+    # пересоздается, RENAME проверяет их и падает, поэтому снимаем их на время
+    async with db.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'trigger'"
+    ) as cursor:
+        triggers = await cursor.fetchall()
+    for name, _ in triggers:
+        await db.execute(f"DROP TRIGGER {name}")
+
+    for table, columns in EPOCH_COLUMNS.items():
+        await _rebuild_with_epoch(db, table, columns)
+
+    for _, sql in triggers:
+        await db.execute(sql)
+
+# Выборка кандидатов в архив идет по created_at, а не по индексам просмотра
+ARCHIVE_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_applications_created ON applications (created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_model_applications_created ON model_applications (created_at)",
+]
+
+# Полнотекстовый поиск по заявкам: FTS5 с внешним содержимым (текст
+# хранится только в applications), синхронизация триггерами.
+# prefix - индексы префиксов, поиск идет по началам слов ("шуга*")
+APPLICATIONS_FTS_COLUMNS = ['category', 'subcategory', 'city', 'district', 'requirements', 'comment', 'dress_code']
+
+def _fts_values(prefix: str) -> str:
+    return ', '.join(f"{prefix}.{col}" for col in APPLICATIONS_FTS_COLUMNS)
+
+APPLICATIONS_FTS = [
+    f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS applications_fts USING fts5(
+            {', '.join(APPLICATIONS_FTS_COLUMNS)},
+            content = 'applications', content_rowid = 'id',
+            tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+        )
+    """,
+    f"""
+        CREATE TRIGGER IF NOT EXISTS trg_applications_fts_insert
+        AFTER INSERT ON applications
+        BEGIN
+            INSERT INTO applications_fts (rowid, {', '.join(APPLICATIONS_FTS_COLUMNS)})
+            VALUES (new.id, {_fts_values('new')});
+        END
+    """,
+    f"""
+        CREATE TRIGGER IF NOT EXISTS trg_applications_fts_delete
+        AFTER DELETE ON applications
+        BEGIN
+            INSERT INTO applications_fts (applications_fts, rowid, {', '.join(APPLICATIONS_FTS_COLUMNS)})
+            VALUES ('delete', old.id, {_fts_values('old')});
+        END
+    """,
+    # Смена is_closed или message_id индекс не трогает
+    f"""
+        CREATE TRIGGER IF NOT EXISTS trg_applications_fts_update
+        AFTER UPDATE OF {', '.join(APPLICATIONS_FTS_COLUMNS)} ON applications
+        BEGIN
+            INSERT INTO applications_fts (applications_fts, rowid, {', '.join(APPLICATIONS_FTS_COLUMNS)})
+            VALUES ('delete', old.id, {_fts_values('old')});
+            INSERT INTO applications_fts (rowid, {', '.join(APPLICATIONS_FTS_COLUMNS)})
+            VALUES (new.id, {_fts_values('new')});
+        END
+    """,
+    "INSERT INTO applications_fts (applications_fts) VALUES ('rebuild')",
+]
+
+# Справочник районов (заполняется из файла данных при запуске) и
+# целочисленные district_id: фильтр по месту - равенство по индексу.
+# Текстовое поле district остается как ввел пользователь
+DISTRICT_IDS = [
+    """
+        CREATE TABLE IF NOT EXISTS districts (
+            id INTEGER PRIMARY KEY,
+            city TEXT NOT NULL,
+            name TEXT NOT NULL
+        )
+    """,
+    "ALTER TABLE users ADD COLUMN district_id INTEGER",
+    "ALTER TABLE applications ADD COLUMN district_id INTEGER",
+    "ALTER TABLE model_applications ADD COLUMN district_id INTEGER",
+    "CREATE INDEX IF NOT EXISTS idx_users_role_district ON users (role, district_id)",
+    "CREATE INDEX IF NOT EXISTS idx_applications_active_district ON applications (district_id, created_at) WHERE is_closed = 0",
+    "CREATE INDEX IF NOT EXISTS idx_model_applications_district ON model_applications (district_id, created_at)",
+]
+
+# Категории, с которыми пользователь уже работал (через запятую): модель -
+# по своим заявкам и откликам, заказчик - по своим заявкам. Основа
+# подбора исполнителей (utils/matching.py); дальше поддерживается Database
+USER_CATEGORIES = [
+    "ALTER TABLE users ADD COLUMN categories TEXT",
+    """
+        UPDATE users SET categories = (
+            SELECT group_concat(category) FROM (
+                SELECT category FROM model_applications WHERE model_id = users.user_id
+                UNION
+                SELECT a.category FROM responses r
+                JOIN applications a ON a.id = r.application_id
+                WHERE r.model_id = users.user_id
+                UNION
+                SELECT category FROM applications WHERE customer_id = users.user_id
+            )
+        )
+    """,
+]
+
+# Исходящие сообщения: пишутся в одной транзакции с изменением данных,
+# отправляются фоновой задачей (utils/outbox.py). next_attempt_at NULL -
+# сообщение не доставлено и больше не повторяется
+OUTBOX = [
+    f"""
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            reply_markup TEXT,
+            ref_table TEXT,
+            ref_id INTEGER,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at INTEGER,
+            last_error TEXT,
+            created_at INTEGER DEFAULT {EPOCH_NOW}
+        )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_outbox_pending ON outbox (next_attempt_at) WHERE next_attempt_at IS NOT NULL",
+]
+
+# Рассылки администратора: курсор по user_id и счетчики сохраняются после
+# каждой пачки, поэтому после перезапуска рассылка продолжается с места
+# остановки. bot_blocked - пользователь заблокировал бота, ему не пишем
+BROADCASTS = [
+    f"""
+        CREATE TABLE IF NOT EXISTS broadcasts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            text TEXT NOT NULL,
+            role TEXT,
+            status TEXT NOT NULL DEFAULT 'running',
+            last_user_id INTEGER NOT NULL DEFAULT 0,
+            sent INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            blocked INTEGER NOT NULL DEFAULT 0,
+            created_by INTEGER,
+            created_at INTEGER DEFAULT {EPOCH_NOW},
+            finished_at INTEGER
+        )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_broadcasts_status ON broadcasts (status)",
+    "ALTER TABLE users ADD COLUMN bot_blocked BOOLEAN DEFAULT 0",
+]
+
+# Контрольные суммы файлов данных, загруженных в БД (справочник районов):
+# файл перечитывается в таблицу, только если он изменился
+DATA_VERSIONS = [
+    f"""
+        CREATE TABLE IF NOT EXISTS data_versions (
+            name TEXT PRIMARY KEY,
+            checksum TEXT NOT NULL,
+            loaded_at INTEGER DEFAULT {EPOCH_NOW}
+        )
+    """,
+]
+
+# Редактирование публикаций через outbox: message_id задан - сообщение
+# уже отправлено и его нужно отредактировать. По (ref_table, ref_id)
+# находится неотправленная публикация строки, чтобы переписать ее
+OUTBOX_EDITS = [
+    "ALTER TABLE outbox ADD COLUMN message_id INTEGER",
+    "CREATE INDEX IF NOT EXISTS idx_outbox_ref ON outbox (ref_table, ref_id) WHERE ref_id IS NOT NULL",
+]
+
+# idx_users_role_district (role, district_id) покрывает поиск по роли,
+# отдельный индекс по role только удорожает запись в users
+DROP_USERS_ROLE_INDEX = [
+    "DROP INDEX IF EXISTS idx_users_role",
+]
+
+MIGRATIONS = [
+    (1, "Базовая схема", BASE_SCHEMA),
+    (2, "Роль в подписках", [_add_subscription_role]),
+    (3, "Индексы", BASE_INDEXES),
+    (4, "Агрегаты рейтинга", RATING_AGGREGATES),
+    (5, "Уникальные отклики", UNIQUE_RESPONSES),
+    (6, "Время в секундах Unix", [_convert_timestamps_to_epoch]),
+    (7, "Индексы для архивации", ARCHIVE_INDEXES),
+    (8, "Полнотекстовый поиск заявок", APPLICATIONS_FTS),
+    (9, "Идентификаторы районов", DISTRICT_IDS),
+    (10, "Категории пользователей", USER_CATEGORIES),
+    (11, "Исходящие сообщения", OUTBOX),
+    (12, "Рассылки", BROADCASTS),
+    (13, "Версии файлов данных", DATA_VERSIONS),
+    (14, "Редактирование публикаций", OUTBOX_EDITS),
+    (15, "Удаление лишнего индекса users", DROP_USERS_ROLE_INDEX),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+async def get_schema_version(db: aiosqlite.Connection) -> int:
+    """Текущая версия схемы (0 - если миграции еще не применялись)"""
+    async with db.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'schema_version'"
+    ) as cursor:
+        if await cursor.fetchone() is None:
+            return 0
+
+    async with db.execute("SELECT MAX(version) FROM schema_version") as cursor:
+        row = await cursor.fetchone()
+        return row[0] if row and row[0] is not None else 0
+
+async def migrate(db: aiosqlite.Connection) -> List[int]:
+    """Применить недостающие миграции, вернуть список примененных версий"""
+    current = await get_schema_version(db)
+    if current >= LATEST_VERSION:
+        return []
+
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    # Пересоздание таблиц в миграциях требует выключенных внешних ключей,
+    # а менять foreign_keys внутри транзакции SQLite не позволяет
+    async with db.execute("PRAGMA foreign_keys") as cursor:
+        foreign_keys = (await cursor.fetchone())[0]
+    if foreign_keys:
+        await db.execute("PRAGMA foreign_keys = OFF")
+
+    try:
+        return await _apply_migrations(db, current)
+    finally:
+        if foreign_keys:
+            await db.execute("PRAGMA foreign_keys = ON")
+
+async def _apply_migrations(db: aiosqlite.Connection, current: int) -> List[int]:
+    """Применить миграции новее current, каждую в своей транзакции"""
+    applied = []
+    for version, description, steps in MIGRATIONS:
+        if version <= current:
+            continue
+
+        # Каждая миграция - отдельная транзакция
+        await db.execute("BEGIN")
+        try:
+            for step in steps:
+                if isinstance(step, str):
+                    await db.execute(step)
+                else:
+                    await step(db)
+
+            await db.execute(
+                "INSERT INTO schema_version (version, description) VALUES (?, ?)",
+                (version, description)
+            )
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
+
+        applied.append(version)
+        logger.info(f"Применена миграция {version}: {description}")
+
+    return applied
+
+# ============== АРХИВ ==============
+#
+# Закрытые и старые заявки вместе с откликами переносятся в отдельный
+# файл БД, подключенный к каждому соединению как схема archive. Таблицы
+# архива повторяют столбцы основных таблиц без ограничений и внешних
+# ключей; новые столбцы основных таблиц добавляются в архив при запуске
+# после миграции. Версия схемы архива хранится в его PRAGMA user_version.
+
+# Таблица архива -> индексы под чтение истории (столбцы через запятую)
+ARCHIVE_TABLES = {
+    'applications': ['customer_id, created_at'],
+    'responses': ['application_id', 'model_id, created_at'],
+    'model_applications': ['model_id, created_at'],
+    'customer_responses': ['model_application_id'],
+}
+
+# Заявки переносятся вместе с откликами: (таблица, таблица откликов, ключ заявки)
+ARCHIVE_GROUPS = [
+    ('applications', 'responses', 'application_id'),
+    ('model_applications', 'customer_responses', 'model_application_id'),
+]
+
+# Ревизия таблиц и индексов архива - увеличить при изменении ARCHIVE_TABLES
+ARCHIVE_REVISION = 1
+
+# Архив актуален для версии основной схемы и ревизии его индексов
+ARCHIVE_VERSION = LATEST_VERSION * 1000 + ARCHIVE_REVISION
+
+async def prepare_archive(db: aiosqlite.Connection) -> bool:
+    """Создать таблицы архива или дополнить их новыми столбцами основных таблиц.
+
+    Если схема архива актуальна, DDL не выполняется. Возвращает True,
+    если архив был изменен.
+    """
+    async with db.execute("PRAGMA archive.user_version") as cursor:
+        if (await cursor.fetchone())[0] == ARCHIVE_VERSION:
+            return False
+
+    await db.execute("BEGIN")
+    try:
+        for table, indexes in ARCHIVE_TABLES.items():
+            await db.execute(
+                f"CREATE TABLE IF NOT EXISTS archive.{table} AS SELECT * FROM main.{table} WHERE 0"
+            )
+
+            async with db.execute(f"PRAGMA main.table_info({table})") as cursor:
+                columns = [(col[1], col[2]) for col in await cursor.fetchall()]
+            async with db.execute(f"PRAGMA archive.table_info({table})") as cursor:
+                existing = {col[1] for col in await cursor.fetchall()}
+            for name, column_type in columns:
+                if name not in existing:
+                    await db.execute(f"ALTER TABLE archive.{table} ADD COLUMN {name} {column_type}")
+
+            # Уникальный id делает повторный перенос пачки безопасным
+            await db.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS archive.uq_{table}_id ON {table} (id)")
+            for index in indexes:
+                name = '_'.join(col.strip() for col in index.split(','))
+                await db.execute(f"CREATE INDEX IF NOT EXISTS archive.idx_{table}_{name} ON {table} ({index})")
+        await db.execute(f"PRAGMA archive.user_version = {ARCHIVE_VERSION}")
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
+
+    logger.info(f"Схема архива обновлена до версии {ARCHIVE_VERSION}")
+    return True
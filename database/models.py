@@ -1 +1,144 @@
-pass
\ No newline at end of file
+from enum import Enum
+from typing import Any, Dict, Iterator, NamedTuple, Optional, Tuple
+
+class ResponseOutcome(str, Enum):
+    """Результат попытки откликнуться на заявку"""
+    CREATED = "created"        # отклик создан
+    DUPLICATE = "duplicate"    # уже откликался на эту заявку
+    FULL = "full"              # достигнут лимит откликов
+    CLOSED = "closed"          # заявка закрыта
+    NOT_FOUND = "not_found"    # заявки нет
+
+class OutboxMessage(NamedTuple):
+    """Исходящее сообщение для таблицы outbox.
+
+    reply_markup - клавиатура в JSON (см. utils.outbox.outgoing).
+    ref_table / ref_id - строка, в которую после отправки записывается
+    message_id (публикация заявки в канале). message_id задан - не новое
+    сообщение, а редактирование уже отправленного.
+    """
+    chat_id: int
+    text: str
+    reply_markup: Optional[str] = None
+    ref_table: Optional[str] = None
+    ref_id: Optional[int] = None
+    message_id: Optional[int] = None
+
+# ============== ЗАПИСИ ==============
+
+class Record:
+    """Неизменяемая строка результата запроса.
+
+    Хранит только кортеж значений строки (один слот на объект), имена
+    столбцов живут в классе. Поддерживает чтение как словарь
+    (record['field'], get, keys, dict(record)) и как атрибуты (record.field).
+
+    Конкретный класс создается на каждый набор столбцов запроса и
+    кэшируется, поэтому новые столбцы из миграций подхватываются сами.
+    """
+
+    __slots__ = ('_values',)
+
+    _fields: Tuple[str, ...] = ()
+    _index: Dict[str, int] = {}
+    _layouts: Dict[Tuple[str, ...], type]
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._layouts = {}
+
+    def __init__(self, values: Tuple[Any, ...]):
+        self._values = values
+
+    @classmethod
+    def row_factory(cls, cursor, row: Tuple[Any, ...]) -> "Record":
+        """row_factory для sqlite3: запись этого типа прямо из кортежа строки"""
+        fields = tuple(column[0] for column in cursor.description)
+        layout = cls._layouts.get(fields)
+        if layout is None:
+            layout = type(cls.__name__, (cls,), {
+                '__slots__': (),
+                '_fields': fields,
+                '_index': {name: i for i, name in enumerate(fields)},
+            })
+            # Класс раскладки не должен заводить свой кэш раскладок
+            layout._layouts = cls._layouts
+            cls._layouts[fields] = layout
+        return layout(row)
+
+    def __getitem__(self, key: str) -> Any:
+        try:
+            return self._values[self._index[key]]
+        except KeyError:
+            raise KeyError(key) from None
+
+    def __getattr__(self, name: str) -> Any:
+        index = type(self)._index.get(name)
+        if index is None:
+            raise AttributeError(f"{type(self).__name__} has no field {name!r}")
+        return self._values[index]
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._index
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._fields)
+
+    def __len__(self) -> int:
+        return len(self._fields)
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, Record):
+            return self._fields == other._fields and self._values == other._values
+        if isinstance(other, dict):
+            return dict(self) == other
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        fields = ', '.join(f"{name}={value!r}" for name, value in self.items())
+        return f"{type(self).__name__}({fields})"
+
+    def get(self, key: str, default: Any = None) -> Any:
+        index = self._index.get(key)
+        return self._values[index] if index is not None else default
+
+    def keys(self) -> Tuple[str, ...]:
+        return self._fields
+
+    def values(self) -> Tuple[Any, ...]:
+        return self._values
+
+    def items(self) -> Iterator[Tuple[str, Any]]:
+        return zip(self._fields, self._values)
+
+class User(Record):
+    """Строка users"""
+    __slots__ = ()
+
+class Application(Record):
+    """Строка applications"""
+    __slots__ = ()
+
+class ModelApplication(Record):
+    """Строка model_applications"""
+    __slots__ = ()
+
+class Response(Record):
+    """Строка responses (в том числе с полями из JOIN)"""
+    __slots__ = ()
+
+class CustomerResponse(Record):
+    """Строка customer_responses (в том числе с полями из JOIN)"""
+    __slots__ = ()
+
+class Subscription(Record):
+    """Строка subscriptions"""
+    __slots__ = ()
+
+class OutboxEntry(Record):
+    """Строка outbox"""
+    __slots__ = ()
+
+class Broadcast(Record):
+    """Строка broadcasts"""
+    __slots__ = ()
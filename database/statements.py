@@ -0,0 +1,74 @@
+import aiosqlite
+from typing import Dict, Any, Tuple, List, FrozenSet
+
+class StatementRegistry:
+    """Реестр SQL для динамических INSERT/UPDATE.
+
+    Знает колонки каждой таблицы (читает их из схемы после миграций),
+    отклоняет неизвестные колонки и кэширует текст запроса для каждого
+    набора колонок. Один и тот же текст запроса попадает в кэш
+    подготовленных выражений sqlite3 на каждом соединении пула.
+    """
+
+    def __init__(self):
+        self._columns: Dict[str, FrozenSet[str]] = {}
+        self._cache: Dict[tuple, str] = {}
+
+    async def load(self, db: aiosqlite.Connection):
+        """Загрузить колонки всех таблиц из схемы БД"""
+        async with db.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+        ) as cursor:
+            tables = [row[0] for row in await cursor.fetchall()]
+
+        columns = {}
+        for table in tables:
+            async with db.execute(f"PRAGMA table_info({table})") as cursor:
+                columns[table] = frozenset(col[1] for col in await cursor.fetchall())
+
+        self._columns = columns
+        self._cache.clear()
+
+    def columns(self, table: str) -> FrozenSet[str]:
+        """Колонки таблицы"""
+        if table not in self._columns:
+            raise ValueError(f"Неизвестная таблица: {table}")
+        return self._columns[table]
+
+    def _check(self, table: str, columns: Tuple[str, ...], key: str = None):
+        """Проверить колонки до обращения к БД"""
+        if not columns:
+            raise ValueError(f"Не переданы колонки для таблицы {table}")
+
+        known = self.columns(table)
+        unknown = [col for col in columns + ((key,) if key else ()) if col not in known]
+        if unknown:
+            raise ValueError(f"Неизвестные колонки таблицы {table}: {', '.join(unknown)}")
+        if key in columns:
+            raise ValueError(f"Колонку {key} таблицы {table} нельзя изменять")
+
+    def insert(self, table: str, values: Dict[str, Any]) -> Tuple[str, List[Any]]:
+        """INSERT для набора колонок: (sql, параметры)"""
+        columns = tuple(sorted(values))
+        cache_key = ('insert', table, columns)
+
+        sql = self._cache.get(cache_key)
+        if sql is None:
+            self._check(table, columns)
+            sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['?'] * len(columns))})"
+            self._cache[cache_key] = sql
+
+        return sql, [values[col] for col in columns]
+
+    def update(self, table: str, key: str, key_value: Any, values: Dict[str, Any]) -> Tuple[str, List[Any]]:
+        """UPDATE по ключу для набора колонок: (sql, параметры)"""
+        columns = tuple(sorted(values))
+        cache_key = ('update', table, key, columns)
+
+        sql = self._cache.get(cache_key)
+        if sql is None:
+            self._check(table, columns, key)
+            sql = f"UPDATE {table} SET {', '.join(f'{col} = ?' for col in columns)} WHERE {key} = ?"
+            self._cache[cache_key] = sql
+
+        return sql, [values[col] for col in columns] + [key_value]
@@ -1,8 +1,13 @@
+import html
+from datetime import datetime
+
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery
 from aiogram.filters import Command
 
 from database.database import Database
+from middlewares.rate_governor import RateGovernor
+from utils.broadcast import BroadcastEngine
 from config import Config
 
 router = Router()
@@ -17,6 +22,10 @@ async def admin_panel(message: Message, db: Database):
         "🔧 Админ-панель\n\n"
         "Доступные команды:\n"
         "/stats - Статистика\n"
+        "/dbstats [reset] - Время запросов к БД\n"
+        "/apistats - Очередь запросов к Telegram\n"
+        "/broadcast <all|models|customers|viewers> <текст> - Рассылка\n"
+        "/broadcast status | cancel <id> - Ход рассылок\n"
         "/privileged <user_id> - Выдать привилегии модели\n"
         "/unprivileged <user_id> - Забрать привилегии\n"
         "/block <user_id> - Заблокировать пользователя\n"
@@ -28,8 +37,8 @@ async def show_stats(message: Message, db: Database):
     if message.from_user.id not in Config.ADMIN_IDS:
         return
     
-    # Собираем статистику
-    async with db.db_path as conn:
+    # Собираем статистику одним снимком
+    async with db.read(snapshot=True) as conn:
         async with conn.execute("SELECT COUNT(*) FROM users WHERE role = 'customer'") as cursor:
             customers = (await cursor.fetchone())[0]
         
@@ -111,4 +120,86 @@ async def unblock_user(message: Message, db: Database):
         await db.unblock_user(user_id)
         await message.answer(f"✅ Пользователь {user_id} разблокирован.")
     except (IndexError, ValueError):
-        await message.answer("❌ Использование: /unblock <user_id>")
\ No newline at end of file
+        await message.answer("❌ Использование: /unblock <user_id>")
+
+@router.message(Command("dbstats"))
+async def show_db_stats(message: Message, db: Database):
+    if message.from_user.id not in Config.ADMIN_IDS:
+        return
+    
+    args = message.text.split()
+    if len(args) > 1 and args[1] == "reset":
+        db.metrics.reset()
+        await message.answer("✅ Счетчики запросов сброшены.")
+        return
+    
+    cache = db.user_cache.stats()
+    outbox = await db.get_outbox_stats()
+    await message.answer(
+        f"🗄 Запросы к БД (мс, с {datetime.fromtimestamp(db.metrics.started).strftime('%d.%m.%Y %H:%M')})\n"
+        f"<pre>{html.escape(db.metrics.format_table())}</pre>\n"
+        f"Кэш профилей: {cache['entries']} записей, попаданий {cache['hit_rate'] * 100:.0f}%\n"
+        f"Исходящие: в очереди {outbox['pending']}, не доставлено {outbox['failed']}",
+        parse_mode="HTML"
+    )
+
+@router.message(Command("apistats"))
+async def show_api_stats(message: Message, rate_governor: RateGovernor):
+    if message.from_user.id not in Config.ADMIN_IDS:
+        return
+    
+    stats = rate_governor.stats()
+    lines = [
+        "📡 Запросы к Telegram",
+        f"Чатов с лимитом: {stats['chats']}, RetryAfter: {stats['retry_after']}",
+    ]
+    for priority, title in (('interactive', 'Ответы пользователям'), ('background', 'Фоновые отправки')):
+        item = stats[priority]
+        lines.append(
+            f"{title}: ждут {item['waiting']}, всего {item['requests']}, "
+            f"ожидание {item['avg_wait_ms']:.0f} мс (макс. {item['max_wait_ms']:.0f} мс)"
+        )
+    await message.answer("\n".join(lines))
+
+# Аудитории рассылки -> роль в users (None - все пользователи)
+BROADCAST_AUDIENCES = {'all': None, 'models': 'model', 'customers': 'customer', 'viewers': 'viewer'}
+
+@router.message(Command("broadcast"))
+async def broadcast(message: Message, db: Database, broadcaster: BroadcastEngine):
+    if message.from_user.id not in Config.ADMIN_IDS:
+        return
+    
+    args = message.text.split(maxsplit=2)
+    
+    if len(args) > 1 and args[1] == "status":
+        broadcasts = await db.get_recent_broadcasts()
+        if not broadcasts:
+            await message.answer("Рассылок еще не было.")
+            return
+        lines = ["📣 Последние рассылки:"]
+        for item in broadcasts:
+            lines.append(
+                f"#{item['id']} [{item['status']}] {item['role'] or 'all'}: отправлено {item['sent']}, "
+                f"ошибок {item['failed']}, заблокировали бота {item['blocked']}"
+            )
+        await message.answer("\n".join(lines))
+        return
+    
+    if len(args) > 1 and args[1] == "cancel":
+        try:
+            broadcast_id = int(args[2])
+        except (IndexError, ValueError):
+            await message.answer("❌ Использование: /broadcast cancel <id>")
+            return
+        if await broadcaster.cancel(broadcast_id):
+            await message.answer(f"✅ Рассылка #{broadcast_id} отменена.")
+        else:
+            await message.answer(f"❌ Рассылка #{broadcast_id} не найдена или уже завершена.")
+        return
+    
+    if len(args) < 3 or args[1] not in BROADCAST_AUDIENCES:
+        await message.answer("❌ Использование: /broadcast <all|models|customers|viewers> <текст>")
+        return
+    
+    broadcast_id = await broadcaster.start(args[2], BROADCAST_AUDIENCES[args[1]], message.from_user.id)
+    await message.answer(f"✅ Рассылка #{broadcast_id} запущена. Ход: /broadcast status")
@@ -1,8 +1,12 @@
-from aiogram import Router, F, Bot
+from typing import Optional
+
+from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
 
 from database.database import Database
+from utils.matching import MatchingEngine
+from utils.outbox import outgoing
 from utils.states import ApplicationStates
 from keyboards.inline import *
 from utils.texts import *
@@ -13,10 +17,9 @@ router = Router()
 # ============== МЕНЮ ЗАКАЗЧИКА ==============
 
 @router.callback_query(F.data == "create_application")
-async def start_create_application(callback: CallbackQuery, state: FSMContext, db: Database):
+async def start_create_application(callback: CallbackQuery, state: FSMContext, db: Database, user: dict):
     await callback.answer()
     
-    user = await db.get_user(callback.from_user.id)
     if not user or user['role'] != 'customer':
         await callback.message.answer(ACCESS_DENIED)
         return
@@ -73,7 +76,7 @@ async def view_application(callback: CallbackQuery, db: Database):
     )
 
 @router.callback_query(F.data.startswith("close_app_"))
-async def close_application(callback: CallbackQuery, db: Database, bot: Bot):
+async def close_application(callback: CallbackQuery, db: Database):
     await callback.answer()
     
     app_id = int(callback.data.split("_")[2])
@@ -85,16 +88,8 @@ async def close_application(callback: CallbackQuery, db: Database, bot: Bot):
     
     await db.close_application(app_id)
     
-    # Обновляем сообщение в канале
-    if app['message_id']:
-        try:
-            await bot.edit_message_reply_markup(
-                chat_id=Config.CHAT_ID,
-                message_id=app['message_id'],
-                reply_markup=get_application_keyboard(app_id, is_closed=True)
-            )
-        except Exception:
-            pass
+    # Обновляем публикацию в канале
+    await update_channel_post(db, app_id)
     
     await callback.message.edit_text(
         "✅ Набор закрыт!",
@@ -106,7 +101,7 @@ async def view_responses(callback: CallbackQuery, db: Database):
     await callback.answer()
     
     app_id = int(callback.data.split("_")[2])
-    responses = await db.get_application_responses(app_id)
+    responses = await db.get_application_responses_with_models(app_id)
     
     if not responses:
         await callback.message.answer("На эту заявку пока нет откликов.")
@@ -115,14 +110,14 @@ async def view_responses(callback: CallbackQuery, db: Database):
     text = f"📊 Отклики на заявку ({len(responses)}):\n\n"
     
     for resp in responses:
-        model = await db.get_user(resp['model_id'])
         status_emoji = {
             'pending': '⏳',
             'accepted': '✅',
             'rejected': '❌'
         }
         emoji = status_emoji.get(resp['status'], '⏳')
-        text += f"{emoji} {model['full_name']} - {resp['status']}\n"
+        model_name = resp['model_full_name'] or f"ID {resp['model_id']}"
+        text += f"{emoji} {model_name} - {resp['status']}\n"
     
     await callback.message.answer(text)
 
@@ -288,7 +283,8 @@ async def process_comment(message: Message, state: FSMContext, db: Database):
     )
 
 @router.callback_query(ApplicationStates.confirm, F.data == "confirm_publish")
-async def confirm_publish_application(callback: CallbackQuery, state: FSMContext, db: Database, bot: Bot):
+async def confirm_publish_application(callback: CallbackQuery, state: FSMContext, db: Database,
+                                      matching: MatchingEngine):
     await callback.answer()
     
     data = await state.get_data()
@@ -309,9 +305,16 @@ async def confirm_publish_application(callback: CallbackQuery, state: FSMContext
     # Новая заявка - публикуем
     customer = await db.get_user(callback.from_user.id)
     
-    # Создаем заявку в БД
+    # Форматируем текст для канала
+    app_text = format_application_for_channel(data, customer)
+    
+    # Создаем заявку в БД, публикация в канале уходит в outbox той же транзакцией
     app_id = await db.create_application(
         customer_id=callback.from_user.id,
+        messages=lambda app_id: [outgoing(
+            Config.CHAT_ID, app_text, get_application_keyboard(app_id, is_closed=False),
+            ref_table='applications', ref_id=app_id
+        )],
         category=data['category'],
         subcategory=data['subcategory'],
         city=data['city'],
@@ -331,26 +334,15 @@ async def confirm_publish_application(callback: CallbackQuery, state: FSMContext
         comment=data.get('comment')
     )
     
-    # Форматируем текст для канала
-    app_text = format_application_for_channel(data, customer)
+    await callback.message.edit_text(APPLICATION_CREATED)
+    await state.clear()
     
-    # Публикуем в канал
-    try:
-        msg = await bot.send_message(
-            chat_id=Config.CHAT_ID,
-            text=app_text,
-            reply_markup=get_application_keyboard(app_id, is_closed=False)
-        )
-        
-        # Сохраняем message_id
-        await db.update_application(app_id, message_id=msg.message_id)
-        
-        await callback.message.edit_text(APPLICATION_CREATED)
-        await state.clear()
-        
-    except Exception as e:
-        await callback.message.edit_text(f"❌ Ошибка публикации: {e}")
-        await state.clear()
+    # Личные уведомления подходящим моделям района
+    app = await db.get_application(app_id)
+    await db.enqueue_messages(
+        outgoing(model_id, f"{MATCHING_APPLICATION}\n\n{app_text}", get_application_keyboard(app_id, is_closed=False))
+        for model_id in await matching.match_models(app)
+    )
 
 @router.callback_query(ApplicationStates.confirm, F.data == "confirm_edit")
 async def confirm_edit_application(callback: CallbackQuery, state: FSMContext):
@@ -474,7 +466,7 @@ async def process_edit_field_selection(callback: CallbackQuery, state: FSMContex
         await callback.message.edit_text(prompt)
 
 @router.message(ApplicationStates.edit_value)
-async def process_edit_value_text(message: Message, state: FSMContext, db: Database, bot: Bot):
+async def process_edit_value_text(message: Message, state: FSMContext, db: Database):
     data = await state.get_data()
     field_name = data.get('edit_field_name')
     app_id = data.get('editing_app_id')
@@ -485,22 +477,10 @@ async def process_edit_value_text(message: Message, state: FSMContext, db: Datab
     # Обновляем в БД
     await db.update_application(app_id, **{field_name: message.text})
     
-    # Получаем обновленную заявку
-    app = await db.get_application(app_id)
     customer = await db.get_user(message.from_user.id)
     
-    # Обновляем сообщение в канале
-    if app and app.get('message_id'):
-        try:
-            app_text = format_application_for_channel_from_db(app, customer)
-            await bot.edit_message_text(
-                chat_id=Config.CHAT_ID,
-                message_id=app['message_id'],
-                text=app_text,
-                reply_markup=get_application_keyboard(app_id, app['is_closed'])
-            )
-        except Exception as e:
-            print(f"Ошибка обновления сообщения в канале: {e}")
+    # Обновляем публикацию в канале
+    await update_channel_post(db, app_id, customer)
     
     # Получаем обновленные данные из state
     updated_data = await state.get_data()
@@ -516,7 +496,7 @@ async def process_edit_value_text(message: Message, state: FSMContext, db: Datab
     await state.set_state(ApplicationStates.confirm)
 
 @router.callback_query(ApplicationStates.edit_value, F.data.startswith("cat_"))
-async def process_edit_category(callback: CallbackQuery, state: FSMContext, db: Database, bot: Bot):
+async def process_edit_category(callback: CallbackQuery, state: FSMContext, db: Database):
     await callback.answer()
     
     category = callback.data.replace("cat_", "")
@@ -529,22 +509,10 @@ async def process_edit_category(callback: CallbackQuery, state: FSMContext, db:
     # Обновляем в БД
     await db.update_application(app_id, category=category)
     
-    # Получаем обновленную заявку
-    app = await db.get_application(app_id)
     customer = await db.get_user(callback.from_user.id)
     
-    # Обновляем в канале
-    if app and app.get('message_id'):
-        try:
-            app_text = format_application_for_channel_from_db(app, customer)
-            await bot.edit_message_text(
-                chat_id=Config.CHAT_ID,
-                message_id=app['message_id'],
-                text=app_text,
-                reply_markup=get_application_keyboard(app_id, app['is_closed'])
-            )
-        except Exception:
-            pass
+    # Обновляем публикацию в канале
+    await update_channel_post(db, app_id, customer)
     
     # Получаем обновленные данные
     updated_data = await state.get_data()
@@ -560,7 +528,7 @@ async def process_edit_category(callback: CallbackQuery, state: FSMContext, db:
     await state.set_state(ApplicationStates.confirm)
 
 @router.callback_query(ApplicationStates.edit_value, F.data.startswith("subcat_"))
-async def process_edit_subcategory(callback: CallbackQuery, state: FSMContext, db: Database, bot: Bot):
+async def process_edit_subcategory(callback: CallbackQuery, state: FSMContext, db: Database):
     await callback.answer()
     
     subcategory = callback.data.replace("subcat_", "")
@@ -573,22 +541,10 @@ async def process_edit_subcategory(callback: CallbackQuery, state: FSMContext, d
     # Обновляем в БД
     await db.update_application(app_id, subcategory=subcategory)
     
-    # Получаем обновленную заявку
-    app = await db.get_application(app_id)
     customer = await db.get_user(callback.from_user.id)
     
-    # Обновляем в канале
-    if app and app.get('message_id'):
-        try:
-            app_text = format_application_for_channel_from_db(app, customer)
-            await bot.edit_message_text(
-                chat_id=Config.CHAT_ID,
-                message_id=app['message_id'],
-                text=app_text,
-                reply_markup=get_application_keyboard(app_id, app['is_closed'])
-            )
-        except Exception:
-            pass
+    # Обновляем публикацию в канале
+    await update_channel_post(db, app_id, customer)
     
     # Получаем обновленные данные
     updated_data = await state.get_data()
@@ -604,7 +560,7 @@ async def process_edit_subcategory(callback: CallbackQuery, state: FSMContext, d
     await state.set_state(ApplicationStates.confirm)
 
 @router.callback_query(ApplicationStates.edit_value)
-async def process_edit_value_callback(callback: CallbackQuery, state: FSMContext, db: Database, bot: Bot):
+async def process_edit_value_callback(callback: CallbackQuery, state: FSMContext, db: Database):
     await callback.answer()
     
     data = await state.get_data()
@@ -634,22 +590,10 @@ async def process_edit_value_callback(callback: CallbackQuery, state: FSMContext
         # Обновляем в БД
         await db.update_application(app_id, **{field_name: value})
         
-        # Получаем обновленную заявку
-        app = await db.get_application(app_id)
         customer = await db.get_user(callback.from_user.id)
         
-        # Обновляем в канале
-        if app and app.get('message_id'):
-            try:
-                app_text = format_application_for_channel_from_db(app, customer)
-                await bot.edit_message_text(
-                    chat_id=Config.CHAT_ID,
-                    message_id=app['message_id'],
-                    text=app_text,
-                    reply_markup=get_application_keyboard(app_id, app['is_closed'])
-                )
-            except Exception:
-                pass
+        # Обновляем публикацию в канале
+        await update_channel_post(db, app_id, customer)
         
         # Получаем обновленные данные
         updated_data = await state.get_data()
@@ -697,12 +641,8 @@ async def cancel_edit(callback: CallbackQuery, state: FSMContext, db: Database):
 async def show_my_rating_customer(callback: CallbackQuery, db: Database):
     await callback.answer()
     
-    # Пересчитываем рейтинг
-    rating = await db.calculate_simple_rating(callback.from_user.id)
-    await db.update_user(callback.from_user.id, rating=rating)
-    
-    # Получаем количество оценок
-    ratings_count = await db.get_simple_ratings_count(callback.from_user.id)
+    # Рейтинг и количество оценок поддерживаются при добавлении оценки
+    rating, ratings_count = await db.get_rating_summary(callback.from_user.id)
     
     await callback.message.answer(
         f"⭐ Ваш рейтинг: {rating}/10.0\n"
@@ -711,6 +651,24 @@ async def show_my_rating_customer(callback: CallbackQuery, db: Database):
 
 # ============== ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ ==============
 
+async def update_channel_post(db: Database, app_id: int, customer: Optional[dict] = None):
+    """Привести публикацию заявки в канале к текущей строке заявки.
+
+    Публикация уходит через outbox, и до доставки message_id заявки пуст:
+    тогда переписывается сообщение в очереди, иначе ставится редактирование.
+    """
+    app = await db.get_application(app_id)
+    if not app:
+        return
+    if customer is None:
+        customer = await db.get_user(app['customer_id'])
+    
+    await db.update_outbox_post(outgoing(
+        Config.CHAT_ID, format_application_for_channel_from_db(app, customer),
+        get_application_keyboard(app_id, is_closed=app['is_closed']),
+        ref_table='applications', ref_id=app_id
+    ))
+
 def format_application_preview(data: dict, customer: dict) -> str:
     """Форматирование превью заявки для подтверждения"""
     text = f"""
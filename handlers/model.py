@@ -1,10 +1,13 @@
 from aiogram import Router, F, Bot
 from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
-from datetime import datetime, timedelta
+import time
 
 from database.database import Database
-from utils.states import ModelApplicationStates
+from database.models import ResponseOutcome
+from utils.matching import MatchingEngine
+from utils.outbox import outgoing
+from utils.states import ModelApplicationStates, SearchStates
 from keyboards.inline import *
 from utils.texts import *
 from config import Config
@@ -17,7 +20,7 @@ router = Router()
 async def show_my_responses(callback: CallbackQuery, db: Database):
     await callback.answer()
     
-    responses = await db.get_model_responses(callback.from_user.id)
+    responses = await db.get_model_responses_with_applications(callback.from_user.id)
     
     if not responses:
         await callback.message.edit_text(
@@ -29,76 +32,67 @@ async def show_my_responses(callback: CallbackQuery, db: Database):
     text = "📋 Ваши отклики:\n\n"
     
     for resp in responses:
-        app = await db.get_application(resp['application_id'])
         status_emoji = {
             'pending': '⏳',
             'accepted': '✅',
             'rejected': '❌'
         }
         emoji = status_emoji.get(resp['status'], '⏳')
-        text += f"{emoji} {app['category']} - {app['date']} ({resp['status']})\n"
+        text += f"{emoji} {resp['app_category']} - {resp['app_date']} ({resp['status']})\n"
     
     await callback.message.edit_text(text, reply_markup=get_back_keyboard())
 
 # ============== ОТКЛИК НА ЗАЯВКУ ЗАКАЗЧИКА ==============
 
 @router.callback_query(F.data.startswith("respond_"))
-async def respond_to_application(callback: CallbackQuery, db: Database, bot: Bot):
+async def respond_to_application(callback: CallbackQuery, db: Database, user: dict):
     app_id = int(callback.data.split("_")[1])
     
     # Проверяем роль
-    user = await db.get_user(callback.from_user.id)
     if not user or user['role'] != 'model':
         await callback.answer("⚠️ Только модели могут откликаться на заявки!", show_alert=True)
         return
     
-    # Проверяем заявку
     app = await db.get_application(app_id)
-    if not app:
+    
+    # Анкета модели заказчику - в outbox вместе с откликом
+    model_profile = format_model_profile(user)
+    messages = None
+    if app:
+        messages = lambda response_id: [outgoing(
+            app['customer_id'],
+            f"📩 Новый отклик на вашу заявку!\n\n{model_profile}",
+            get_response_keyboard(response_id)
+        )]
+    
+    # Проверка заявки, дубля и лимита откликов - одна атомарная вставка
+    outcome, response_id = await db.add_response_guarded(
+        app_id, callback.from_user.id, Config.MAX_RESPONSES_MULTIPLIER, messages=messages
+    )
+    
+    if outcome == ResponseOutcome.NOT_FOUND:
         await callback.answer("❌ Заявка не найдена.", show_alert=True)
         return
     
-    if app['is_closed']:
+    if outcome == ResponseOutcome.CLOSED:
         await callback.answer(APPLICATION_CLOSED, show_alert=True)
         return
     
-    # Проверяем, не откликалась ли уже
-    exists = await db.check_response_exists(app_id, callback.from_user.id)
-    if exists:
+    if outcome == ResponseOutcome.DUPLICATE:
         await callback.answer(RESPONSE_EXISTS, show_alert=True)
         return
     
-    # Проверяем лимит откликов
-    current_responses = await db.count_responses(app_id)
-    max_responses = app['models_needed'] * Config.MAX_RESPONSES_MULTIPLIER
-    
-    if current_responses >= max_responses:
+    if outcome == ResponseOutcome.FULL:
         await callback.answer("⚠️ Достигнут лимит откликов на эту заявку.", show_alert=True)
         return
     
-    # Создаем отклик
-    response_id = await db.add_response(app_id, callback.from_user.id)
-    
-    # Отправляем анкету модели заказчику
-    model_profile = format_model_profile(user)
-    
-    try:
-        await bot.send_message(
-            chat_id=app['customer_id'],
-            text=f"📩 Новый отклик на вашу заявку!\n\n{model_profile}",
-            reply_markup=get_response_keyboard(response_id)
-        )
-        
-        # ИСПРАВЛЕНИЕ 1: Всплывающее окно при отклике
-        await callback.answer("✅ Вы откликнулись на заявку!", show_alert=True)
-        
-    except Exception as e:
-        await callback.answer(f"❌ Ошибка отправки: {e}", show_alert=True)
+    # ИСПРАВЛЕНИЕ 1: Всплывающее окно при отклике
+    await callback.answer("✅ Вы откликнулись на заявку!", show_alert=True)
 
 # ============== ПРИНЯТИЕ/ОТКЛОНЕНИЕ ОТКЛИКА ==============
 
 @router.callback_query(F.data.startswith("accept_"))
-async def accept_response(callback: CallbackQuery, db: Database, bot: Bot):
+async def accept_response(callback: CallbackQuery, db: Database):
     await callback.answer()
     
     response_id = int(callback.data.split("_")[1])
@@ -108,11 +102,7 @@ async def accept_response(callback: CallbackQuery, db: Database, bot: Bot):
         await callback.message.answer("❌ Отклик не найден.")
         return
     
-    # Обновляем статус
-    await db.update_response_status(response_id, 'accepted')
-    
     # Получаем данные
-    model = await db.get_user(response['model_id'])
     app = await db.get_application(response['application_id'])
     customer = await db.get_user(app['customer_id'])
     
@@ -129,24 +119,19 @@ async def accept_response(callback: CallbackQuery, db: Database, bot: Bot):
 После работы, пожалуйста, оцените заказчика:
     """
     
-    try:
-        await bot.send_message(
-            chat_id=response['model_id'],
-            text=customer_contacts.strip(),
-            reply_markup=get_rating_keyboard(response_id, 'customer')
-        )
-        
-        await callback.message.edit_text(
-            "✅ Отклик принят! Модель получила ваши контакты.\n\n"
-            "После работы, пожалуйста, оцените модель:",
-            reply_markup=get_rating_keyboard(response_id, 'model')
-        )
-        
-    except Exception as e:
-        await callback.message.edit_text(f"❌ Ошибка: {e}")
+    # Обновляем статус, уведомление модели с контактами - в той же транзакции
+    await db.update_response_status(response_id, 'accepted', messages=[outgoing(
+        response['model_id'], customer_contacts.strip(), get_rating_keyboard(response_id, 'customer')
+    )])
+    
+    await callback.message.edit_text(
+        "✅ Отклик принят! Модель получила ваши контакты.\n\n"
+        "После работы, пожалуйста, оцените модель:",
+        reply_markup=get_rating_keyboard(response_id, 'model')
+    )
 
 @router.callback_query(F.data.startswith("reject_"))
-async def reject_response(callback: CallbackQuery, db: Database, bot: Bot):
+async def reject_response(callback: CallbackQuery, db: Database):
     await callback.answer()
     
     response_id = int(callback.data.split("_")[1])
@@ -156,28 +141,19 @@ async def reject_response(callback: CallbackQuery, db: Database, bot: Bot):
         await callback.message.answer("❌ Отклик не найден.")
         return
     
-    # Обновляем статус
-    await db.update_response_status(response_id, 'rejected')
+    # Обновляем статус и уведомляем модель
+    await db.update_response_status(response_id, 'rejected', messages=[
+        outgoing(response['model_id'], RESPONSE_REJECTED)
+    ])
     
-    # Уведомляем модель
-    try:
-        await bot.send_message(
-            chat_id=response['model_id'],
-            text=RESPONSE_REJECTED
-        )
-        
-        await callback.message.edit_text("❌ Отклик отклонен.")
-        
-    except Exception as e:
-        await callback.message.edit_text(f"❌ Ошибка: {e}")
+    await callback.message.edit_text("❌ Отклик отклонен.")
 
 # ============== СОЗДАНИЕ ЗАЯВКИ МОДЕЛИ ==============
 
 @router.callback_query(F.data == "create_model_application")
-async def start_create_model_application(callback: CallbackQuery, state: FSMContext, db: Database):
+async def start_create_model_application(callback: CallbackQuery, state: FSMContext, db: Database, user: dict):
     await callback.answer()
     
-    user = await db.get_user(callback.from_user.id)
     if not user or user['role'] != 'model':
         await callback.message.answer(ACCESS_DENIED)
         return
@@ -200,15 +176,14 @@ async def start_create_model_application(callback: CallbackQuery, state: FSMCont
         return
     
     # Проверка лимита 1 заявка за 48 часов
-    recent_apps = await db.get_model_applications_by_model(callback.from_user.id)
+    last_app = await db.get_latest_model_application(callback.from_user.id)
     
-    if recent_apps:
-        last_app = recent_apps[0]
-        last_date = datetime.fromisoformat(last_app['created_at'])
-        time_diff = datetime.now() - last_date
+    if last_app:
+        # created_at - секунды Unix, сравниваем без разбора строк
+        elapsed = time.time() - last_app['created_at']
         
-        if time_diff < timedelta(hours=48) and not last_app['is_closed']:
-            hours_left = 48 - int(time_diff.total_seconds() / 3600)
+        if elapsed < 48 * 3600 and not last_app['is_closed']:
+            hours_left = 48 - int(elapsed / 3600)
             await callback.message.edit_text(
                 f"⚠️ Привилегированные модели могут создавать только 1 заявку за 48 часов!\n\n"
                 f"⏰ Следующую заявку можно создать через {hours_left} часов.\n\n"
@@ -309,15 +284,23 @@ async def process_model_app_note(message: Message, state: FSMContext, db: Databa
     )
 
 @router.callback_query(ModelApplicationStates.confirm, F.data == "confirm_publish")
-async def confirm_publish_model_application(callback: CallbackQuery, state: FSMContext, db: Database, bot: Bot):
+async def confirm_publish_model_application(callback: CallbackQuery, state: FSMContext, db: Database,
+                                            matching: MatchingEngine):
     await callback.answer()
     
     data = await state.get_data()
     model = await db.get_user(callback.from_user.id)
     
-    # Создаем заявку модели в БД
+    # Форматируем текст для канала
+    app_text = format_model_application_for_channel(data, model)
+    
+    # Создаем заявку модели в БД, публикация в канале уходит в outbox той же транзакцией
     app_id = await db.create_model_application(
         model_id=callback.from_user.id,
+        messages=lambda app_id: [outgoing(
+            Config.CHAT_ID, app_text, get_model_application_keyboard(app_id, is_closed=False),
+            ref_table='model_applications', ref_id=app_id
+        )],
         date=data['date'],
         district=data['district'],
         category=data['category'],
@@ -328,26 +311,15 @@ async def confirm_publish_model_application(callback: CallbackQuery, state: FSMC
         note=data.get('note')
     )
     
-    # Форматируем текст для канала
-    app_text = format_model_application_for_channel(data, model)
+    await callback.message.edit_text("✅ Заявка успешно создана и опубликована в канале!")
+    await state.clear()
     
-    # Публикуем в канал
-    try:
-        msg = await bot.send_message(
-            chat_id=Config.CHAT_ID,
-            text=app_text,
-            reply_markup=get_model_application_keyboard(app_id, is_closed=False)
-        )
-        
-        # Сохраняем message_id
-        await db.update_model_application(app_id, message_id=msg.message_id)
-        
-        await callback.message.edit_text("✅ Заявка успешно создана и опубликована в канале!")
-        await state.clear()
-        
-    except Exception as e:
-        await callback.message.edit_text(f"❌ Ошибка публикации: {e}")
-        await state.clear()
+    # Личные уведомления заказчикам района с подходящей деятельностью
+    app = await db.get_model_application(app_id)
+    await db.enqueue_messages(
+        outgoing(customer_id, f"{MATCHING_MODEL_APPLICATION}\n\n{app_text}", get_model_application_keyboard(app_id, is_closed=False))
+        for customer_id in await matching.match_customers(app)
+    )
 
 @router.callback_query(ModelApplicationStates.confirm, F.data == "confirm_edit")
 async def confirm_edit_model_application(callback: CallbackQuery, state: FSMContext):
@@ -360,10 +332,9 @@ async def confirm_edit_model_application(callback: CallbackQuery, state: FSMCont
     )
 
 @router.callback_query(ModelApplicationStates.confirm, F.data == "confirm_cancel")
-async def confirm_cancel_model_application(callback: CallbackQuery, state: FSMContext, db: Database):
+async def confirm_cancel_model_application(callback: CallbackQuery, state: FSMContext, db: Database, user: dict):
     await callback.answer()
     
-    user = await db.get_user(callback.from_user.id)
     await state.clear()
     
     sub_info = await db.get_subscription_info(callback.from_user.id)
@@ -508,48 +479,41 @@ async def cancel_edit_model(callback: CallbackQuery, state: FSMContext, db: Data
 # ============== ОТКЛИК ЗАКАЗЧИКА НА ЗАЯВКУ МОДЕЛИ ==============
 
 @router.callback_query(F.data.startswith("offer_"))
-async def offer_to_model(callback: CallbackQuery, db: Database, bot: Bot):
+async def offer_to_model(callback: CallbackQuery, db: Database, user: dict):
     app_id = int(callback.data.split("_")[1])
     
     # Проверяем роль
-    user = await db.get_user(callback.from_user.id)
     if not user or user['role'] != 'customer':
         await callback.answer("⚠️ Только заказчики могут откликаться на заявки моделей!", show_alert=True)
         return
     
-    # Проверяем заявку модели
     app = await db.get_model_application(app_id)
-    if not app:
+    
+    # ИСПРАВЛЕНИЕ 3: Полная информация о мастере модели - в outbox вместе с откликом
+    customer_profile = format_customer_profile(user)
+    messages = None
+    if app:
+        messages = lambda response_id: [outgoing(
+            app['model_id'], f"📩 На вашу заявку откликнулся мастер!\n\n{customer_profile}"
+        )]
+    
+    # Проверка заявки модели и дубля - одна атомарная вставка
+    outcome, _ = await db.add_customer_response_guarded(app_id, callback.from_user.id, messages=messages)
+    
+    if outcome == ResponseOutcome.NOT_FOUND:
         await callback.answer("❌ Заявка не найдена.", show_alert=True)
         return
     
-    if app['is_closed']:
+    if outcome == ResponseOutcome.CLOSED:
         await callback.answer("⚠️ Заявка уже закрыта.", show_alert=True)
         return
     
-    # Проверяем, не откликался ли уже
-    exists = await db.check_customer_response_exists(app_id, callback.from_user.id)
-    if exists:
+    if outcome == ResponseOutcome.DUPLICATE:
         await callback.answer("⚠️ Вы уже откликнулись на эту заявку!", show_alert=True)
         return
     
-    # Создаем отклик заказчика
-    await db.add_customer_response(app_id, callback.from_user.id)
-    
-    # ИСПРАВЛЕНИЕ 3: Отправляем полную информацию о мастере модели
-    customer_profile = format_customer_profile(user)
-    
-    try:
-        await bot.send_message(
-            chat_id=app['model_id'],
-            text=f"📩 На вашу заявку откликнулся мастер!\n\n{customer_profile}"
-        )
-        
-        # ИСПРАВЛЕНИЕ 1: Всплывающее окно при отклике
-        await callback.answer("✅ Вы откликнулись на заявку модели!", show_alert=True)
-        
-    except Exception as e:
-        await callback.answer(f"❌ Ошибка отправки: {e}", show_alert=True)
+    # ИСПРАВЛЕНИЕ 1: Всплывающее окно при отклике
+    await callback.answer("✅ Вы откликнулись на заявку модели!", show_alert=True)
 
 # ============== ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ ==============
 
@@ -648,12 +612,8 @@ async def rate_model(callback: CallbackQuery, db: Database):
     # Сохраняем оценку привязанную к отклику
     await db.add_response_rating(response_id, callback.from_user.id, model_id, rating)
     
-    # Пересчитываем рейтинг
-    new_rating = await db.calculate_simple_rating(model_id)
-    await db.update_user(model_id, rating=new_rating)
-    
-    # Количество оценок
-    count = await db.get_simple_ratings_count(model_id)
+    # Новый рейтинг уже пересчитан в той же транзакции, что и оценка
+    new_rating, count = await db.get_rating_summary(model_id)
     
     await callback.message.edit_text(
         f"✅ Спасибо за оценку!\n\n"
@@ -693,12 +653,8 @@ async def rate_customer(callback: CallbackQuery, db: Database):
     # Сохраняем оценку привязанную к отклику
     await db.add_response_rating(response_id, callback.from_user.id, customer_id, rating)
     
-    # Пересчитываем рейтинг
-    new_rating = await db.calculate_simple_rating(customer_id)
-    await db.update_user(customer_id, rating=new_rating)
-    
-    # Количество оценок
-    count = await db.get_simple_ratings_count(customer_id)
+    # Новый рейтинг уже пересчитан в той же транзакции, что и оценка
+    new_rating, count = await db.get_rating_summary(customer_id)
     
     await callback.message.edit_text(
         f"✅ Спасибо за оценку!\n\n"
@@ -735,10 +691,10 @@ async def view_category_applications(callback: CallbackQuery, db: Database):
     
     category = callback.data.replace("viewcat_", "")
     
-    # Получаем заявки по категории
-    applications = await db.get_active_applications_by_category(category)
+    # Показываем первую (самую новую) заявку категории
+    app = await db.get_adjacent_active_application(category)
     
-    if not applications:
+    if not app:
         await callback.message.edit_text(
             f"📋 В категории «{category}» пока нет активных заявок.\n\n"
             "Выберите другую категорию:",
@@ -746,79 +702,148 @@ async def view_category_applications(callback: CallbackQuery, db: Database):
         )
         return
     
-    # Показываем первую заявку
-    app = applications[0]
-    
-    text = format_application_for_model(app, 1, len(applications))
-    
-    # Сохраняем информацию о текущем просмотре в callback_data
-    from aiogram.utils.keyboard import InlineKeyboardBuilder
-    builder = InlineKeyboardBuilder()
-    builder.button(text="✅ Откликнуться", callback_data=f"respond_{app['id']}")
-    
-    # Навигация если заявок больше 1
-    if len(applications) > 1:
-        builder.button(text="➡️ Следующая", callback_data=f"nextapp_{category}_1")
+    total = await db.count_active_applications_by_category(category)
     
-    builder.button(text="🔙 Назад к категориям", callback_data="view_all_applications")
-    builder.adjust(1)
-    
-    await callback.message.edit_text(text, reply_markup=builder.as_markup())
+    await callback.message.edit_text(
+        format_application_for_model(app, 1, total),
+        reply_markup=get_application_navigation_keyboard(category, app['id'], 1, total)
+    )
 
-@router.callback_query(F.data.startswith("nextapp_"))
+@router.callback_query(F.data.startswith(("nextapp_", "prevapp_")))
 async def navigate_applications(callback: CallbackQuery, db: Database):
     """Навигация по заявкам внутри категории"""
     await callback.answer()
     
-    # Формат: nextapp_CATEGORY_INDEX или prevapp_CATEGORY_INDEX
-    parts = callback.data.split("_")
-    direction = parts[0]  # nextapp или prevapp
-    category = parts[1]
-    current_index = int(parts[2])
+    # Формат: nextapp_CATEGORY_APPID_POSITION или prevapp_CATEGORY_APPID_POSITION,
+    # где APPID - курсор (текущая заявка), POSITION - ее номер для подписи
+    direction, payload = callback.data.split("_", 1)
+    category, app_id, position = payload.rsplit("_", 2)
+    app_id, position = int(app_id), int(position)
     
-    # Получаем заявки категории
-    applications = await db.get_active_applications_by_category(category)
+    step = "next" if direction == "nextapp" else "prev"
+    total = await db.count_active_applications_by_category(category)
+    app = await db.get_adjacent_active_application(category, app_id, step)
     
-    if not applications:
+    if app:
+        position = position + 1 if step == "next" else position - 1
+    else:
+        # Дошли до края - переходим на другой конец списка
+        app = await db.get_adjacent_active_application(category, direction=step)
+        position = 1 if step == "next" else total
+    
+    if not app:
         await callback.message.edit_text(
             "❌ Заявки не найдены.",
             reply_markup=get_applications_categories_keyboard()
         )
         return
     
-    # Вычисляем новый индекс
-    if direction == "nextapp":
-        new_index = current_index + 1
-    else:  # prevapp
-        new_index = current_index - 1
+    # Номер приблизительный: между нажатиями заявки могли добавиться или закрыться
+    position = min(max(position, 1), total)
+    
+    await callback.message.edit_text(
+        format_application_for_model(app, position, total),
+        reply_markup=get_application_navigation_keyboard(category, app['id'], position, total)
+    )
+
+# ============== ПОИСК ЗАЯВОК ==============
+
+@router.callback_query(F.data == "search_applications")
+async def start_search_applications(callback: CallbackQuery, state: FSMContext):
+    """Запросить текст поиска"""
+    await callback.answer()
+    await state.set_state(SearchStates.query)
+    
+    from aiogram.utils.keyboard import InlineKeyboardBuilder
+    builder = InlineKeyboardBuilder()
+    builder.button(text="🔙 Назад к категориям", callback_data="view_all_applications")
+    
+    await callback.message.edit_text(
+        "🔎 Введите, что ищете: услугу, район, город или слова из требований.\n\n"
+        "Например: шугаринг Марьино",
+        reply_markup=builder.as_markup()
+    )
+
+@router.message(SearchStates.query)
+async def process_search_query(message: Message, state: FSMContext, db: Database):
+    """Показать первую найденную заявку"""
+    query = message.text or ""
+    # Запрос храним в FSM: в callback_data он может не поместиться
+    await state.set_state(None)
+    await state.update_data(search_query=query)
+    
+    apps, next_cursor = await db.search_applications(query, limit=1)
+    if not apps:
+        await message.answer(
+            f"🔎 По запросу «{query}» активных заявок не найдено.",
+            reply_markup=get_search_keyboard()
+        )
+        return
+    
+    await message.answer(
+        format_application_for_model(apps[0], 1),
+        reply_markup=get_search_keyboard(apps[0]['id'], 1, next_cursor is not None)
+    )
+
+@router.callback_query(F.data.startswith("searchnext_"))
+async def navigate_search_results(callback: CallbackQuery, state: FSMContext, db: Database):
+    """Следующая найденная заявка"""
+    await callback.answer()
     
-    # Проверяем границы
-    if new_index < 0:
-        new_index = len(applications) - 1
-    elif new_index >= len(applications):
-        new_index = 0
+    # Формат: searchnext_APPID_POSITION, APPID - курсор (текущая заявка)
+    app_id, position = map(int, callback.data.replace("searchnext_", "").split("_"))
+    query = (await state.get_data()).get("search_query")
+    if not query:
+        await callback.message.edit_text("🔎 Поиск устарел, начните новый.", reply_markup=get_search_keyboard())
+        return
     
-    app = applications[new_index]
-    text = format_application_for_model(app, new_index + 1, len(applications))
+    apps, next_cursor = await db.search_applications(query, limit=1, cursor=app_id)
+    if not apps:
+        await callback.message.edit_text("🔎 Больше заявок не найдено.", reply_markup=get_search_keyboard())
+        return
     
-    # Кнопки навигации
+    await callback.message.edit_text(
+        format_application_for_model(apps[0], position + 1),
+        reply_markup=get_search_keyboard(apps[0]['id'], position + 1, next_cursor is not None)
+    )
+
+def get_search_keyboard(app_id: int = None, position: int = 0, has_next: bool = False):
+    """Кнопки отклика и перехода по результатам поиска"""
+    from aiogram.utils.keyboard import InlineKeyboardBuilder
+    builder = InlineKeyboardBuilder()
+    if app_id is not None:
+        builder.button(text="✅ Откликнуться", callback_data=f"respond_{app_id}")
+    if has_next:
+        builder.button(text="➡️ Следующая", callback_data=f"searchnext_{app_id}_{position}")
+    builder.button(text="🔎 Новый поиск", callback_data="search_applications")
+    builder.button(text="🔙 Назад к категориям", callback_data="view_all_applications")
+    builder.adjust(1)
+    return builder.as_markup()
+
+def get_application_navigation_keyboard(category: str, app_id: int, position: int, total: int):
+    """Кнопки отклика и навигации по заявкам категории"""
     from aiogram.utils.keyboard import InlineKeyboardBuilder
     builder = InlineKeyboardBuilder()
-    builder.button(text="✅ Откликнуться", callback_data=f"respond_{app['id']}")
+    builder.button(text="✅ Откликнуться", callback_data=f"respond_{app_id}")
     
     # Показываем стрелки навигации только если заявок больше 1
-    if len(applications) > 1:
-        builder.button(text="⬅️ Предыдущая", callback_data=f"prevapp_{category}_{new_index}")
-        builder.button(text="➡️ Следующая", callback_data=f"nextapp_{category}_{new_index}")
+    if total > 1:
+        builder.button(text="⬅️ Предыдущая", callback_data=f"prevapp_{category}_{app_id}_{position}")
+        builder.button(text="➡️ Следующая", callback_data=f"nextapp_{category}_{app_id}_{position}")
     
     builder.button(text="🔙 Назад к категориям", callback_data="view_all_applications")
-    builder.adjust(1, 2, 1)
-    
-    await callback.message.edit_text(text, reply_markup=builder.as_markup())
+    if total > 1:
+        builder.adjust(1, 2, 1)
+    else:
+        builder.adjust(1)
+    return builder.as_markup()
 
-def format_application_for_model(app: dict, current: int, total: int) -> str:
-    """Форматирование заявки для модели"""
-    text = f"📋 Заявка {current} из {total}\n"
+def format_application_for_model(app: dict, current: int, total: int = None) -> str:
+    """Форматирование заявки для модели (без total - как результат поиска)"""
+    if total is None:
+        text = f"🔎 Результат поиска {current}\n"
+    else:
+        text = f"📋 Заявка {current} из {total}\n"
     text += f"━━━━━━━━━━━━━━━━\n\n"
     text += f"🆔 Заявка #{app['id']}\n"
     text += f"💆 Категория: {app['category']}\n"
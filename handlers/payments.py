@@ -98,11 +98,9 @@ def check_yukassa_payment(payment_id: str):
 # ============== ПОКУПКА ПОДПИСКИ МОДЕЛИ ==============
 
 @router.callback_query(F.data == "buy_subscription")
-async def process_buy_subscription(callback: CallbackQuery, db: Database):
+async def process_buy_subscription(callback: CallbackQuery, db: Database, user: dict):
     await callback.answer()
     
-    user = await db.get_user(callback.from_user.id)
-    
     if not user or user['role'] != 'model':
         await callback.answer("⚠️ Подписка доступна только для моделей!", show_alert=True)
         return
@@ -133,11 +131,9 @@ async def process_buy_subscription(callback: CallbackQuery, db: Database):
     )
 
 @router.callback_query(F.data == "proceed_payment")
-async def proceed_payment(callback: CallbackQuery, bot: Bot, db: Database):
+async def proceed_payment(callback: CallbackQuery, bot: Bot, db: Database, user: dict):
     await callback.answer()
     
-    user = await db.get_user(callback.from_user.id)
-    
     try:
         # Создаем платеж через ЮKassa
         payment = create_yukassa_payment(
@@ -228,10 +224,9 @@ async def check_payment(callback: CallbackQuery, db: Database):
         await callback.answer(f"❌ Ошибка проверки платежа: {e}", show_alert=True)
 
 @router.callback_query(F.data == "subscription_info")
-async def subscription_info(callback: CallbackQuery, db: Database):
+async def subscription_info(callback: CallbackQuery, db: Database, user: dict):
     await callback.answer()
     
-    user = await db.get_user(callback.from_user.id)
     sub_info = await db.get_subscription_info(callback.from_user.id)
     
     if sub_info['has_subscription']:
@@ -265,11 +260,9 @@ async def subscription_info(callback: CallbackQuery, db: Database):
 # ============== ПОКУПКА ПОДПИСКИ ЗАКАЗЧИКА ==============
 
 @router.callback_query(F.data == "buy_customer_subscription")
-async def process_buy_customer_subscription(callback: CallbackQuery, db: Database):
+async def process_buy_customer_subscription(callback: CallbackQuery, db: Database, user: dict):
     await callback.answer()
     
-    user = await db.get_user(callback.from_user.id)
-    
     if not user or user['role'] != 'customer':
         await callback.answer("⚠️ Эта подписка доступна только для заказчиков!", show_alert=True)
         return
@@ -302,11 +295,9 @@ async def process_buy_customer_subscription(callback: CallbackQuery, db: Databas
     )
 
 @router.callback_query(F.data == "proceed_customer_payment")
-async def proceed_customer_payment(callback: CallbackQuery, bot: Bot, db: Database):
+async def proceed_customer_payment(callback: CallbackQuery, bot: Bot, db: Database, user: dict):
     await callback.answer()
     
-    user = await db.get_user(callback.from_user.id)
-    
     try:
         # Создаем платеж через ЮKassa
         payment = create_yukassa_payment(
@@ -395,10 +386,9 @@ async def check_customer_payment(callback: CallbackQuery, db: Database):
         await callback.answer(f"❌ Ошибка проверки платежа: {e}", show_alert=True)
 
 @router.callback_query(F.data == "customer_subscription_info")
-async def customer_subscription_info(callback: CallbackQuery, db: Database):
+async def customer_subscription_info(callback: CallbackQuery, db: Database, user: dict):
     await callback.answer()
     
-    user = await db.get_user(callback.from_user.id)
     sub_info = await db.get_customer_subscription_info(callback.from_user.id)
     
     if sub_info['has_subscription']:
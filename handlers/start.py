@@ -1,6 +1,6 @@
 from aiogram import Router, F
-from aiogram.filters import CommandStart, Command
-from aiogram.types import Message, CallbackQuery
+from aiogram.filters import CommandStart, Command, ChatMemberUpdatedFilter, KICKED, MEMBER
+from aiogram.types import Message, CallbackQuery, ChatMemberUpdated
 from aiogram.fsm.context import FSMContext
 
 from database.database import Database
@@ -18,9 +18,7 @@ from utils.states import RegistrationStates
 router = Router()
 
 @router.message(CommandStart())
-async def cmd_start(message: Message, state: FSMContext, db: Database):
-    user = await db.get_user(message.from_user.id)
-    
+async def cmd_start(message: Message, state: FSMContext, db: Database, user: dict):
     # Проверяем, в процессе ли регистрации
     current_state = await state.get_state()
     if current_state and current_state.startswith("RegistrationStates"):
@@ -30,6 +28,10 @@ async def cmd_start(message: Message, state: FSMContext, db: Database):
         )
         return
     
+    # /start после блокировки - пользователь снова доступен для рассылок
+    if user and user['bot_blocked']:
+        await db.update_user(message.from_user.id, bot_blocked=False)
+
     if not user:
         await message.answer(WELCOME_MESSAGE)
         await message.answer(CHOOSE_ROLE, reply_markup=get_role_keyboard())
@@ -56,6 +58,16 @@ async def cmd_start(message: Message, state: FSMContext, db: Database):
         elif role == 'viewer':
             await message.answer(VIEWER_MENU, reply_markup=get_viewer_menu_keyboard())
 
+@router.my_chat_member(F.chat.type == "private", ChatMemberUpdatedFilter(member_status_changed=KICKED))
+async def bot_blocked(event: ChatMemberUpdated, db: Database):
+    """Пользователь заблокировал бота - исключаем его из рассылок и подбора"""
+    await db.update_user(event.from_user.id, bot_blocked=True)
+
+@router.my_chat_member(F.chat.type == "private", ChatMemberUpdatedFilter(member_status_changed=MEMBER))
+async def bot_unblocked(event: ChatMemberUpdated, db: Database):
+    """Пользователь разблокировал бота"""
+    await db.update_user(event.from_user.id, bot_blocked=False)
+
 @router.message(Command("cancel"))
 async def cmd_cancel(message: Message, state: FSMContext):
     current_state = await state.get_state()
@@ -67,9 +79,8 @@ async def cmd_cancel(message: Message, state: FSMContext):
     await message.answer("✅ Действие отменено. Отправьте /start для начала.")
 
 @router.callback_query(F.data == "back_to_menu")
-async def back_to_menu(callback: CallbackQuery, db: Database):
+async def back_to_menu(callback: CallbackQuery, db: Database, user: dict):
     await callback.answer()
-    user = await db.get_user(callback.from_user.id)
     
     if user:
         role = user['role']
@@ -93,12 +104,10 @@ async def back_to_menu(callback: CallbackQuery, db: Database):
             await callback.message.edit_text(VIEWER_MENU, reply_markup=get_viewer_menu_keyboard())
 
 @router.callback_query(F.data == "show_my_role")
-async def show_my_role(callback: CallbackQuery, db: Database):
+async def show_my_role(callback: CallbackQuery, db: Database, user: dict):
     """Показать текущую роль пользователя"""
     await callback.answer()
     
-    user = await db.get_user(callback.from_user.id)
-    
     if not user:
         await callback.message.answer("⚠️ Вы не зарегистрированы. Отправьте /start")
         return
@@ -123,12 +132,10 @@ async def show_my_role(callback: CallbackQuery, db: Database):
     )
 
 @router.callback_query(F.data == "change_role")
-async def change_role(callback: CallbackQuery, db: Database, state: FSMContext):
+async def change_role(callback: CallbackQuery, db: Database, user: dict, state: FSMContext):
     """Начать процесс смены роли"""
     await callback.answer()
     
-    user = await db.get_user(callback.from_user.id)
-    
     if not user:
         await callback.message.answer("⚠️ Вы не зарегистрированы. Отправьте /start")
         return
@@ -148,11 +155,10 @@ async def change_role(callback: CallbackQuery, db: Database, state: FSMContext):
     )
 
 @router.callback_query(F.data == "cancel_role_change")
-async def cancel_role_change(callback: CallbackQuery, db: Database):
+async def cancel_role_change(callback: CallbackQuery, db: Database, user: dict):
     """Отмена смены роли"""
     await callback.answer("Смена роли отменена")
     
-    user = await db.get_user(callback.from_user.id)
     role = user['role']
     
     if role == 'customer':
@@ -175,11 +181,10 @@ async def cancel_role_change(callback: CallbackQuery, db: Database):
         await callback.message.edit_text(VIEWER_MENU, reply_markup=get_viewer_menu_keyboard())
 
 @router.callback_query(F.data.startswith("change_to_"))
-async def process_role_change(callback: CallbackQuery, db: Database, state: FSMContext):
+async def process_role_change(callback: CallbackQuery, db: Database, user: dict, state: FSMContext):
     """Обработка смены роли"""
     await callback.answer()
     
-    user = await db.get_user(callback.from_user.id)
     current_role = user['role']
     new_role = callback.data.replace("change_to_", "")
     
@@ -270,12 +275,8 @@ async def process_role_change(callback: CallbackQuery, db: Database, state: FSMC
 async def show_my_rating(callback: CallbackQuery, db: Database):
     await callback.answer()
     
-    # Пересчитываем рейтинг
-    rating = await db.calculate_simple_rating(callback.from_user.id)
-    await db.update_user(callback.from_user.id, rating=rating)
-    
-    # Получаем количество оценок
-    ratings_count = await db.get_simple_ratings_count(callback.from_user.id)
+    # Рейтинг и количество оценок поддерживаются при добавлении оценки
+    rating, ratings_count = await db.get_rating_summary(callback.from_user.id)
     
     await callback.message.answer(
         f"⭐ Ваш рейтинг: {rating}/10.0\n"
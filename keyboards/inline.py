@@ -422,6 +422,7 @@ def get_applications_categories_keyboard() -> InlineKeyboardMarkup:
     for category in Config.SERVICE_CATEGORIES:
         builder.button(text=category, callback_data=f"viewcat_{category}")
     
+    builder.button(text="🔎 Поиск", callback_data="search_applications")
     builder.button(text="🔙 Назад", callback_data="back_to_menu")
     builder.adjust(2)
     return builder.as_markup()
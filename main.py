@@ -1,10 +1,9 @@
 import asyncio
 import logging
 import sys
+import time
 from handlers.payments import router as payments_router
 from pathlib import Path
-import aiosqlite
-from datetime import datetime
 
 # Добавляем папку bot в путь
 sys.path.insert(0, str(Path(__file__).parent / "bot"))
@@ -15,6 +14,11 @@ from aiogram.fsm.storage.memory import MemoryStorage
 from config import Config
 from database.database import Database
 from middlewares.registration_check import RegistrationCheckMiddleware
+from middlewares.identity_map import IdentityMapMiddleware
+from middlewares.rate_governor import RateGovernor
+from utils.matching import MatchingEngine
+from utils.outbox import OutboxSender
+from utils.broadcast import BroadcastEngine
 
 # Импортируем роутеры напрямую
 from handlers.start import router as start_router
@@ -31,54 +35,107 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
+# Верхняя граница сна между проверками, если ближайший срок далеко или неизвестен
+SUBSCRIPTION_CHECK_MAX_SLEEP = 86400
+
 async def check_expired_subscriptions(db: Database):
-    """Фоновая задача проверки истекших подписок"""
+    """Фоновая задача истечения подписок: спит до ближайшего end_date"""
     while True:
+        db.subscriptions_changed.clear()
+        delay = SUBSCRIPTION_CHECK_MAX_SLEEP
         try:
-            async with aiosqlite.connect(db.db_path) as conn:
-                # Находим все истекшие подписки
-                async with conn.execute("""
-                    SELECT user_id, role FROM subscriptions 
-                    WHERE is_active = 1 AND end_date < ?
-                """, (datetime.now().isoformat(),)) as cursor:
-                    expired = await cursor.fetchall()
-                
-                for user_id, role in expired:
-                    # Деактивируем подписку
-                    await conn.execute("""
-                        UPDATE subscriptions 
-                        SET is_active = 0 
-                        WHERE user_id = ? AND role = ? AND end_date < ?
-                    """, (user_id, role, datetime.now().isoformat()))
-                    
-                    # Если это модель - убираем привилегии
-                    if role == "model":
-                        await db.update_user(user_id, is_privileged=False)
-                    
-                    logger.info(f"Подписка истекла для user_id={user_id}, role={role}")
-                
-                await conn.commit()
+            expired = await db.deactivate_expired_subscriptions()
+            
+            for user_id, role in expired:
+                logger.info(f"Подписка истекла для user_id={user_id}, role={role}")
+            
+            next_expiry = await db.get_next_subscription_expiry()
+            if next_expiry:
+                # +1 секунда: end_date должен оказаться строго в прошлом
+                delay = min(delay, max(0.0, next_expiry - time.time()) + 1)
         except Exception as e:
             logger.error(f"Ошибка проверки подписок: {e}")
+            delay = 60
         
-        # Проверяем каждые 24 часа (86400 секунд)
-        await asyncio.sleep(86400)
+        # Новая подписка может истечь раньше запланированного пробуждения
+        try:
+            await asyncio.wait_for(db.subscriptions_changed.wait(), timeout=delay)
+        except asyncio.TimeoutError:
+            pass
+
+async def archive_old_applications(db: Database):
+    """Фоновая задача переноса старых заявок в архив"""
+    while True:
+        try:
+            now = int(time.time())
+            moved = await db.archive_applications(
+                closed_before=now - Config.DB_ARCHIVE_AFTER_DAYS * 86400,
+                stale_before=now - Config.DB_ARCHIVE_STALE_DAYS * 86400,
+                batch_size=Config.DB_ARCHIVE_BATCH_SIZE
+            )
+            if any(moved.values()):
+                logger.info("Перенесено в архив: " + ", ".join(f"{table}={count}" for table, count in moved.items()))
+        except Exception as e:
+            logger.error(f"Ошибка архивации заявок: {e}")
+        
+        await asyncio.sleep(Config.DB_ARCHIVE_INTERVAL)
+
+async def backfill_district_ids(db: Database):
+    """Разовое заполнение district_id у строк, сохраненных до справочника районов"""
+    try:
+        updated = await db.backfill_district_ids()
+        if any(updated.values()):
+            logger.info("Заполнены district_id: " + ", ".join(f"{table}={count}" for table, count in updated.items()))
+    except Exception as e:
+        logger.error(f"Ошибка заполнения district_id: {e}")
 
 async def main():
     # Инициализация бота и диспетчера
     bot = Bot(token=Config.TELEGRAM_TOKEN)
+    
+    # Все запросы к Telegram проходят через лимиты на чат и на бота
+    rate_governor = RateGovernor(
+        global_rate=Config.TG_GLOBAL_RATE,
+        chat_rate=Config.TG_CHAT_RATE,
+        chat_burst=Config.TG_CHAT_BURST,
+        group_rate=Config.TG_GROUP_RATE_PER_MIN / 60,
+        group_burst=Config.TG_GROUP_BURST,
+        interactive_reserve=Config.TG_INTERACTIVE_RESERVE,
+        max_retry_wait=Config.TG_MAX_RETRY_WAIT
+    )
+    bot.session.middleware(rate_governor)
     storage = MemoryStorage()
     dp = Dispatcher(storage=storage)
     
     # Инициализация БД
-    db = Database()
+    db = Database(
+        Config.DB_PATH,
+        pool_size=Config.DB_READ_POOL_SIZE,
+        pragmas=Config.DB_PRAGMAS,
+        commit_window=Config.DB_COMMIT_WINDOW_MS / 1000,
+        max_batch=Config.DB_MAX_WRITE_BATCH,
+        entitlement_ttl=Config.DB_ENTITLEMENT_NEGATIVE_TTL,
+        user_cache_size=Config.DB_USER_CACHE_SIZE,
+        user_cache_bytes=Config.DB_USER_CACHE_BYTES,
+        slow_query_threshold=Config.DB_SLOW_QUERY_MS / 1000,
+        metrics_samples=Config.DB_METRICS_SAMPLES,
+        archive_path=Config.DB_ARCHIVE_PATH or None,
+        districts_path=Config.DISTRICTS_PATH or None
+    )
     await db.init_db()
-    await db.migrate_subscriptions_add_role()
     logger.info("База данных инициализирована")
     
+    # Отчет о фактическом профиле SQLite
+    pragma_report = await db.get_pragma_report()
+    logger.info("SQLite: " + ", ".join(f"{name}={value}" for name, value in pragma_report.items()))
+    if str(pragma_report.get('journal_mode', '')).lower() != str(Config.DB_PRAGMAS.get('journal_mode', '')).lower():
+        logger.warning(f"Не удалось включить journal_mode={Config.DB_PRAGMAS.get('journal_mode')}")
+    
     # Регистрация middleware
     dp.message.middleware(RegistrationCheckMiddleware(db))
     dp.callback_query.middleware(RegistrationCheckMiddleware(db))
+    dp.message.middleware(IdentityMapMiddleware(db))
+    dp.callback_query.middleware(IdentityMapMiddleware(db))
     
     # Регистрация хендлеров
     dp.include_router(start_router)
@@ -89,12 +146,42 @@ async def main():
     dp.include_router(admin_router)
     dp.include_router(payments_router)
     
+    # Подбор адресатов для личных уведомлений о новых заявках
+    matching = MatchingEngine(db, Config.SERVICE_CATEGORIES, limit=Config.MATCH_NOTIFY_LIMIT)
+    
+    # Отправка сообщений из outbox, в том числе оставшихся с прошлого запуска
+    outbox_sender = OutboxSender(
+        db, bot,
+        rate=Config.OUTBOX_SEND_RATE,
+        batch_size=Config.OUTBOX_BATCH_SIZE,
+        max_attempts=Config.OUTBOX_MAX_ATTEMPTS,
+        base_delay=Config.OUTBOX_BASE_DELAY,
+        max_delay=Config.OUTBOX_MAX_DELAY
+    )
+    
+    # Рассылки администратора
+    broadcaster = BroadcastEngine(db, bot, rate=Config.BROADCAST_RATE, batch_size=Config.BROADCAST_BATCH_SIZE)
+    
     # Передача зависимостей
     dp['db'] = db
+    dp['matching'] = matching
+    dp['rate_governor'] = rate_governor
+    dp['broadcaster'] = broadcaster
     
     # Запускаем фоновую проверку подписок
     asyncio.create_task(check_expired_subscriptions(db))
-    logger.info("Запущена фоновая проверка подписок (каждые 24 часа)")
+    logger.info("Запущена фоновая проверка подписок (по ближайшему окончанию подписки)")
+    
+    asyncio.create_task(backfill_district_ids(db))
+    asyncio.create_task(outbox_sender.run())
+    
+    resumed = await broadcaster.resume()
+    if resumed:
+        logger.info(f"Продолжены рассылки: {resumed}")
+    
+    if Config.DB_ARCHIVE_PATH:
+        asyncio.create_task(archive_old_applications(db))
+        logger.info(f"Запущена архивация заявок в {Config.DB_ARCHIVE_PATH}")
     
     # Запуск бота
     logger.info("Бот запущен")
@@ -102,6 +189,7 @@ async def main():
         await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
     finally:
         await bot.session.close()
+        await db.close()
 
 if __name__ == '__main__':
     asyncio.run(main())
\ No newline at end of file
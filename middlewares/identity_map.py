@@ -0,0 +1,23 @@
+from typing import Callable, Dict, Any, Awaitable
+from aiogram import BaseMiddleware
+from aiogram.types import Message, CallbackQuery
+from database.database import Database
+
+class IdentityMapMiddleware(BaseMiddleware):
+    """Карта идентичности на время апдейта и пользователь в data['user']"""
+
+    def __init__(self, db: Database):
+        self.db = db
+        super().__init__()
+
+    async def __call__(
+        self,
+        handler: Callable[[Message | CallbackQuery, Dict[str, Any]], Awaitable[Any]],
+        event: Message | CallbackQuery,
+        data: Dict[str, Any]
+    ) -> Any:
+        with self.db.identity_map():
+            # Повторные get_user того же пользователя в хендлере - без запросов к БД
+            data['user'] = await self.db.get_user(event.from_user.id) if event.from_user else None
+
+            return await handler(event, data)
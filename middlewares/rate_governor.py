@@ -0,0 +1,209 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from itertools import islice
+from typing import Any, Dict, Iterator
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+
+logger = logging.getLogger(__name__)
+
+# Сколько самых давних чатов просматривать при вытеснении ведер
+EVICT_SCAN = 64
+
+# Запросы фоновых задач (outbox, рассылки) уступают ответам пользователю
+_background: ContextVar[bool] = ContextVar('background_requests', default=False)
+
+@contextmanager
+def background_requests() -> Iterator[None]:
+    """Запросы к Telegram внутри блока - фоновые (низкий приоритет)"""
+    token = _background.set(True)
+    try:
+        yield
+    finally:
+        _background.reset(token)
+
+class TokenBucket:
+    """Ведро токенов: rate токенов в секунду, не больше capacity подряд.
+
+    Скорость адаптивная: RetryAfter вдвое снижает ее и блокирует ведро
+    на указанное время, каждый успешный запрос понемногу возвращает к
+    номинальной (AIMD, как у TCP).
+    """
+
+    __slots__ = ('nominal', 'rate', 'capacity', 'tokens', 'updated', 'paused_until')
+
+    def __init__(self, rate: float, capacity: float):
+        self.nominal = rate
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float, reserve: float = 0.0) -> float:
+        """Сколько ждать токена, оставив в ведре reserve токенов"""
+        self._refill(now)
+        if now < self.paused_until:
+            return self.paused_until - now
+        missing = 1 + reserve - self.tokens
+        return missing / self.rate if missing > 0 else 0.0
+
+    def take(self):
+        self.tokens -= 1
+
+    def throttle(self, now: float, retry_after: float):
+        self.paused_until = max(self.paused_until, now + retry_after)
+        self.rate = max(self.nominal / 8, self.rate / 2)
+        self.tokens = 0.0
+
+    def recover(self):
+        if self.rate < self.nominal:
+            self.rate = min(self.nominal, self.rate + self.nominal / 20)
+
+    @property
+    def idle(self) -> bool:
+        """Ведро полно и без штрафа - его можно забыть без потери лимита"""
+        now = time.monotonic()
+        # Токены пополняются лениво - считаем их на текущий момент
+        tokens = self.tokens + (now - self.updated) * self.rate
+        return self.rate == self.nominal and tokens >= self.capacity and self.paused_until <= now
+
+class RateGovernor(BaseRequestMiddleware):
+    """Ограничение частоты запросов к Telegram на уровне сессии бота.
+
+    Каждый запрос с chat_id берет токен из общего ведра (лимит бота) и из
+    ведра чата: личные чаты - около сообщения в секунду, группы и канал
+    - 20 в минуту. Фоновые запросы (см.
+    background_requests) не трогают последние interactive_reserve токенов
+    общего ведра и пропускают вперед ответы пользователям, ждущие его.
+    RetryAfter штрафует ведро чата, и запрос повторяется, если ждать не
+    дольше max_retry_wait секунд (иначе исключение уходит вызывающему).
+    """
+
+    def __init__(self, global_rate: float = 30.0, chat_rate: float = 1.0, chat_burst: float = 3.0,
+                 group_rate: float = 20 / 60, group_burst: float = 5.0, interactive_reserve: float = 5.0,
+                 max_retry_wait: float = 10.0, max_retries: int = 2, max_chats: int = 10000):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.group_burst = group_burst
+        self.interactive_reserve = interactive_reserve
+        self.max_retry_wait = max_retry_wait
+        self.max_retries = max_retries
+        self.max_chats = max_chats
+        self._chats: "OrderedDict[Any, TokenBucket]" = OrderedDict()
+
+        # Метрики: ожидающие запросы и время ожидания по приоритетам
+        self.waiting = {'interactive': 0, 'background': 0}
+        self.requests = {'interactive': 0, 'background': 0}
+        self.wait_total = {'interactive': 0.0, 'background': 0.0}
+        self.wait_max = {'interactive': 0.0, 'background': 0.0}
+        self.retry_after = 0
+        # Ответы пользователям, которые сейчас ждут общего ведра
+        self._interactive_blocked = 0
+
+    def _chat_bucket(self, chat_id: Any) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            # Группы и каналы - отрицательный id или @username
+            group = str(chat_id).startswith(('-', '@'))
+            bucket = TokenBucket(
+                self.group_rate if group else self.chat_rate,
+                self.group_burst if group else self.chat_burst
+            )
+            self._chats[chat_id] = bucket
+            # Забываем самые давние чаты, если их ведра уже восстановились;
+            # ведра под штрафом пропускаем, просматривая не больше EVICT_SCAN
+            excess = len(self._chats) - self.max_chats
+            if excess > 0:
+                idle = [key for key, oldest in islice(self._chats.items(), EVICT_SCAN) if oldest.idle]
+                for key in idle[:excess]:
+                    del self._chats[key]
+        else:
+            self._chats.move_to_end(chat_id)
+        return bucket
+
+    async def _acquire(self, chat: TokenBucket, priority: str):
+        reserve = self.interactive_reserve if priority == 'background' else 0.0
+        started = time.monotonic()
+        blocked = False
+        self.waiting[priority] += 1
+        try:
+            while True:
+                now = time.monotonic()
+                global_delay = self.global_bucket.delay(now, reserve)
+                delay = max(global_delay, chat.delay(now))
+                if priority == 'interactive':
+                    if (global_delay > 0) != blocked:
+                        blocked = not blocked
+                        self._interactive_blocked += 1 if blocked else -1
+                elif delay <= 0 and self._interactive_blocked:
+                    # Ответы пользователям идут первыми
+                    delay = 1 / self.global_bucket.rate
+                if delay <= 0:
+                    break
+                await asyncio.sleep(delay)
+        finally:
+            self.waiting[priority] -= 1
+            if blocked:
+                self._interactive_blocked -= 1
+
+        self.global_bucket.take()
+        chat.take()
+
+        waited = time.monotonic() - started
+        self.requests[priority] += 1
+        self.wait_total[priority] += waited
+        self.wait_max[priority] = max(self.wait_max[priority], waited)
+
+    async def __call__(self, make_request: NextRequestMiddlewareType[TelegramType], bot: Bot,
+                       method: TelegramMethod[TelegramType]) -> Response[TelegramType]:
+        chat_id = getattr(method, 'chat_id', None)
+        if chat_id is None:
+            # Ответы на callback, getUpdates и т.п. не ограничиваются по чатам
+            return await make_request(bot, method)
+
+        priority = 'background' if _background.get() else 'interactive'
+        chat = self._chat_bucket(chat_id)
+        retries = 0
+        while True:
+            await self._acquire(chat, priority)
+            try:
+                response = await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                self.retry_after += 1
+                chat.throttle(time.monotonic(), e.retry_after)
+                logger.warning(f"RetryAfter {e.retry_after} с для чата {chat_id} ({type(method).__name__})")
+                if retries >= self.max_retries or e.retry_after > self.max_retry_wait:
+                    raise
+                retries += 1
+                continue
+
+            chat.recover()
+            return response
+
+    def stats(self) -> Dict[str, Any]:
+        """Глубина очереди и ожидание по приоритетам"""
+        result = {'chats': len(self._chats), 'retry_after': self.retry_after, 'global_rate': self.global_bucket.rate}
+        for priority in ('interactive', 'background'):
+            count = self.requests[priority]
+            result[priority] = {
+                'waiting': self.waiting[priority],
+                'requests': count,
+                'avg_wait_ms': self.wait_total[priority] / count * 1000 if count else 0.0,
+                'max_wait_ms': self.wait_max[priority] * 1000,
+            }
+        return result
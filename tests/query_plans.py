@@ -0,0 +1,408 @@
+"""Проверка планов запросов Database.
+
+Запуск: python -m tests.query_plans [--update]; в pytest - test_query_plans.py
+
+Создает временную БД, заполняет ее данными, вызывает каждый публичный
+метод Database и перехватывает все выполненные SQL-запросы через
+trace callback соединений. Для каждого запроса выполняется
+EXPLAIN QUERY PLAN. Проверка падает (код выхода 1), если:
+  - запрос полностью сканирует большую таблицу (SCAN вместо SEARCH по индексу);
+  - какой-то публичный метод Database не вызван сценарием.
+
+Планы сравниваются с сохраненными в query_plans.txt, разница печатается
+как diff. --update перезаписывает сохраненные планы.
+"""
+import asyncio
+import difflib
+import inspect
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Tuple
+
+from database.database import Database
+from database.models import OutboxMessage
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'query_plans.txt')
+DISTRICTS_PATH = os.path.join(os.path.dirname(__file__), os.pardir, 'database', 'districts.json')
+
+# Таблицы, которые растут с числом пользователей: полный проход по ним недопустим
+LARGE_TABLES = {
+    'users', 'applications', 'model_applications', 'responses',
+    'customer_responses', 'ratings', 'subscriptions',
+}
+
+# Осознанные полные проходы: (метод, таблица) -> причина
+ALLOWED_SCANS: Dict[Tuple[str, str], str] = {
+    ('get_all_active_applications', 'applications'):
+        "возвращает все открытые заявки; проход только по частичному индексу открытых",
+}
+
+# Методы, которые вызываются при подготовке БД, а не сценарием
+SETUP_METHODS = {'open', 'close', 'init_db'}
+
+# Объем тестовых данных
+SEED_USERS = 2000
+SEED_APPLICATIONS = 5000
+SEED_MODEL_APPLICATIONS = 3000
+SEED_RESPONSES_PER_APPLICATION = 4
+SEED_RATINGS = 10000
+SEED_SUBSCRIPTIONS = 3000
+CATEGORIES = ('hair', 'nails', 'makeup', 'cosmetology')
+
+_SQL_KEYWORDS = {
+    'WHERE', 'JOIN', 'LEFT', 'INNER', 'CROSS', 'ON', 'USING', 'ORDER', 'GROUP',
+    'LIMIT', 'SET', 'VALUES', 'SELECT', 'AS', 'AND', 'OR', 'DEFAULT',
+}
+_TABLE_REF = re.compile(r'\b(?:FROM|JOIN|UPDATE|INTO)\s+(?:\w+\.)?(\w+)(?:\s+(?:AS\s+)?(\w+))?', re.IGNORECASE)
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+# Служебные запросы FTS5 к теневым таблицам: 'main'.'applications_fts_config'
+_INTERNAL = re.compile(r"'\w+'\.'\w+'")
+
+# ============== ТЕСТОВЫЕ ДАННЫЕ ==============
+
+async def _seed(db: Database):
+    """Заполнить БД объемом, при котором полный проход заметен"""
+    now = int(time.time())
+    models = range(1, SEED_USERS // 2 + 1)
+    customers = range(SEED_USERS // 2 + 1, SEED_USERS + 1)
+
+    async with db.write() as conn:
+        await conn.executemany(
+            "INSERT INTO users (user_id, username, role, registration_date) VALUES (?, ?, ?, ?)",
+            [(i, f"user{i}", 'model' if i in models else 'customer', now) for i in range(1, SEED_USERS + 1)]
+        )
+        await conn.executemany("""
+            INSERT INTO applications (customer_id, category, subcategory, city, district, date, time,
+                duration, models_needed, participation_type, is_closed, created_at)
+            VALUES (?, ?, 'sub', 'city', 'district', '01.01', '10:00', '1h', 2, 'free', ?, ?)
+        """, [
+            (customers[i % len(customers)], CATEGORIES[i % len(CATEGORIES)], int(i % 3 == 0), now - i)
+            for i in range(SEED_APPLICATIONS)
+        ])
+        await conn.executemany("""
+            INSERT INTO model_applications (model_id, date, district, category, zones, time_range,
+                participation_type, created_at)
+            VALUES (?, '01.01', 'district', ?, 'zones', '10-18', 'free', ?)
+        """, [
+            (models[i % len(models)], CATEGORIES[i % len(CATEGORIES)], now - i)
+            for i in range(SEED_MODEL_APPLICATIONS)
+        ])
+        await conn.executemany(
+            "INSERT INTO responses (application_id, model_id, created_at) VALUES (?, ?, ?)",
+            [
+                (app_id, models[(app_id * 7 + k) % len(models)], now - app_id)
+                for app_id in range(1, SEED_APPLICATIONS + 1)
+                for k in range(SEED_RESPONSES_PER_APPLICATION)
+            ]
+        )
+        await conn.executemany(
+            "INSERT INTO customer_responses (model_application_id, customer_id, created_at) VALUES (?, ?, ?)",
+            [(app_id, customers[app_id % len(customers)], now - app_id)
+             for app_id in range(1, SEED_MODEL_APPLICATIONS + 1)]
+        )
+        await conn.executemany(
+            "INSERT INTO ratings (application_id, rater_id, rated_id, came, prepared, created_at) "
+            "VALUES (?, ?, ?, 1, 1, ?)",
+            [(i % SEED_APPLICATIONS + 1, customers[i % len(customers)], models[i % len(models)], now - i)
+             for i in range(SEED_RATINGS)]
+        )
+        await conn.executemany(
+            "INSERT INTO subscriptions (user_id, start_date, end_date, is_active, payment_id, role) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [(i % SEED_USERS + 1, now - 86400, now + (i - SEED_SUBSCRIPTIONS // 2) * 60, 1, f"pay{i}",
+              'model' if i % SEED_USERS + 1 in models else 'customer')
+             for i in range(SEED_SUBSCRIPTIONS)]
+        )
+
+# ============== СЦЕНАРИЙ ==============
+
+class _Recorder:
+    """Запросы, выполненные во время каждого вызова метода Database"""
+
+    def __init__(self, db: Database):
+        self.db = db
+        self.statements: List[str] = []
+        self.by_method: Dict[str, List[str]] = {}
+
+    def trace(self, sql: str):
+        self.statements.append(sql)
+
+    async def call(self, method: str, *args, **kwargs) -> Any:
+        start = len(self.statements)
+        result = await getattr(self.db, method)(*args, **kwargs)
+        self.by_method.setdefault(method, []).extend(self.statements[start:])
+        return result
+
+async def _run_scenario(rec: _Recorder):
+    """Вызвать каждый публичный метод Database на заполненной БД"""
+    model_id, customer_id = 1, SEED_USERS
+    new_model, new_customer = SEED_USERS + 1, SEED_USERS + 2
+
+    await rec.call('get_pragma_report')
+
+    # Пользователи
+    await rec.call('add_user', new_model, 'new_model', 'model')
+    await rec.call('add_user', new_customer, 'new_customer', 'customer')
+    await rec.call('get_user', model_id)
+    await rec.call('get_users_by_ids', range(1, 50))
+    await rec.call('update_user', model_id, full_name='Model')
+    await rec.call('get_user_role', model_id)
+    await rec.call('block_user', customer_id)
+    await rec.call('unblock_user', customer_id)
+    await rec.call('set_privileged', model_id, True)
+
+    # Заявки заказчиков
+    app_id = await rec.call(
+        'create_application', new_customer, category=CATEGORIES[0], subcategory='sub', city='city',
+        district='district', date='01.01', time='10:00', duration='1h', models_needed=1,
+        participation_type='free'
+    )
+    await rec.call('get_application', app_id)
+    await rec.call('update_application', app_id, comment='comment')
+    await rec.call('get_customer_applications', customer_id)
+    await rec.call('get_all_active_applications')
+    await rec.call('get_active_applications_by_category', CATEGORIES[1])
+    await rec.call('count_active_applications_by_category', CATEGORIES[1])
+    await rec.call('get_adjacent_active_application', CATEGORIES[1])
+    await rec.call('get_adjacent_active_application', CATEGORIES[1], 2, 'next')
+    await rec.call('get_adjacent_active_application', CATEGORIES[1], 2, 'prev')
+    _, cursor = await rec.call('search_applications', 'city distr', 5)
+    await rec.call('search_applications', 'city distr', 5, cursor)
+
+    # Заявки моделей
+    model_app_id = await rec.call(
+        'create_model_application', new_model, date='01.01', district='district',
+        category=CATEGORIES[0], zones='zones', time_range='10-18', participation_type='free'
+    )
+    await rec.call('get_model_application', model_app_id)
+    await rec.call('update_model_application', model_app_id, note='note')
+    await rec.call('get_model_applications_by_model', model_id)
+    await rec.call('get_latest_model_application', model_id)
+
+    # Отклики моделей
+    response_id = await rec.call('add_response', 2, new_model)
+    await rec.call('add_response_guarded', app_id, new_model, 2)
+    await rec.call('check_response_exists', 2, new_model)
+    await rec.call('get_response', response_id)
+    await rec.call('update_response_status', response_id, 'accepted')
+    await rec.call('get_application_responses', 2)
+    await rec.call('get_model_responses', model_id)
+    await rec.call('get_application_responses_with_models', 2)
+    await rec.call('get_model_responses_with_applications', model_id)
+    await rec.call('count_responses', 2)
+
+    # Отклики заказчиков
+    await rec.call('add_customer_response', 2, new_customer)
+    await rec.call('add_customer_response_guarded', model_app_id, new_customer)
+    await rec.call('check_customer_response_exists', 2, new_customer)
+    await rec.call('get_model_application_responses', 2)
+    await rec.call('get_model_application_responses_with_customers', 2)
+
+    # Рейтинги
+    await rec.call('add_rating', application_id=2, rater_id=new_customer, rated_id=model_id, came=1)
+    await rec.call('calculate_rating', model_id)
+    await rec.call('get_rating_summary', model_id)
+    await rec.call('add_simple_rating', new_customer, model_id, 8)
+    await rec.call('check_simple_rating_exists', new_customer, model_id)
+    await rec.call('calculate_simple_rating', model_id)
+    await rec.call('get_simple_ratings_count', model_id)
+    await rec.call('add_response_rating', response_id, new_customer, new_model, 9)
+    await rec.call('check_response_rating_exists', response_id, new_customer)
+
+    # Подписки
+    subscription_id = await rec.call('add_subscription', new_model, 30, 'payment')
+    await rec.call('get_active_subscription', model_id, 'model')
+    await rec.call('get_active_subscription', model_id)
+    await rec.call('check_subscription_expired', model_id)
+    await rec.call('get_subscription_info', model_id)
+    await rec.call('get_customer_subscription_info', customer_id)
+    await rec.call('check_customer_subscription', customer_id)
+    await rec.call('check_trial_used', new_customer, 'customer')
+    await rec.call('activate_trial_subscription', new_customer, 'customer')
+    await rec.call('deactivate_subscription', subscription_id)
+    await rec.call('deactivate_expired_subscriptions')
+    await rec.call('get_next_subscription_expiry')
+
+    # Районы: сид записан без district_id, заполняем и фильтруем по индексу
+    await rec.call('backfill_district_ids', 1000)
+    await rec.call('get_active_applications_by_district', 207)
+    await rec.call('get_models_by_district', 207)
+    await rec.call('get_match_profiles')
+
+    # Outbox: очередь, отправка, повтор и отказ
+    await rec.call('enqueue_messages', [OutboxMessage(customer_id, 'a'), OutboxMessage(model_id, 'b', None, 'applications', app_id)])
+    await rec.call('get_next_outbox_attempt')
+    entries = await rec.call('get_due_outbox', int(time.time()), 50)
+    await rec.call('retry_outbox', entries[0]['id'], int(time.time()) + 60, 'timeout')
+    await rec.call('fail_outbox', entries[0]['id'], 'blocked')
+    await rec.call('complete_outbox', entries[1], 123)
+    # Правка отправленной публикации - редактирование; правка во время
+    # его отправки оставляет редактирование в очереди
+    await rec.call('update_outbox_post', OutboxMessage(model_id, 'b2', None, 'applications', app_id))
+    edits = await rec.call('get_due_outbox', int(time.time()), 50)
+    await rec.call('update_outbox_post', OutboxMessage(model_id, 'b3', None, 'applications', app_id))
+    await rec.call('complete_outbox', edits[0], 123)
+    await rec.call('get_outbox_stats')
+
+    # Рассылки: курсор по user_id с фильтром роли и без него
+    broadcast_id = await rec.call('create_broadcast', 'text', 'model', model_id)
+    await rec.call('get_broadcast', broadcast_id)
+    await rec.call('get_running_broadcasts')
+    await rec.call('get_recent_broadcasts')
+    await rec.call('get_broadcast_recipients', 'model', 0, 100)
+    await rec.call('get_broadcast_recipients', None, 0, 100)
+    await rec.call('checkpoint_broadcast', broadcast_id, 100, 99, 0, [model_id])
+    await rec.call('finish_broadcast', broadcast_id)
+
+    # Архив: старейшие заявки уходят в архив, чтение истории идет из обеих схем
+    now = int(time.time())
+    await rec.call('archive_applications', now - SEED_APPLICATIONS // 2, now - SEED_APPLICATIONS * 9 // 10, 100)
+    await rec.call('get_application', SEED_APPLICATIONS)
+    await rec.call('get_customer_applications', customer_id)
+    await rec.call('get_model_responses_with_applications', model_id)
+
+    # Закрытие и удаление - в конце, чтобы не мешать остальным вызовам
+    await rec.call('close_application', app_id)
+    await rec.call('delete_user_keep_subscription', new_customer)
+    await rec.call('delete_user', new_model)
+
+# ============== ПЛАНЫ ==============
+
+def _normalize(sql: str) -> str:
+    """Текст запроса без значений параметров и лишних пробелов"""
+    sql = ' '.join(_LITERAL.sub('?', sql).split())
+    # Списки IN разной длины - один и тот же запрос
+    return re.sub(r'IN \(\?(?:, \?)*\)', 'IN (?, ...)', sql)
+
+def _is_query(sql: str) -> bool:
+    if _INTERNAL.search(sql):
+        return False
+    return sql.lstrip().split(None, 1)[0].upper() in ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH')
+
+def _explain(conn: sqlite3.Connection, sql: str) -> List[str]:
+    """EXPLAIN QUERY PLAN в виде дерева с отступами"""
+    depth = {0: -1}
+    lines = []
+    for node_id, parent, _, detail in conn.execute(f"EXPLAIN QUERY PLAN {sql}"):
+        depth[node_id] = depth.get(parent, -1) + 1
+        lines.append('  ' * depth[node_id] + detail)
+    return lines
+
+def _tables(sql: str) -> Dict[str, str]:
+    """Псевдоним или имя таблицы -> имя таблицы"""
+    names = {}
+    for table, alias in _TABLE_REF.findall(sql):
+        names[table] = table
+        if alias and alias.upper() not in _SQL_KEYWORDS:
+            names[alias] = table
+    return names
+
+def _full_scans(sql: str, plan: List[str]) -> List[str]:
+    """Большие таблицы, которые план проходит целиком"""
+    names = _tables(sql)
+    scans = []
+    for line in plan:
+        match = re.match(r'\s*SCAN (?:\w+\.)?(\w+)', line)
+        if match and names.get(match.group(1), match.group(1)) in LARGE_TABLES:
+            scans.append(names.get(match.group(1), match.group(1)))
+    return scans
+
+def _public_methods() -> List[str]:
+    return sorted(
+        name for name, member in vars(Database).items()
+        if not name.startswith('_') and inspect.iscoroutinefunction(member)
+    )
+
+async def collect_plans(path: str) -> Tuple[Dict[str, List[Tuple[str, List[str]]]], List[str]]:
+    """Планы всех запросов по методам и список методов без вызова в сценарии"""
+    archive_path = f"{path}.archive"
+    db = Database(path, pragmas={'journal_mode': 'WAL'}, archive_path=archive_path,
+                  districts_path=DISTRICTS_PATH, slow_query_threshold=60)
+    try:
+        await db.init_db()
+        await _seed(db)
+
+        rec = _Recorder(db)
+        for conn in db._connections:
+            await conn.set_trace_callback(rec.trace)
+        await _run_scenario(rec)
+    finally:
+        await db.close()
+
+    conn = sqlite3.connect(path)
+    conn.execute("ATTACH DATABASE ? AS archive", (archive_path,))
+    try:
+        plans = {}
+        for method, statements in sorted(rec.by_method.items()):
+            seen = set()
+            for sql in statements:
+                key = _normalize(sql)
+                if not _is_query(sql) or key in seen:
+                    continue
+                seen.add(key)
+                plans.setdefault(method, []).append((key, _explain(conn, sql)))
+    finally:
+        conn.close()
+
+    missing = [name for name in _public_methods() if name not in rec.by_method and name not in SETUP_METHODS]
+    return plans, missing
+
+def format_plans(plans: Dict[str, List[Tuple[str, List[str]]]]) -> List[str]:
+    lines = []
+    for method, queries in plans.items():
+        lines.append(f"## {method}")
+        for sql, plan in queries:
+            lines.append(sql)
+            lines.extend(f"    {line}" for line in plan)
+        lines.append("")
+    return lines
+
+def find_failures(plans: Dict[str, List[Tuple[str, List[str]]]], missing: List[str]) -> List[str]:
+    """Полные проходы по большим таблицам и методы без вызова в сценарии"""
+    failures = []
+    for method, queries in plans.items():
+        for sql, plan in queries:
+            for table in _full_scans(sql, plan):
+                if (method, table) not in ALLOWED_SCANS:
+                    failures.append(f"Database.{method}: полный проход по {table}\n  {sql}\n" +
+                                    "\n".join(f"    {line}" for line in plan))
+    for method in missing:
+        failures.append(f"Database.{method}: не вызывается сценарием, запросы не проверены")
+    return failures
+
+def load_baseline() -> List[str]:
+    if not os.path.exists(BASELINE_PATH):
+        return []
+    with open(BASELINE_PATH, encoding='utf-8') as f:
+        return f.read().splitlines()
+
+def main(argv: List[str]) -> int:
+    with tempfile.TemporaryDirectory() as tmp:
+        plans, missing = asyncio.run(collect_plans(os.path.join(tmp, 'plans.db')))
+
+    failures = find_failures(plans, missing)
+    current = format_plans(plans)
+    baseline = load_baseline()
+
+    diff = list(difflib.unified_diff(baseline, current, 'query_plans.txt', 'текущие планы', lineterm=''))
+    if diff:
+        print("\n".join(diff))
+
+    if '--update' in argv:
+        with open(BASELINE_PATH, 'w', encoding='utf-8') as f:
+            f.write("\n".join(current) + "\n")
+        print(f"Планы сохранены в {BASELINE_PATH}")
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+
+    total = sum(len(queries) for queries in plans.values())
+    print(f"Проверено запросов: {total}, методов: {len(plans)}, ошибок: {len(failures)}")
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
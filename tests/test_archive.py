@@ -0,0 +1,43 @@
+import asyncio
+import time
+
+from database.database import Database
+
+DAY = 86400
+
+
+def test_archive_moves_every_batch(tmp_path):
+    async def main():
+        db = Database(str(tmp_path / 'bot.db'), pragmas={'journal_mode': 'WAL'},
+                      archive_path=str(tmp_path / 'archive.db'))
+        await db.init_db()
+        try:
+            await db.add_user(1, 'customer', 'customer')
+            await db.add_user(2, 'model', 'model')
+            for _ in range(5):
+                app_id = await db.create_application(
+                    1, category='Маникюр', subcategory='-', city='-', district='-', date='-', time='-',
+                    duration='-', models_needed=1, participation_type='-'
+                )
+                await db.add_response(app_id, 2)
+                model_app_id = await db.create_model_application(
+                    2, date='-', district='-', category='Маникюр', zones='-', time_range='-', participation_type='-'
+                )
+                await db.add_customer_response(model_app_id, 1)
+            async with db.write() as conn:
+                for table in ('applications', 'model_applications'):
+                    await conn.execute(f"UPDATE {table} SET created_at = created_at - 100 * {DAY}, is_closed = 1")
+
+            closed_before = int(time.time()) - 90 * DAY
+            moved = await db.archive_applications(closed_before, None, batch_size=2)
+            again = await db.archive_applications(closed_before, None, batch_size=2)
+            history = await db.get_customer_applications(1)
+            return moved, again, len(history)
+        finally:
+            await db.close()
+
+    moved, again, history = asyncio.run(main())
+    assert moved == {'applications': 5, 'responses': 5, 'model_applications': 5, 'customer_responses': 5}
+    assert sum(again.values()) == 0
+    # История читается вместе с архивом
+    assert history == 5
@@ -0,0 +1,134 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+from database import cache
+from database.cache import EntitlementCache, LRUCache
+from database.database import Database
+
+
+def test_entitlement_put_ignores_stale_version():
+    entitlements = EntitlementCache()
+    subscription = {'end_date': 2_000_000_000}
+
+    # Запрос начат до сброса - его результат устарел
+    version = entitlements.version
+    entitlements.invalidate(1, 'model')
+    entitlements.put(1, 'model', subscription, version)
+    assert entitlements.get(1, 'model') == (False, None, None)
+
+    entitlements.put(1, 'model', subscription, entitlements.version)
+    assert entitlements.get(1, 'model') == (True, subscription, 2_000_000_000)
+
+
+def test_entitlement_invalidate_user():
+    entitlements = EntitlementCache()
+    for user_id, role in ((1, 'model'), (1, 'customer'), (2, 'model')):
+        entitlements.put(user_id, role, None, entitlements.version)
+
+    entitlements.invalidate(1)
+    assert not entitlements.get(1, 'model')[0]
+    assert not entitlements.get(1, 'customer')[0]
+    assert entitlements.get(2, 'model')[0]
+
+
+def test_entitlement_expiry(monkeypatch):
+    clock = {'monotonic': 100.0, 'time': 1_000.0}
+    monkeypatch.setattr(cache.time, 'monotonic', lambda: clock['monotonic'])
+    monkeypatch.setattr(cache.time, 'time', lambda: clock['time'])
+
+    entitlements = EntitlementCache(negative_ttl=60)
+    entitlements.put(1, 'model', None, entitlements.version)
+    entitlements.put(2, 'model', {'end_date': 1_500}, entitlements.version)
+
+    clock['monotonic'] += 61
+    clock['time'] = 1_500
+    # Отсутствие подписки живет negative_ttl, подписка - до end_date
+    assert not entitlements.get(1, 'model')[0]
+    assert not entitlements.get(2, 'model')[0]
+
+
+def test_subscription_write_invalidates_entitlement(tmp_path):
+    async def main():
+        db = Database(str(tmp_path / 'bot.db'), pragmas={'journal_mode': 'WAL'})
+        await db.init_db()
+        try:
+            await db.add_user(1, 'customer', 'customer')
+            before = await db.check_customer_subscription(1)
+            await db.activate_trial_subscription(1, 'customer')
+            return before, await db.check_customer_subscription(1)
+        finally:
+            await db.close()
+
+    assert asyncio.run(main()) == (False, True)
+
+
+def test_lru_put_ignores_stale_version():
+    users = LRUCache()
+    version = users.version
+    users.invalidate(1)
+    users.put(1, {'user_id': 1}, version)
+    assert users.get(1) is None
+
+    users.put(1, {'user_id': 1}, users.version)
+    assert users.get(1) == {'user_id': 1}
+
+
+def test_lru_eviction():
+    users = LRUCache(max_entries=2)
+    for user_id in (1, 2):
+        users.put(user_id, {'user_id': user_id}, users.version)
+    users.get(1)
+    users.put(3, {'user_id': 3}, users.version)
+    # Вытеснена давно не использованная запись
+    assert users.get(2) is None
+    assert users.get(1) is not None and users.get(3) is not None
+
+    small = LRUCache(max_bytes=LRUCache._sizeof({'text': 'x' * 100}) * 2)
+    for user_id in range(5):
+        small.put(user_id, {'text': 'x' * 100}, small.version)
+    assert small.stats()['entries'] == 2
+    assert small.stats()['bytes'] <= small.max_bytes
+
+
+def test_lru_invalidate_notifies_subscribers():
+    users = LRUCache()
+    events = []
+    users.subscribe(events.append)
+    users.put(1, {'user_id': 1}, users.version)
+    users.put(2, {'user_id': 2}, users.version)
+
+    users.invalidate(1)
+    users.invalidate()
+    assert events == [(1,), ()]
+    assert users.get(2) is None
+
+
+def test_user_row_read_during_write_is_not_cached(tmp_path):
+    async def main():
+        db = Database(str(tmp_path / 'bot.db'), pragmas={'journal_mode': 'WAL'})
+        await db.init_db()
+        try:
+            await db.add_user(1, 'model', 'model')
+            original = db.read
+
+            @asynccontextmanager
+            async def racing_read():
+                async with original() as conn:
+                    # Писатель закоммитил изменение, пока шло чтение
+                    db.user_cache.invalidate(1)
+                    yield conn
+
+            db.read = racing_read
+            await db.get_user(1)
+            db.read = original
+            stale = db.user_cache.get(1)
+
+            await db.get_user(1)
+            await db.update_user(1, username='renamed')
+            return stale, (await db.get_user(1))['username']
+        finally:
+            await db.close()
+
+    stale, username = asyncio.run(main())
+    assert stale is None
+    assert username == 'renamed'
@@ -0,0 +1,71 @@
+import asyncio
+
+from database.database import Database
+from database.models import ResponseOutcome
+
+
+def run(tmp_path, scenario):
+    async def main():
+        db = Database(str(tmp_path / 'bot.db'), pragmas={'journal_mode': 'WAL'}, commit_window=0.05)
+        await db.init_db()
+        try:
+            await db.add_user(1, 'customer', 'customer')
+            await db.add_user(2, 'model', 'model')
+            return await scenario(db)
+        finally:
+            await db.close()
+
+    return asyncio.run(main())
+
+
+async def create_application(db, models_needed=1):
+    app_id = await db.create_application(
+        1, category='Маникюр', subcategory='-', city='-', district='-', date='-', time='-',
+        duration='-', models_needed=models_needed, participation_type='-'
+    )
+    model_app_id = await db.create_model_application(
+        2, date='-', district='-', category='Маникюр', zones='-', time_range='-', participation_type='-'
+    )
+    return app_id, model_app_id
+
+
+def test_concurrent_responses_respect_limit(tmp_path):
+    async def scenario(db):
+        for model_id in range(100, 110):
+            await db.add_user(model_id, f'model{model_id}', 'model')
+        app_id, _ = await create_application(db, models_needed=1)
+
+        # Одновременные клики десяти моделей и повторный клик одной из них
+        results = await asyncio.gather(
+            *(db.add_response_guarded(app_id, model_id, 3) for model_id in range(100, 110)),
+            db.add_response_guarded(app_id, 100, 3),
+        )
+        return [outcome for outcome, _ in results], len(await db.get_application_responses_with_models(app_id))
+
+    outcomes, count = run(tmp_path, scenario)
+    assert outcomes.count(ResponseOutcome.CREATED) == 3
+    assert outcomes.count(ResponseOutcome.FULL) == 7
+    assert outcomes[-1] == ResponseOutcome.DUPLICATE
+    assert count == 3
+
+
+def test_response_outcomes(tmp_path):
+    async def scenario(db):
+        app_id, model_app_id = await create_application(db)
+        created = await db.add_response_guarded(app_id, 2, 3)
+        duplicate = await db.add_response_guarded(app_id, 2, 3)
+        await db.close_application(app_id)
+        closed = await db.add_response_guarded(app_id, 3, 3)
+        missing = await db.add_response_guarded(app_id + 100, 2, 3)
+
+        customer = await db.add_customer_response_guarded(model_app_id, 1)
+        customer_duplicate = await db.add_customer_response_guarded(model_app_id, 1)
+        return created, duplicate, closed, missing, customer, customer_duplicate
+
+    created, duplicate, closed, missing, customer, customer_duplicate = run(tmp_path, scenario)
+    assert created[0] == ResponseOutcome.CREATED and created[1] is not None
+    assert duplicate == (ResponseOutcome.DUPLICATE, None)
+    assert closed == (ResponseOutcome.CLOSED, None)
+    assert missing == (ResponseOutcome.NOT_FOUND, None)
+    assert customer[0] == ResponseOutcome.CREATED
+    assert customer_duplicate == (ResponseOutcome.DUPLICATE, None)
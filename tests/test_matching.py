@@ -0,0 +1,70 @@
+import asyncio
+from datetime import date
+
+from utils.matching import MatchingEngine, application_weekday, available_weekdays
+
+
+class FakeCache:
+    def subscribe(self, listener):
+        pass
+
+
+class FakeDB:
+    def __init__(self, users):
+        self.user_cache = FakeCache()
+        self.users = users
+
+    async def get_match_profiles(self):
+        return self.users
+
+
+def model(user_id, available_days):
+    return {
+        'user_id': user_id, 'role': 'model', 'district_id': 1, 'categories': 'Маникюр',
+        'activity_type': None, 'available_days': available_days, 'rating': 5.0,
+        'is_privileged': False, 'is_blocked': False, 'bot_blocked': False,
+    }
+
+
+def test_available_weekdays():
+    assert available_weekdays("пн-пт с 10 до 18") == frozenset(range(5))
+    assert available_weekdays("С понедельника по среду") == frozenset({0, 1, 2})
+    assert available_weekdays("по субботам и воскресеньям") == frozenset({5, 6})
+    assert available_weekdays("будни после 18:00, сб") == frozenset({0, 1, 2, 3, 4, 5})
+    assert available_weekdays("пт-пн") == frozenset({4, 5, 6, 0})
+    assert available_weekdays("выходные") == frozenset({5, 6})
+    # Без ограничений или не распознано - не отсеиваем
+    assert available_weekdays("любое время") is None
+    assert available_weekdays("каждый день, кроме пт") is None
+    assert available_weekdays("пн-вс") is None
+    assert available_weekdays(None) is None
+
+
+def test_application_weekday():
+    today = date(2025, 10, 1)
+    assert application_weekday("15.10.2025", today) == 2
+    assert application_weekday("15/10/25", today) == 2
+    assert application_weekday("15.10", today) == 2
+    # Прошедшая дата без года - в следующем году
+    assert application_weekday("01.09", today) == date(2026, 9, 1).weekday()
+    assert application_weekday("31.02.2025", today) is None
+    assert application_weekday("завтра", today) is None
+
+
+def test_match_models_by_available_days():
+    db = FakeDB([model(1, "пн-пт"), model(2, "выходные"), model(3, "в любое время"), model(4, None)])
+    engine = MatchingEngine(db, ['Маникюр'])
+
+    application = {'district_id': 1, 'category': 'Маникюр', 'customer_id': 100}
+
+    async def match(date_text):
+        return await engine.match_models({**application, 'date': date_text})
+
+    async def run():
+        return await match('18.10.2025'), await match('15.10.2025'), await match('на следующей неделе')
+
+    saturday, wednesday, unknown = asyncio.run(run())
+
+    assert sorted(saturday) == [2, 3, 4]
+    assert sorted(wednesday) == [1, 3, 4]
+    assert sorted(unknown) == [1, 2, 3, 4]
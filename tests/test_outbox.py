@@ -0,0 +1,110 @@
+import asyncio
+from types import SimpleNamespace
+
+from config import Config
+from database.database import Database
+from handlers.customer import update_channel_post
+from keyboards.inline import get_application_keyboard
+from utils.outbox import OutboxSender, outgoing
+
+CHAT_ID = -100
+
+
+class FakeBot:
+    """Бот, запоминающий отправленные и отредактированные сообщения"""
+
+    def __init__(self):
+        self.sent = []
+        self.edited = []
+        self.on_send = None
+
+    async def send_message(self, chat_id, text, reply_markup=None):
+        if self.on_send is not None:
+            await self.on_send()
+        self.sent.append((chat_id, text, reply_markup))
+        return SimpleNamespace(message_id=500 + len(self.sent))
+
+    async def edit_message_text(self, chat_id, message_id, text, reply_markup=None):
+        self.edited.append((chat_id, message_id, text, reply_markup))
+
+
+async def publish(db):
+    await db.add_user(1, 'customer', 'customer')
+    return await db.create_application(
+        customer_id=1,
+        messages=lambda app_id: [outgoing(
+            CHAT_ID, 'draft', get_application_keyboard(app_id, is_closed=False),
+            ref_table='applications', ref_id=app_id
+        )],
+        category='Маникюр', subcategory='Классический', city='Москва', district='Арбат',
+        date='15.10.2025', time='12:00', duration='2 часа', models_needed=1, participation_type='Бесплатно',
+    )
+
+
+def run(tmp_path, scenario, monkeypatch):
+    monkeypatch.setattr(Config, 'CHAT_ID', CHAT_ID)
+
+    async def main():
+        db = Database(str(tmp_path / 'bot.db'), pragmas={'journal_mode': 'WAL'})
+        await db.init_db()
+        try:
+            return await scenario(db, FakeBot())
+        finally:
+            await db.close()
+
+    return asyncio.run(main())
+
+
+def test_close_before_delivery(tmp_path, monkeypatch):
+    async def scenario(db, bot):
+        app_id = await publish(db)
+        await db.close_application(app_id)
+        await update_channel_post(db, app_id)
+
+        await OutboxSender(db, bot, rate=1000)._drain()
+
+        # Ушла одна публикация, уже закрытая
+        assert len(bot.sent) == 1 and not bot.edited
+        assert bot.sent[0][2] == get_application_keyboard(app_id, is_closed=True)
+        assert (await db.get_application(app_id))['message_id'] == 501
+        assert await db.get_outbox_stats() == {'pending': 0, 'failed': 0}
+
+    run(tmp_path, scenario, monkeypatch)
+
+
+def test_close_during_delivery(tmp_path, monkeypatch):
+    async def scenario(db, bot):
+        app_id = await publish(db)
+
+        async def close():
+            bot.on_send = None
+            await db.close_application(app_id)
+            await update_channel_post(db, app_id)
+
+        bot.on_send = close
+        await OutboxSender(db, bot, rate=1000)._drain()
+
+        # Публикация ушла открытой - за ней следует редактирование
+        assert bot.sent[0][2] == get_application_keyboard(app_id, is_closed=False)
+        assert len(bot.edited) == 1
+        assert bot.edited[0][1] == 501
+        assert bot.edited[0][3] == get_application_keyboard(app_id, is_closed=True)
+        assert await db.get_outbox_stats() == {'pending': 0, 'failed': 0}
+
+    run(tmp_path, scenario, monkeypatch)
+
+
+def test_close_after_delivery(tmp_path, monkeypatch):
+    async def scenario(db, bot):
+        app_id = await publish(db)
+        sender = OutboxSender(db, bot, rate=1000)
+        await sender._drain()
+
+        await db.close_application(app_id)
+        await update_channel_post(db, app_id)
+        await sender._drain()
+
+        assert len(bot.sent) == 1
+        assert [(edit[1], edit[3]) for edit in bot.edited] == [(501, get_application_keyboard(app_id, is_closed=True))]
+
+    run(tmp_path, scenario, monkeypatch)
@@ -0,0 +1,11 @@
+import asyncio
+
+from tests import query_plans
+
+
+def test_query_plans(tmp_path):
+    plans, missing = asyncio.run(query_plans.collect_plans(str(tmp_path / 'plans.db')))
+
+    assert query_plans.find_failures(plans, missing) == []
+    # Изменившиеся планы проверяются и сохраняются: python -m tests.query_plans --update
+    assert query_plans.format_plans(plans) == query_plans.load_baseline()
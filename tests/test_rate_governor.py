@@ -0,0 +1,30 @@
+from middlewares import rate_governor
+from middlewares.rate_governor import RateGovernor
+
+
+def test_chat_buckets_are_evicted(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(rate_governor.time, 'monotonic', lambda: clock[0])
+
+    governor = RateGovernor(max_chats=100)
+    for chat_id in range(1, 1001):
+        governor._chat_bucket(chat_id).take()
+        clock[0] += 0.01
+
+    # Ведра старше нескольких секунд восстановились и должны вытесняться
+    assert len(governor._chats) <= governor.max_chats + 1
+
+
+def test_throttled_bucket_is_kept(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(rate_governor.time, 'monotonic', lambda: clock[0])
+
+    governor = RateGovernor(max_chats=10)
+    governor._chat_bucket(-1).throttle(clock[0], 3600)
+    for chat_id in range(1, 101):
+        governor._chat_bucket(chat_id).take()
+        clock[0] += 5
+
+    # Ведро под штрафом не забывается, остальные вытесняются мимо него
+    assert -1 in governor._chats
+    assert len(governor._chats) <= governor.max_chats + 1
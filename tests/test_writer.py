@@ -0,0 +1,112 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from database.database import Database
+
+
+def run(tmp_path, scenario):
+    """Сценарий над свежей БД с окном группового коммита, чтобы задания шли одной пачкой"""
+    async def main():
+        db = Database(str(tmp_path / 'bot.db'), pragmas={'journal_mode': 'WAL'}, commit_window=0.05)
+        await db.init_db()
+        await db._execute_write("CREATE TABLE items (id INTEGER PRIMARY KEY, value TEXT UNIQUE)")
+        statements = []
+        await db._writer.set_trace_callback(statements.append)
+        try:
+            return await scenario(db, statements)
+        finally:
+            await db.close()
+
+    return asyncio.run(main())
+
+
+def committed(tmp_path):
+    """Значения, видимые отдельному соединению, то есть закоммиченные"""
+    conn = sqlite3.connect(str(tmp_path / 'bot.db'))
+    try:
+        return sorted(row[0] for row in conn.execute("SELECT value FROM items"))
+    finally:
+        conn.close()
+
+
+def begins(statements):
+    return sum(sql.startswith('BEGIN') for sql in statements)
+
+
+def test_failing_job_does_not_poison_batch(tmp_path):
+    async def scenario(db, statements):
+        insert = "INSERT INTO items (value) VALUES (?)"
+        results = await asyncio.gather(
+            db._execute_write(insert, ('a',)),
+            db._execute_write(insert, ('a',)),
+            db._execute_write(insert, ('b',)),
+            return_exceptions=True,
+        )
+        return results, begins(statements)
+
+    results, batches = run(tmp_path, scenario)
+    assert isinstance(results[1], sqlite3.IntegrityError)
+    assert not isinstance(results[0], Exception) and not isinstance(results[2], Exception)
+    # Одна транзакция на все три задания, ошибка откатила только свое
+    assert batches == 1
+    assert committed(tmp_path) == ['a', 'b']
+
+
+def test_futures_resolve_after_commit(tmp_path):
+    async def scenario(db, statements):
+        order = []
+
+        async def single():
+            await db._execute_write("INSERT INTO items (value) VALUES ('a')")
+            order.append(('a', list(statements)))
+
+        async def block():
+            async with db.write() as conn:
+                await conn.execute("INSERT INTO items (value) VALUES ('b')")
+                # Пачка открыта, пока блок не завершится
+                await asyncio.sleep(0.05)
+                order.append(('b', None))
+
+        await asyncio.gather(single(), block())
+        return order, begins(statements)
+
+    order, batches = run(tmp_path, scenario)
+    assert batches == 1
+    # Первое задание получило результат только после COMMIT всей пачки
+    assert [name for name, _ in order] == ['b', 'a']
+    assert order[1][1][-1] == 'COMMIT'
+    assert committed(tmp_path) == ['a', 'b']
+
+
+def test_write_block_rolls_back_alone(tmp_path):
+    async def scenario(db, statements):
+        async def failing():
+            async with db.write() as conn:
+                await conn.execute("INSERT INTO items (value) VALUES ('lost')")
+                raise ValueError("отмена")
+
+        results = await asyncio.gather(
+            failing(),
+            db._execute_write("INSERT INTO items (value) VALUES ('kept')"),
+            return_exceptions=True,
+        )
+        return results, begins(statements)
+
+    results, batches = run(tmp_path, scenario)
+    assert isinstance(results[0], ValueError)
+    assert batches == 1
+    assert committed(tmp_path) == ['kept']
+
+
+def test_write_block_error_reaches_caller(tmp_path):
+    async def scenario(db, statements):
+        with pytest.raises(sqlite3.OperationalError):
+            async with db.write() as conn:
+                await conn.execute("INSERT INTO missing (value) VALUES (1)")
+        # Писатель продолжает работать
+        await db._execute_write("INSERT INTO items (value) VALUES ('after')")
+
+    run(tmp_path, scenario)
+    assert committed(tmp_path) == ['after']
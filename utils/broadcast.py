@@ -0,0 +1,116 @@
+import asyncio
+import contextvars
+import logging
+from typing import Dict, List, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+
+from database.database import Database
+from middlewares.rate_governor import background_requests
+
+logger = logging.getLogger(__name__)
+
+class BroadcastEngine:
+    """Рассылка сообщения администратора по пользователям.
+
+    Получатели читаются пачками по курсору user_id, после каждой пачки
+    курсор и счетчики сохраняются в broadcasts - после перезапуска
+    resume() продолжает с последней сохраненной пачки (ее часть может
+    уйти повторно). Отправка идет не быстрее rate сообщений в секунду как
+    фоновые запросы RateGovernor. Пользователи, заблокировавшие бота,
+    получают users.bot_blocked и из следующих рассылок исключаются.
+    """
+
+    def __init__(self, db: Database, bot: Bot, rate: float = 20.0, batch_size: int = 100):
+        self.db = db
+        self.bot = bot
+        self.rate = rate
+        self.batch_size = batch_size
+        self._tasks: Dict[int, asyncio.Task] = {}
+
+    async def start(self, text: str, role: Optional[str], created_by: int) -> int:
+        """Создать рассылку и запустить отправку, вернуть id"""
+        broadcast_id = await self.db.create_broadcast(text, role, created_by)
+        self._spawn(broadcast_id)
+        return broadcast_id
+
+    async def resume(self) -> List[int]:
+        """Продолжить рассылки, прерванные остановкой бота"""
+        broadcasts = await self.db.get_running_broadcasts()
+        for broadcast in broadcasts:
+            self._spawn(broadcast['id'])
+        return [broadcast['id'] for broadcast in broadcasts]
+
+    async def cancel(self, broadcast_id: int) -> bool:
+        """Отменить рассылку: отправка остановится после текущей пачки.
+
+        False - рассылка не найдена или уже завершена.
+        """
+        return await self.db.finish_broadcast(broadcast_id, 'cancelled')
+
+    def _spawn(self, broadcast_id: int):
+        if broadcast_id not in self._tasks:
+            # Пустой контекст: задача, запущенная из хендлера, не должна
+            # унаследовать его карту идентичности и приоритет запросов
+            self._tasks[broadcast_id] = asyncio.create_task(self._run(broadcast_id), context=contextvars.Context())
+
+    async def _run(self, broadcast_id: int):
+        try:
+            with background_requests():
+                await self._send_all(broadcast_id)
+        except Exception as e:
+            # Рассылка остается в статусе running и продолжится при следующем запуске
+            logger.error(f"Ошибка рассылки {broadcast_id}: {e}")
+        finally:
+            self._tasks.pop(broadcast_id, None)
+
+    async def _send_all(self, broadcast_id: int):
+        while True:
+            # Статус перечитываем перед каждой пачкой - так работает отмена
+            broadcast = await self.db.get_broadcast(broadcast_id)
+            if broadcast is None or broadcast['status'] != 'running':
+                return
+
+            user_ids = await self.db.get_broadcast_recipients(
+                broadcast['role'], broadcast['last_user_id'], self.batch_size
+            )
+            if not user_ids:
+                await self.db.finish_broadcast(broadcast_id)
+                logger.info(
+                    f"Рассылка {broadcast_id} завершена: отправлено {broadcast['sent']}, "
+                    f"ошибок {broadcast['failed']}, заблокировали бота {broadcast['blocked']}"
+                )
+                return
+
+            sent = failed = 0
+            blocked = []
+            for user_id in user_ids:
+                result = await self._send(user_id, broadcast['text'])
+                if result == 'sent':
+                    sent += 1
+                elif result == 'blocked':
+                    blocked.append(user_id)
+                else:
+                    failed += 1
+                await asyncio.sleep(1 / self.rate)
+
+            await self.db.checkpoint_broadcast(broadcast_id, user_ids[-1], sent, failed, blocked)
+
+    async def _send(self, user_id: int, text: str) -> str:
+        """Отправить одному пользователю: 'sent', 'blocked' или 'failed'"""
+        while True:
+            try:
+                await self.bot.send_message(chat_id=user_id, text=text)
+                return 'sent'
+            except TelegramRetryAfter as e:
+                # Длинную паузу RateGovernor не выжидает - ждем здесь и повторяем
+                await asyncio.sleep(e.retry_after)
+            except TelegramForbiddenError:
+                return 'blocked'
+            except TelegramBadRequest as e:
+                logger.info(f"Рассылка: не отправлено user_id={user_id}: {e}")
+                return 'failed'
+            except Exception as e:
+                logger.warning(f"Рассылка: ошибка отправки user_id={user_id}: {e}")
+                return 'failed'
@@ -0,0 +1,210 @@
+import asyncio
+import heapq
+import logging
+import re
+from datetime import date
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+from database.database import Database
+
+logger = logging.getLogger(__name__)
+
+# Ключ индекса: (роль, district_id, категория); категория None - модели
+# без истории, им подходит любая категория своего района
+IndexKey = Tuple[str, int, Optional[str]]
+
+def _activity_categories(activity_type: Optional[str], categories: Iterable[str]) -> Set[str]:
+    """Категории, упомянутые в роде деятельности заказчика ("мастер маникюра")"""
+    if not activity_type:
+        return set()
+    text = activity_type.lower().replace('ё', 'е')
+    # Основа слова без окончания: "маникюр" находит "маникюра", "маникюрный"
+    return {category for category in categories if category.lower()[:5] in text}
+
+# Дни недели (0 - понедельник): краткая форма и основа полного названия
+_WEEKDAYS = [
+    ('пн', 'понед'), ('вт', 'вторн'), ('ср', 'сред'), ('чт', 'четв'),
+    ('пт', 'пятн'), ('сб', 'суббот'), ('вс', 'воскр'),
+]
+
+def _weekday(word: str) -> Optional[int]:
+    for day, (short, stem) in enumerate(_WEEKDAYS):
+        if word == short or word.startswith(stem):
+            return day
+    return None
+
+def available_weekdays(text: Optional[str]) -> Optional[FrozenSet[int]]:
+    """Дни недели из свободного текста "удобные дни и часы" модели.
+
+    Понимает названия дней ("пн, ср", "по субботам"), диапазоны
+    ("пн-пт", "с пн по пт"), "будни" и "выходные". None - ограничений
+    нет или текст не распознан: такую модель не отсеиваем.
+    """
+    if not text:
+        return None
+    text = text.lower().replace('ё', 'е')
+    if 'кроме' in text:
+        return None
+
+    days: Set[int] = set()
+    if 'будн' in text:
+        days.update(range(5))
+    if 'выходн' in text:
+        days.update((5, 6))
+
+    previous, in_range = None, False
+    for token in re.findall(r"[а-я]+|[-–—]", text):
+        if token in ('-', '–', '—', 'по'):
+            in_range = previous is not None
+            continue
+        day = _weekday(token)
+        if day is None:
+            previous, in_range = None, False
+            continue
+        if in_range:
+            # Диапазон может переходить через воскресенье: "пт-пн"
+            days.update(range(previous, day + 1) if previous <= day else [*range(previous, 7), *range(day + 1)])
+        days.add(day)
+        previous, in_range = day, False
+
+    return frozenset(days) if days and len(days) < 7 else None
+
+def application_weekday(date_text: Optional[str], today: Optional[date] = None) -> Optional[int]:
+    """День недели даты заявки ("15.10.2025", "15.10"), None - дата не распознана"""
+    match = re.search(r"(\d{1,2})[./](\d{1,2})(?:[./](\d{2,4}))?", date_text or '')
+    if not match:
+        return None
+    day, month = int(match.group(1)), int(match.group(2))
+    today = today or date.today()
+    if match.group(3):
+        year = int(match.group(3))
+        year += 2000 if year < 100 else 0
+    else:
+        # Дата без года - ближайшая в будущем
+        year = today.year + ((month, day) < (today.month, today.day))
+    try:
+        return date(year, month, day).weekday()
+    except ValueError:
+        return None
+
+class MatchingEngine:
+    """Подбор адресатов для новой заявки по району и категории.
+
+    Заявка заказчика -> модели того же района, работавшие с этой категорией
+    (или еще без истории). Заявка модели -> заказчики того же района с этой
+    категорией в истории или роде деятельности. Заблокированные админом и
+    заблокировавшие бота пропускаются, привилегированные модели идут
+    первыми, дальше - по рейтингу. Модели, указавшие удобные дни недели,
+    получают заявку, только если ее дата приходится на один из них.
+
+    Индекс в памяти: (роль, район, категория) -> user_id. Полностью строится
+    один раз, дальше обновляется по сбросам кэша users: изменившиеся
+    пользователи перечитываются пачкой перед ближайшим подбором.
+    """
+
+    def __init__(self, db: Database, categories: List[str], limit: int = 50):
+        self.db = db
+        self.categories = list(categories)
+        self.limit = limit
+        self._index: Dict[IndexKey, Set[int]] = {}
+        # user_id -> (ключи индекса, (привилегированный, рейтинг), удобные дни недели)
+        self._profiles: Dict[int, Tuple[FrozenSet[IndexKey], Tuple[bool, float], Optional[FrozenSet[int]]]] = {}
+        self._dirty: Set[int] = set()
+        self._stale = True
+        self._lock = asyncio.Lock()
+        db.user_cache.subscribe(self._on_users_changed)
+
+    def _on_users_changed(self, user_ids: Tuple[Any, ...]):
+        if not user_ids:
+            self._stale = True
+        self._dirty.update(user_id for user_id in user_ids if user_id is not None)
+
+    def _keys(self, user: Any) -> FrozenSet[IndexKey]:
+        """Ключи индекса для строки users (пусто - пользователь не участвует в подборе)"""
+        district_id = user['district_id']
+        if not district_id or user['is_blocked'] or user['bot_blocked']:
+            return frozenset()
+
+        categories = set(filter(None, (user['categories'] or '').split(',')))
+        if user['role'] == 'model':
+            return frozenset(('model', district_id, category) for category in categories or [None])
+        if user['role'] == 'customer':
+            categories |= _activity_categories(user['activity_type'], self.categories)
+            return frozenset(('customer', district_id, category) for category in categories)
+        return frozenset()
+
+    def _remove(self, user_id: int):
+        profile = self._profiles.pop(user_id, None)
+        if profile is None:
+            return
+        for key in profile[0]:
+            users = self._index.get(key)
+            if users is not None:
+                users.discard(user_id)
+                if not users:
+                    del self._index[key]
+
+    def _put(self, user_id: int, user: Any):
+        self._remove(user_id)
+        keys = self._keys(user)
+        if not keys:
+            return
+        weekdays = available_weekdays(user['available_days']) if user['role'] == 'model' else None
+        self._profiles[user_id] = (keys, (bool(user['is_privileged']), user['rating'] or 0.0), weekdays)
+        for key in keys:
+            self._index.setdefault(key, set()).add(user_id)
+
+    async def refresh(self):
+        """Применить накопленные изменения users к индексу"""
+        async with self._lock:
+            if self._stale:
+                self._stale = False
+                self._dirty.clear()
+                self._index.clear()
+                self._profiles.clear()
+                for user in await self.db.get_match_profiles():
+                    self._put(user['user_id'], user)
+                logger.info(f"Индекс подбора построен: {len(self._profiles)} пользователей")
+
+            if self._dirty:
+                user_ids, self._dirty = self._dirty, set()
+                users = await self.db.get_users_by_ids(user_ids)
+                for user_id in user_ids:
+                    if user_id in users:
+                        self._put(user_id, users[user_id])
+                    else:
+                        self._remove(user_id)
+
+    def _top(self, candidates: Set[int], exclude: int) -> List[int]:
+        """Не больше limit адресатов в порядке приоритета"""
+        candidates.discard(exclude)
+        return heapq.nlargest(self.limit, candidates, key=lambda user_id: (self._profiles[user_id][1], -user_id))
+
+    async def match_models(self, application: Any) -> List[int]:
+        """Модели для заявки заказчика"""
+        district_id = application['district_id']
+        if not district_id:
+            return []
+        await self.refresh()
+        candidates = set(self._index.get(('model', district_id, application['category']), ()))
+        candidates |= self._index.get(('model', district_id, None), set())
+
+        weekday = application_weekday(application['date'])
+        if weekday is not None:
+            candidates = {
+                user_id for user_id in candidates
+                if self._profiles[user_id][2] is None or weekday in self._profiles[user_id][2]
+            }
+        return self._top(candidates, application['customer_id'])
+
+    async def match_customers(self, model_application: Any) -> List[int]:
+        """Заказчики для заявки модели"""
+        district_id = model_application['district_id']
+        if not district_id:
+            return []
+        await self.refresh()
+        candidates = set(self._index.get(('customer', district_id, model_application['category']), ()))
+        return self._top(candidates, model_application['model_id'])
+
+    def stats(self) -> Dict[str, int]:
+        return {'users': len(self._profiles), 'keys': len(self._index), 'dirty': len(self._dirty)}
@@ -0,0 +1,128 @@
+import asyncio
+import logging
+import random
+import time
+from typing import Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+from aiogram.types import InlineKeyboardMarkup
+
+from database.database import Database
+from database.models import OutboxEntry, OutboxMessage
+from middlewares.rate_governor import background_requests
+
+logger = logging.getLogger(__name__)
+
+# Верхняя граница сна, если очередь пуста
+OUTBOX_MAX_SLEEP = 3600
+
+def outgoing(chat_id: int, text: str, reply_markup: Optional[InlineKeyboardMarkup] = None,
+             ref_table: Optional[str] = None, ref_id: Optional[int] = None) -> OutboxMessage:
+    """Сообщение для outbox: клавиатура сохраняется в JSON"""
+    markup = reply_markup.model_dump_json(exclude_none=True) if reply_markup is not None else None
+    return OutboxMessage(chat_id, text, markup, ref_table, ref_id)
+
+class OutboxSender:
+    """Фоновая отправка сообщений из таблицы outbox.
+
+    Сообщение удаляется из outbox только после успешной отправки, поэтому
+    после перезапуска отправка продолжается с того же места (при падении
+    между отправкой и удалением сообщение уйдет повторно). Сетевые ошибки
+    и ошибки Telegram повторяются с экспоненциальной задержкой,
+    TelegramRetryAfter (короткие паузы RateGovernor выжидает сам)
+    откладывает сообщение на указанное время, а ошибки, которые
+    повтор не исправит (бот заблокирован, чат не найден), сразу
+    прекращают попытки. Сообщения с message_id - редактирование уже
+    отправленной публикации (см. Database.update_outbox_post).
+    """
+
+    def __init__(self, db: Database, bot: Bot, rate: float = 20.0, batch_size: int = 50,
+                 max_attempts: int = 8, base_delay: float = 5.0, max_delay: float = 3600.0):
+        self.db = db
+        self.bot = bot
+        self.rate = rate
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    async def run(self):
+        """Отправлять, пока есть готовые сообщения, затем спать до ближайшего срока"""
+        # Отправка outbox уступает ответам пользователям (см. RateGovernor)
+        with background_requests():
+            await self._loop()
+
+    async def _loop(self):
+        while True:
+            self.db.outbox_changed.clear()
+            delay = OUTBOX_MAX_SLEEP
+            try:
+                await self._drain()
+                next_attempt = await self.db.get_next_outbox_attempt()
+                if next_attempt is not None:
+                    delay = min(delay, max(0.0, next_attempt - time.time()))
+            except Exception as e:
+                logger.error(f"Ошибка отправки outbox: {e}")
+                delay = 60
+
+            # Новые сообщения будят задачу раньше срока
+            try:
+                await asyncio.wait_for(self.db.outbox_changed.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _drain(self):
+        while True:
+            entries = await self.db.get_due_outbox(int(time.time()), self.batch_size)
+            if not entries:
+                return
+            for entry in entries:
+                await self._send(entry)
+                await asyncio.sleep(1 / self.rate)
+
+    def _backoff(self, attempts: int) -> float:
+        """Экспоненциальная задержка со случайным разбросом"""
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+    async def _send(self, entry: OutboxEntry):
+        reply_markup = None
+        if entry['reply_markup']:
+            reply_markup = InlineKeyboardMarkup.model_validate_json(entry['reply_markup'])
+
+        try:
+            if entry['message_id'] is not None:
+                # Редактирование уже отправленной публикации
+                message_id = entry['message_id']
+                await self.bot.edit_message_text(
+                    chat_id=entry['chat_id'], message_id=message_id, text=entry['text'], reply_markup=reply_markup
+                )
+            else:
+                message = await self.bot.send_message(chat_id=entry['chat_id'], text=entry['text'], reply_markup=reply_markup)
+                message_id = message.message_id
+        except TelegramRetryAfter as e:
+            # Флуд-контроль чата: остальные сообщения очереди идут дальше,
+            # попытка не засчитывается
+            await self.db.retry_outbox(entry['id'], int(time.time()) + e.retry_after, str(e), count_attempt=False)
+        except TelegramForbiddenError as e:
+            # Пользователь заблокировал бота - отмечаем, как и рассылка
+            logger.info(f"Сообщение outbox id={entry['id']} не доставлено: {e}")
+            await self.db.fail_outbox(entry['id'], str(e))
+            await self.db.update_user(entry['chat_id'], bot_blocked=True)
+        except TelegramBadRequest as e:
+            if 'message is not modified' in str(e):
+                # Текст уже такой - редактировать нечего
+                await self.db.complete_outbox(entry, entry['message_id'])
+                return
+            logger.info(f"Сообщение outbox id={entry['id']} не доставлено: {e}")
+            await self.db.fail_outbox(entry['id'], str(e))
+        except Exception as e:
+            attempts = entry['attempts'] + 1
+            if attempts >= self.max_attempts:
+                logger.warning(f"Сообщение outbox id={entry['id']} не доставлено за {attempts} попыток: {e}")
+                await self.db.fail_outbox(entry['id'], str(e))
+            else:
+                await self.db.retry_outbox(entry['id'], int(time.time() + self._backoff(attempts)), str(e))
+        else:
+            await self.db.complete_outbox(entry, message_id)
@@ -68,6 +68,9 @@ class ModelApplicationStates(StatesGroup):
     edit_field = State()
     edit_value = State()
 
+class SearchStates(StatesGroup):
+    query = State()
+
 class RatingStates(StatesGroup):
     # Для заказчика
     customer_came = State()
@@ -109,6 +109,10 @@ VIEWER_MENU = "👀 Вы зритель - можете просматриват
 
 # Заявки
 APPLICATION_CREATED = "✅ Заявка успешно создана и опубликована в канале!"
+
+# Личные уведомления о подходящих заявках
+MATCHING_APPLICATION = "🔔 Новая заявка в вашем районе"
+MATCHING_MODEL_APPLICATION = "🔔 Модель из вашего района ищет мастера"
 APPLICATION_CATEGORY = "Выберите категорию услуги:"
 APPLICATION_SUBCATEGORY = "Выберите подкатегорию:"
 APPLICATION_CITY = "Укажите город:"